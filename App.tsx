@@ -46,6 +46,14 @@ const App: React.FC = () => {
         headers: { 'Authorization': `Bearer ${token}` }
       });
 
+      // 令牌过期 / 改过密码 / 旧版本的令牌：回到登录页
+      if (res.status === 401) {
+        setToken(null);
+        setIsAuthenticated(false);
+        localStorage.removeItem('pacc_token');
+        return;
+      }
+
       if (res.ok) {
         const data = await res.json();
         
@@ -78,8 +86,13 @@ const App: React.FC = () => {
           startDate: item.start_date ?? item.startDate ?? '',
           tag: item.tag || 'deposit',   // 默认为存款模式
           costPrice: item.cost_price ?? 0, // 用户输入市值
-          // 🔴 关键修复点 1：必须把后端传回来的 extra (明细) 存下来，否则页面怎么显示？
-          extra: item.extra || ''       
+          extra: item.extra || '',
+          // 买入明细：后端从 asset_transactions 表读出 [{id, date, amount, value_date, days, accrued}]
+          transactions: Array.isArray(item.transactions) ? item.transactions : [],
+          // 计息台账的汇总 (没有台账时为 null，组件里按市值估算)
+          daysHeld: item.days_held ?? undefined,
+          accruedInterest: item.accrued_interest,
+          dayInterest: item.day_interest
         }));
 
         setStocks(safeStocks);
@@ -97,6 +110,40 @@ const App: React.FC = () => {
   }, [token]);
 
   // --- 3. 核心逻辑：刷新行情 (仅针对股票和基金) ---
+  // 把一份行情 (全量或增量) 合并进当前持仓，轮询和推送共用
+  const applyMarket = useCallback((market: any) => {
+    // 更新股票
+    setStocks(prevStocks => prevStocks.map(s => {
+      const m = market.stocks?.[s.code];
+      if (m) {
+        return { 
+          ...s, 
+          currentPrice: m.price, 
+          changePercent: m.change 
+        };
+      }
+      return s;
+    }));
+
+    // 更新基金
+    setFunds(prevFunds => prevFunds.map(f => {
+      const m = market.funds?.[f.code];
+      if (m) {
+        return { 
+          ...f, 
+          netValue: m.price || m.nav, 
+          estimatedChange: m.change,
+          navDate: m.navDate
+        };
+      }
+      return f;
+    }));
+    
+    const now = new Date();
+    const timeStr = `${now.getHours().toString().padStart(2, '0')}:${now.getMinutes().toString().padStart(2, '0')}:${now.getSeconds().toString().padStart(2, '0')}`;
+    setLastSyncTime(timeStr);
+  }, []);
+
   const fetchMarketData = useCallback(async () => {
     if (!token) return;
     
@@ -107,56 +154,50 @@ const App: React.FC = () => {
       });
       
       if (res.ok) {
-        const market = await res.json();
-        
-        // 更新股票
-        setStocks(prevStocks => prevStocks.map(s => {
-          const m = market.stocks[s.code];
-          if (m) {
-            return { 
-              ...s, 
-              currentPrice: m.price, 
-              changePercent: m.change 
-            };
-          }
-          return s;
-        }));
-
-        // 更新基金
-        setFunds(prevFunds => prevFunds.map(f => {
-          const m = market.funds[f.code];
-          if (m) {
-            return { 
-              ...f, 
-              netValue: m.price || m.nav, 
-              estimatedChange: m.change,
-              navDate: m.navDate
-            };
-          }
-          return f;
-        }));
-        
-        const now = new Date();
-        const timeStr = `${now.getHours().toString().padStart(2, '0')}:${now.getMinutes().toString().padStart(2, '0')}:${now.getSeconds().toString().padStart(2, '0')}`;
-        setLastSyncTime(timeStr);
+        applyMarket(await res.json());
       }
     } catch (e) {
       console.error("Market refresh failed", e);
     } finally {
       setIsSyncing(false);
     }
-  }, [token, dataSource]);
+  }, [token, dataSource, applyMarket]);
 
-  // --- 4. 自动轮询机制 ---
+  // --- 4. 行情推送 (SSE)，浏览器不支持或连接失败时退回 10 秒轮询 ---
   useEffect(() => {
-    if (isAuthenticated) {
-      fetchAssets();
-      const intervalId = setInterval(() => {
+    if (!isAuthenticated || !token) return;
+    fetchAssets();
+
+    let intervalId: ReturnType<typeof setInterval> | null = null;
+    const startPolling = () => {
+      if (intervalId) return;
+      intervalId = setInterval(() => {
         fetchMarketData();
       }, 10000); // 10秒刷新一次股票基金行情
-      return () => clearInterval(intervalId);
+    };
+
+    if (typeof EventSource === 'undefined') {
+      startPolling();
+      return () => { if (intervalId) clearInterval(intervalId); };
     }
-  }, [isAuthenticated, fetchAssets, fetchMarketData]);
+
+    // 推送和兜底轮询用同一个行情源；切换数据源时重新建立连接
+    const es = new EventSource(`/api/market/stream?token=${encodeURIComponent(token)}&source=${dataSource}`);
+    const onMessage = (e: MessageEvent) => {
+      // 推送恢复后停掉兜底轮询
+      if (intervalId) { clearInterval(intervalId); intervalId = null; }
+      applyMarket(JSON.parse(e.data));
+    };
+    es.addEventListener('snapshot', onMessage as EventListener);
+    es.addEventListener('delta', onMessage as EventListener);
+    // EventSource 会自动重连，断开期间先用轮询顶上
+    es.onerror = () => startPolling();
+
+    return () => {
+      es.close();
+      if (intervalId) clearInterval(intervalId);
+    };
+  }, [isAuthenticated, token, dataSource, fetchAssets, fetchMarketData, applyMarket]);
 
   // --- 5. 数据处理辅助函数 (Payload Builder) ---
   const preparePayload = (asset: any) => {
@@ -231,6 +272,24 @@ const App: React.FC = () => {
     }
   };
 
+  // 理财买入明细：逐笔追加 / 删除，失败时抛出让调用方提示
+  const handleAddLot = async (assetId: number | string, lot: { date: string; amount: number }) => {
+    const res = await fetch(`/api/assets/${assetId}/transactions`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json', 'Authorization': `Bearer ${token}` },
+      body: JSON.stringify(lot)
+    });
+    if (!res.ok) throw new Error(`add lot failed: ${res.status}`);
+  };
+
+  const handleDeleteLot = async (assetId: number | string, lotId: number | string) => {
+    const res = await fetch(`/api/assets/${assetId}/transactions/${lotId}`, {
+      method: 'DELETE',
+      headers: { 'Authorization': `Bearer ${token}` }
+    });
+    if (!res.ok && res.status !== 404) throw new Error(`delete lot failed: ${res.status}`);
+  };
+
   const handleDeleteAsset = async (id: number | string) => { // 兼容 string 和 number
     if (!window.confirm("确认删除吗？")) return;
 
@@ -351,6 +410,8 @@ const App: React.FC = () => {
                     onDelete={handleDeleteAsset} 
                     onEdit={handleEditAsset} 
                     onAdd={handleAddAsset} 
+                    onAddLot={handleAddLot}
+                    onDeleteLot={handleDeleteLot}
                 />
             } 
           />
@@ -0,0 +1,294 @@
+"""持仓批量导入 / 导出 (/api/assets/bulk)。
+
+导入：CSV 或 JSON 解析成行 → 同一文件里重复的代码先合并 → 一个事务里 executemany 批量 UPDATE / INSERT，只提交一次。
+两种模式：
+- merge (默认)：已有的股票/基金按加权平均成本追加 (与逐只添加的 /api/assets 同一算法)；
+  理财不是按份额累加的，已存在的理财行跳过并在结果里说明。
+- replace：已有持仓的成本、数量等字段直接用文件里的值覆盖，理财明细整体替换，
+  导出再导入同一个账户结果不变。文件里没有的持仓不会被删除。
+理财的买入明细 (asset_transactions) 放在 lots 列里一起导出 / 导入：CSV 为 "日期:金额;日期:金额"，
+JSON 为 [{"date", "amount"}]；有明细的理财本金和起始日按明细重算，计息台账随之重建。
+代码校验在调用方 (main) 里异步做：先查内存证券主表，主表里没有的再合并成一次行情请求。
+"""
+import csv
+import io
+import json
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+
+import models
+import asset_transactions
+import fixed_accrual
+
+ASSET_TYPES = ("stock", "fund", "fixed")
+EXPORT_FIELDS = ("asset_type", "code", "name", "cost_price", "quantity", "tag", "start_date", "apy",
+                 "interest_mode", "value_lag", "holiday_rule", "lots")
+MODES = ("merge", "replace")
+MAX_ROWS = 10000
+
+# 券商对账单常见的中文表头
+_ALIASES = {
+    "类型": "asset_type", "资产类型": "asset_type",
+    "代码": "code", "证券代码": "code", "基金代码": "code",
+    "名称": "name", "证券名称": "name", "基金名称": "name",
+    "成本价": "cost_price", "成本": "cost_price", "参考成本价": "cost_price",
+    "数量": "quantity", "持仓数量": "quantity", "股票余额": "quantity", "持有份额": "quantity", "份额": "quantity",
+    "标签": "tag", "起始日": "start_date", "年化": "apy", "明细": "lots", "买入明细": "lots",
+}
+
+
+def _parse_date(value: Any) -> date:
+    s = str(value).strip()
+    for fmt in ("%Y-%m-%d", "%Y%m%d", "%Y/%m/%d"):
+        try:
+            return datetime.strptime(s[:10], fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"bad date '{value}'")
+
+
+def _number(value: Any, field: str) -> Optional[float]:
+    if value is None or str(value).strip() == "":
+        return None
+    try:
+        return float(str(value).replace(",", "").strip())
+    except ValueError:
+        raise ValueError(f"bad {field} '{value}'")
+
+
+def _parse_lots(value: Any) -> Optional[List[Tuple[date, float]]]:
+    """lots 列：JSON 数组 [{"date", "amount"}] 或 CSV 里的 "日期:金额;日期:金额"；空值表示文件没给明细。"""
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    items = value if isinstance(value, list) else [
+        dict(zip(("date", "amount"), part.split(":", 1))) for part in str(value).split(";") if part.strip()
+    ]
+    lots = []
+    for item in items:
+        if not isinstance(item, dict) or "date" not in item or "amount" not in item:
+            raise ValueError(f"bad lots '{value}'")
+        lots.append((_parse_date(item["date"]), _number(item["amount"], "lot amount") or 0.0))
+    return lots
+
+
+def parse(filename: str, content: bytes, default_type: str = "stock") -> List[Dict[str, Any]]:
+    """CSV / JSON 转成持仓行。必需列：code；可选列见 EXPORT_FIELDS (表头也认常见的中文名)。
+
+    JSON 可以是行的数组，或 {"assets": [...]}。
+    """
+    text = content.decode("utf-8-sig")
+    if filename.lower().endswith(".json") or text.lstrip()[:1] in ("[", "{"):
+        try:
+            data = json.loads(text)
+        except ValueError as e:
+            raise ValueError(f"invalid JSON: {e}")
+        records = data.get("assets") if isinstance(data, dict) else data
+        if not isinstance(records, list):
+            raise ValueError("JSON must be a list of assets or {\"assets\": [...]}")
+        first_line = 1
+    else:
+        records = list(csv.DictReader(io.StringIO(text)))
+        first_line = 2
+    if len(records) > MAX_ROWS:
+        raise ValueError(f"too many rows ({len(records)}), at most {MAX_ROWS}")
+
+    rows = []
+    for lineno, rec in enumerate(records, start=first_line):
+        if not isinstance(rec, dict):
+            raise ValueError(f"row {lineno}: expected an object")
+        rec = {_ALIASES.get(str(k).strip(), str(k).strip().lower()): v for k, v in rec.items() if k is not None}
+        asset_type = str(rec.get("asset_type") or default_type).strip()
+        code = str(rec.get("code") or "").strip()
+        if asset_type not in ASSET_TYPES:
+            raise ValueError(f"row {lineno}: asset_type must be one of {', '.join(ASSET_TYPES)}")
+        if not code:
+            raise ValueError(f"row {lineno}: missing code")
+        try:
+            start_date = rec.get("start_date")
+            lag = _number(rec.get("value_lag"), "value_lag")
+            rows.append({
+                "line": lineno,
+                "asset_type": asset_type,
+                "code": code,
+                "name": str(rec.get("name") or "").strip() or None,
+                "cost_price": _number(rec.get("cost_price"), "cost_price") or 0.0,
+                "quantity": _number(rec.get("quantity"), "quantity") or 0.0,
+                "tag": str(rec.get("tag") or "").strip() or None,
+                "start_date": _parse_date(start_date).strftime("%Y-%m-%d") if start_date not in (None, "") else None,
+                "apy": _number(rec.get("apy"), "apy"),
+                "interest_mode": str(rec.get("interest_mode") or "").strip() or None,
+                "value_lag": int(lag) if lag is not None else None,
+                "holiday_rule": str(rec.get("holiday_rule") or "").strip() or None,
+                "lots": _parse_lots(rec.get("lots")) if asset_type == "fixed" else None,
+            })
+        except ValueError as e:
+            raise ValueError(f"row {lineno}: {e}")
+        r = rows[-1]
+        if r["interest_mode"] and r["interest_mode"] not in fixed_accrual.INTEREST_MODES:
+            raise ValueError(f"row {lineno}: interest_mode must be one of {', '.join(fixed_accrual.INTEREST_MODES)}")
+        if r["holiday_rule"] and r["holiday_rule"] not in fixed_accrual.HOLIDAY_RULES:
+            raise ValueError(f"row {lineno}: holiday_rule must be one of {', '.join(fixed_accrual.HOLIDAY_RULES)}")
+        if r["value_lag"] is not None and not 0 <= r["value_lag"] <= 30:
+            raise ValueError(f"row {lineno}: value_lag must be between 0 and 30")
+    return rows
+
+
+def _merge_into(target: Dict[str, Any], cost_price: float, quantity: float):
+    # 加权平均成本：和 /api/assets 追加持仓的算法一致
+    old_val = (target["cost_price"] or 0) * (target["quantity"] or 0)
+    new_qty = (target["quantity"] or 0) + quantity
+    if new_qty > 0:
+        target["cost_price"] = (old_val + cost_price * quantity) / new_qty
+        target["quantity"] = new_qty
+    else:
+        target["quantity"] = 0
+
+
+def combine(rows: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """同一文件里 (类型, 代码) 相同的行先合并成一行 (加权平均成本，其余字段后出现的优先)。"""
+    merged: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for r in rows:
+        key = (r["asset_type"], r["code"])
+        if key not in merged:
+            merged[key] = dict(r)
+            continue
+        m = merged[key]
+        _merge_into(m, r["cost_price"], r["quantity"])
+        if r["lots"] is not None:
+            m["lots"] = (m["lots"] or []) + r["lots"]
+        for k in ("name", "tag", "start_date", "apy", "interest_mode", "value_lag", "holiday_rule"):
+            if r[k] is not None:
+                m[k] = r[k]
+    return list(merged.values())
+
+
+def upsert(db: Session, owner_id: int, rows: List[Dict[str, Any]], mode: str = "merge") -> Dict[str, Any]:
+    """按 mode 合并或覆盖已有持仓、新建没有的；每类资产一次查询，UPDATE / INSERT 各一条 executemany。
+    返回 {"created", "updated", "skipped": [跳过的行]}。调用方负责 commit。
+    """
+    A = models.Asset
+    keys = {(r["asset_type"], r["code"]) for r in rows}
+    existing: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for t in ASSET_TYPES:
+        codes = [c for tt, c in keys if tt == t]
+        if not codes:
+            continue
+        for a in db.query(A.id, A.asset_type, A.code, A.cost_price, A.quantity).filter(
+            A.owner_id == owner_id, A.asset_type == t, A.code.in_(codes)
+        ).all():
+            existing.setdefault((a.asset_type, a.code), {"id": a.id, "cost_price": a.cost_price, "quantity": a.quantity})
+
+    updates, inserts, skipped = [], [], []
+    lots: Dict[Tuple[str, str], List[Tuple[date, float]]] = {}
+    for r in rows:
+        key = (r["asset_type"], r["code"])
+        cur = existing.get(key)
+        if cur and mode == "merge" and r["asset_type"] == "fixed":
+            # 理财的本金来自买入明细，不能按份额加权合并；要覆盖请用 replace
+            skipped.append(r)
+            continue
+        if cur:
+            if mode == "replace":
+                cur["cost_price"], cur["quantity"] = r["cost_price"], r["quantity"]
+            else:
+                _merge_into(cur, r["cost_price"], r["quantity"])
+            item = {"id": cur["id"], "cost_price": cur["cost_price"], "quantity": cur["quantity"]}
+            # 名称按导入的覆盖，其余字段只在文件里给了才改
+            for k in ("name", "tag", "start_date", "apy", "interest_mode", "value_lag", "holiday_rule"):
+                if r[k] is not None:
+                    item[k] = r[k]
+            updates.append(item)
+        else:
+            inserts.append({
+                "owner_id": owner_id, "asset_type": r["asset_type"], "code": r["code"], "name": r["name"] or r["code"],
+                "cost_price": r["cost_price"], "quantity": r["quantity"], "tag": r["tag"] or "稳健",
+                "start_date": r["start_date"], "apy": r["apy"],
+                "interest_mode": r["interest_mode"] or "simple", "value_lag": r["value_lag"] or 0,
+                "holiday_rule": r["holiday_rule"] or "calendar",
+            })
+        if r["asset_type"] == "fixed":
+            lots[key] = r["lots"]
+    # 按主键批量 UPDATE 要求每行的列一致，按列组合分组各执行一次
+    groups: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+    for item in updates:
+        groups.setdefault(tuple(sorted(item)), []).append(item)
+    for items in groups.values():
+        db.execute(update(A), items)
+    if inserts:
+        db.execute(insert(A), inserts)
+
+    if lots:
+        _store_lots(db, owner_id, lots)
+    return {"created": len(inserts), "updated": len(updates), "skipped": skipped}
+
+
+def _store_lots(db: Session, owner_id: int, lots: Dict[Tuple[str, str], Optional[List[Tuple[date, float]]]]):
+    """写入导入的理财明细 (给了 lots 的整体替换)，按明细回写本金 / 起始日，并重建这些理财的计息台账。"""
+    A, T, F = models.Asset, models.AssetTransaction, models.FixedAccrual
+    ids = {code: asset_id for asset_id, code in db.query(A.id, A.code).filter(
+        A.owner_id == owner_id, A.asset_type == "fixed", A.code.in_([c for _, c in lots])
+    ).all()}
+    fixed_ids = list(ids.values())
+    replaced = [ids[c] for (_, c), v in lots.items() if v is not None and c in ids]
+    if replaced:
+        db.query(T).filter(T.asset_id.in_(replaced)).delete(synchronize_session=False)
+        new_lots = [{"asset_id": ids[c], "date": d, "amount": amt}
+                    for (_, c), v in lots.items() if v is not None and c in ids for d, amt in v]
+        if new_lots:
+            db.execute(insert(T), new_lots)
+    # 有明细的理财：本金和等效起始日以明细为准 (和逐笔增删明细时一致)
+    totals = asset_transactions.summarize(db, fixed_ids)
+    if totals:
+        db.execute(update(A), [
+            {"id": asset_id, "quantity": t["total_principal"], "start_date": t["weighted_start_date"]}
+            for asset_id, t in totals.items()
+        ])
+    # 明细或年化/计息规则可能都变了：台账按新数据从起息日重算
+    db.query(F).filter(F.asset_id.in_(fixed_ids)).delete(synchronize_session=False)
+    db.flush()
+    fixed_accrual.accrue(db, fixed_ids)
+
+
+def export(db: Session, owner_id: int) -> List[Dict[str, Any]]:
+    A, T = models.Asset, models.AssetTransaction
+    fields = [f for f in EXPORT_FIELDS if f != "lots"]
+    rows = db.query(A.id, *[getattr(A, f) for f in fields]).filter(A.owner_id == owner_id).order_by(A.asset_type, A.id).all()
+    lots: Dict[int, List[Dict[str, Any]]] = {}
+    fixed_ids = [r.id for r in rows if r.asset_type == "fixed"]
+    if fixed_ids:
+        for t in db.query(T.asset_id, T.date, T.amount).filter(T.asset_id.in_(fixed_ids)).order_by(T.date, T.id).all():
+            lots.setdefault(t.asset_id, []).append({"date": t.date.strftime("%Y-%m-%d"), "amount": t.amount})
+    out = []
+    for r in rows:
+        item = dict(zip(fields, r[1:]))
+        item["lots"] = lots.get(r.id) if r.asset_type == "fixed" else None
+        out.append(item)
+    return out
+
+
+def to_csv(rows: List[Dict[str, Any]]) -> str:
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=EXPORT_FIELDS, lineterminator="\n")
+    writer.writeheader()
+    for r in rows:
+        lots = r.get("lots")
+        writer.writerow(dict(r, lots=";".join(f"{l['date']}:{l['amount']}" for l in lots) if lots else None))
+    return buf.getvalue()
+
+
+def backfill_ranges(rows: List[Dict[str, Any]], today: Optional[date] = None) -> Optional[Tuple[List[str], List[str], date]]:
+    """带过去起始日的股票/基金：返回 (股票代码, 基金代码, 最早起始日)，供后台一次补齐历史价格。"""
+    today = today or date.today()
+    stocks, funds, earliest = [], [], None
+    for r in rows:
+        if r["asset_type"] not in ("stock", "fund") or not r["start_date"]:
+            continue
+        d = _parse_date(r["start_date"])
+        if d >= today:
+            continue
+        (stocks if r["asset_type"] == "stock" else funds).append(r["code"])
+        earliest = d if earliest is None or d < earliest else earliest
+    return (stocks, funds, earliest) if earliest else None
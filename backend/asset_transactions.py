@@ -0,0 +1,84 @@
+import json
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session, load_only
+
+import models
+
+
+def parse_extra_lots(extra: Optional[str]) -> Optional[List[Tuple[date, float]]]:
+    """解析旧版 Asset.extra 里的买入明细 JSON；不是 JSON 数组时返回 None (extra 另作他用)。"""
+    if not extra or not extra.strip().startswith('['):
+        return None
+    try:
+        raw = json.loads(extra)
+    except ValueError:
+        return None
+    lots = []
+    for item in raw:
+        try:
+            lots.append((datetime.strptime(str(item["date"])[:10], '%Y-%m-%d').date(), float(str(item["amount"]).replace(',', ''))))
+        except (KeyError, TypeError, ValueError):
+            continue
+    return lots
+
+
+def replace_lots(db: Session, asset: models.Asset, lots: List[Tuple[date, float]]):
+    """整体替换某资产的明细 (仅兼容旧客户端整包提交 extra 时使用)。"""
+    db.query(models.AssetTransaction).filter(models.AssetTransaction.asset_id == asset.id).delete()
+    db.add_all([models.AssetTransaction(asset_id=asset.id, date=d, amount=amt) for d, amt in lots])
+
+
+def summarize(db: Session, asset_ids: List[int], today: Optional[date] = None) -> Dict[int, Dict[str, Any]]:
+    """在 SQL 里聚合每个资产的明细：总本金、笔数、首笔日期和资金加权持有天数。"""
+    if not asset_ids:
+        return {}
+    today = today or date.today()
+    T = models.AssetTransaction
+    # 资金占用量 (元*天) = Σ 每笔金额 * (今天 - 买入日)
+    capital_days = func.sum(T.amount * (func.julianday(today.strftime('%Y-%m-%d')) - func.julianday(T.date)))
+    rows = db.query(T.asset_id, func.count(T.id), func.sum(T.amount), func.min(T.date), capital_days).filter(
+        T.asset_id.in_(asset_ids)
+    ).group_by(T.asset_id).all()
+
+    result = {}
+    for asset_id, lot_count, principal, first_date, weighted in rows:
+        principal = principal or 0
+        days_held = max(1, round((weighted or 0) / principal)) if principal > 0 else 1
+        result[asset_id] = {
+            "lot_count": lot_count,
+            "total_principal": principal,
+            "first_date": first_date.strftime('%Y-%m-%d') if first_date else None,
+            "days_held": days_held,
+            # 加权起始日：总本金 * (今天 - 该日) = 资金占用量，和前端原先的算法一致
+            "weighted_start_date": (today - timedelta(days=days_held)).strftime('%Y-%m-%d'),
+        }
+    return result
+
+
+def sync_asset_totals(db: Session, asset: models.Asset) -> Dict[str, Any]:
+    """明细变动后，用聚合结果回写资产的本金 (quantity) 和等效起始日。"""
+    summary = summarize(db, [asset.id]).get(asset.id)
+    if summary:
+        asset.quantity = summary["total_principal"]
+        asset.start_date = summary["weighted_start_date"]
+    return summary or {"lot_count": 0, "total_principal": 0, "first_date": None, "days_held": 1, "weighted_start_date": None}
+
+
+def backfill_from_extra(db: Session) -> int:
+    """把历史 extra JSON 明细拆成 asset_transactions 行，迁移后清空 extra。返回迁移的资产数。"""
+    migrated = 0
+    # 只取用到的列：迁移执行到这一步时，assets 表还没有后续版本才加的字段
+    fixed = db.query(models.Asset).options(load_only(models.Asset.id, models.Asset.extra)).filter(
+        models.Asset.asset_type == "fixed", models.Asset.extra.isnot(None)
+    ).all()
+    for asset in fixed:
+        lots = parse_extra_lots(asset.extra)
+        if lots is None:
+            continue
+        replace_lots(db, asset, lots)
+        asset.extra = None
+        migrated += 1
+    return migrated
@@ -0,0 +1,142 @@
+"""登录凭证：HS256 签名的 JWT。
+
+校验只看签名和过期时间，再从一份很小的用户 LRU 里取出用户 —— 正常请求完全不查库。
+令牌里带着签发时的密码指纹 (pwv)，改密码后旧令牌自动失效；用户信息变更时调用 invalidate()。
+"""
+import hashlib
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple, Optional
+
+from jose import JWTError, jwt
+
+import models
+from database import SessionLocal
+
+ALGORITHM = "HS256"
+# 令牌有效期 (小时)，默认 7 天
+TOKEN_EXPIRE_HOURS = int(os.environ.get("PACC_TOKEN_EXPIRE_HOURS", "168"))
+SECRET_CONFIG_KEY = "jwt_secret"
+
+
+class AuthUser(NamedTuple):
+    """鉴权后注入各接口的用户，只有 id / 用户名，不绑定数据库会话。"""
+    id: int
+    username: str
+    pwv: str
+
+
+def password_fingerprint(hashed_password: Optional[str]) -> str:
+    return hashlib.sha256((hashed_password or "").encode()).hexdigest()[:16]
+
+
+class UserCache:
+    """user_id -> AuthUser 的 LRU，条目 ttl 秒后过期 (兜底其他进程改了用户的情况)。"""
+    def __init__(self, max_size: int = 1024, ttl: float = 300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> Optional[AuthUser]:
+        with self._lock:
+            item = self._data.get(user_id)
+            if item is None:
+                return None
+            user, expires = item
+            if expires < time.monotonic():
+                del self._data[user_id]
+                return None
+            self._data.move_to_end(user_id)
+            return user
+
+    def put(self, user: AuthUser):
+        with self._lock:
+            self._data[user.id] = (user, time.monotonic() + self.ttl)
+            self._data.move_to_end(user.id)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def invalidate(self, user_id: Optional[int] = None):
+        with self._lock:
+            if user_id is None:
+                self._data.clear()
+            else:
+                self._data.pop(user_id, None)
+
+
+user_cache = UserCache()
+_secret: Optional[str] = None
+_secret_lock = threading.Lock()
+
+
+def secret_key() -> str:
+    """签名密钥：优先用环境变量 PACC_SECRET_KEY，否则首次使用时生成并存进 system_config，重启后令牌依然有效。"""
+    global _secret
+    if _secret:
+        return _secret
+    with _secret_lock:
+        if _secret:
+            return _secret
+        env = os.environ.get("PACC_SECRET_KEY")
+        if env:
+            _secret = env
+            return _secret
+        db = SessionLocal()
+        try:
+            item = db.query(models.SystemConfig).filter(models.SystemConfig.key == SECRET_CONFIG_KEY).first()
+            if not item:
+                item = models.SystemConfig(key=SECRET_CONFIG_KEY, value=secrets.token_urlsafe(32))
+                db.add(item)
+                db.commit()
+            _secret = item.value
+        finally:
+            db.close()
+        return _secret
+
+
+def create_access_token(user: models.User) -> str:
+    claims = {
+        "sub": str(user.id),
+        "name": user.username,
+        "pwv": password_fingerprint(user.hashed_password),
+        "exp": datetime.now(timezone.utc) + timedelta(hours=TOKEN_EXPIRE_HOURS),
+    }
+    return jwt.encode(claims, secret_key(), algorithm=ALGORITHM)
+
+
+def _load_user(user_id: int) -> Optional[AuthUser]:
+    db = SessionLocal()
+    try:
+        user = db.query(models.User).filter(models.User.id == user_id).first()
+        if not user:
+            return None
+        return AuthUser(user.id, user.username, password_fingerprint(user.hashed_password))
+    finally:
+        db.close()
+
+
+def authenticate(token: str) -> Optional[AuthUser]:
+    """校验令牌，返回对应用户；签名/过期/密码指纹任一不符返回 None。"""
+    try:
+        payload = jwt.decode(token, secret_key(), algorithms=[ALGORITHM])
+        user_id = int(payload["sub"])
+    except (JWTError, KeyError, ValueError):
+        return None
+    user = user_cache.get(user_id)
+    if user is None:
+        user = _load_user(user_id)
+        if user is None:
+            return None
+        user_cache.put(user)
+    if user.pwv != payload.get("pwv"):
+        return None
+    return user
+
+
+def invalidate(user_id: Optional[int] = None):
+    user_cache.invalidate(user_id)
@@ -0,0 +1,226 @@
+"""行情刷新链路压测：本地桩服务替代真实上游，测 MarketEngine / 刷新接口 / 快照任务。
+
+在 backend 目录下运行：
+    python -m bench.run_bench
+    python -m bench.run_bench --sizes 10,100,1000 --iterations 20 --latency 0.05 --error-rate 0.02
+    python -m bench.run_bench --sizes 100,1000,5000 --iterations 5   # 看股票抓取/解析是否随代码数线性增长
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+from bench.stub_upstream import StubConfig, StubUpstreams, sina_payload, tencent_payload
+
+
+def make_codes(size: int) -> Tuple[List[str], List[str]]:
+    # 一半股票 (沪市 600xxx)，一半基金
+    n_stock = size // 2
+    return [f"{600000 + i:06d}" for i in range(n_stock)], [f"{1 + i:06d}" for i in range(size - n_stock)]
+
+
+def percentile(samples: List[float], p: float) -> float:
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[idx]
+
+
+class Report:
+    def __init__(self):
+        self.rows: List[Dict] = []
+        print(f"{'scenario':<22}{'size':>6}{'p50 ms':>10}{'p99 ms':>10}{'req/s':>10}{'upstream/op':>13}")
+
+    def add(self, scenario: str, size: int, samples: List[float], wall: float, upstream: int):
+        row = {
+            "scenario": scenario, "size": size,
+            "p50_ms": percentile(samples, 50) * 1000, "p99_ms": percentile(samples, 99) * 1000,
+            "rps": len(samples) / wall if wall > 0 else 0.0,
+            "upstream_per_op": upstream / len(samples),
+        }
+        self.rows.append(row)
+        print(f"{scenario:<22}{size:>6}{row['p50_ms']:>10.1f}{row['p99_ms']:>10.1f}{row['rps']:>10.1f}{row['upstream_per_op']:>13.1f}")
+
+
+async def bench_engine(stubs: StubUpstreams, report: Report, size: int, iterations: int):
+    from market_engine import MarketEngine
+    engine = MarketEngine(endpoints=stubs.endpoints)
+    stock_codes, fund_codes = make_codes(size)
+    samples = []
+    before = stubs.config.requests
+    wall = time.perf_counter()
+    for _ in range(iterations):
+        engine.cache.clear()
+        start = time.perf_counter()
+        await engine.get_real_time_data(stock_codes, fund_codes)
+        samples.append(time.perf_counter() - start)
+    wall = time.perf_counter() - wall
+    await engine.pool.aclose()
+    report.add("engine (cold)", size, samples, wall, stubs.config.requests - before)
+
+
+async def bench_stocks(stubs: StubUpstreams, report: Report, size: int, iterations: int):
+    # 只抓股票：代码按 STOCK_CHUNK_SIZE 分块并发，耗时应基本持平、上游请求数随代码数线性增长
+    from market_engine import MarketEngine
+    engine = MarketEngine(endpoints=stubs.endpoints)
+    stock_codes = [f"{600000 + i:06d}" for i in range(size)]
+    samples = []
+    before = stubs.config.requests
+    wall = time.perf_counter()
+    for _ in range(iterations):
+        engine.cache.clear()
+        start = time.perf_counter()
+        await engine.get_real_time_data(stock_codes, [])
+        samples.append(time.perf_counter() - start)
+    wall = time.perf_counter() - wall
+    await engine.pool.aclose()
+    report.add("engine stocks (cold)", size, samples, wall, stubs.config.requests - before)
+
+
+def _split_tencent(content: str, code_map: Dict[str, str]) -> Dict[str, Dict]:
+    # 对照组：分块抓取之前的解析方式，整段正则取出后按 ~ 全量切分
+    out = {}
+    for key, data_str in re.findall(r'v_([a-z]{2}\d+)="([^"]+)"', content):
+        data = data_str.split('~')
+        if len(data) > 30:
+            price, close = float(data[3]), float(data[4])
+            change = (price - close) / close * 100 if close > 0 else float(data[32])
+            if key in code_map:
+                out[code_map[key]] = {"name": data[1], "price": price, "change": change}
+    return out
+
+
+def _split_sina(content: str, code_map: Dict[str, str]) -> Dict[str, Dict]:
+    out = {}
+    for key, data_str in re.findall(r'hq_str_([a-z]{2}\d+)="([^"]*)"', content):
+        data = data_str.split(',')
+        if len(data) > 5:
+            close, price = float(data[2]), float(data[3])
+            change = (price - close) / close * 100 if close > 0 else 0.0
+            if key in code_map:
+                out[code_map[key]] = {"name": data[0], "price": price, "change": change}
+    return out
+
+
+def bench_parser(report: Report, size: int, iterations: int):
+    # 纯解析耗时 (不含网络)：全量切分 vs 只取所需字段
+    from market_engine import parse_sina_quotes, parse_tencent_quotes
+    code_map = {f"sh{600000 + i:06d}": f"{600000 + i:06d}" for i in range(size)}
+    payloads = {"tencent": tencent_payload(code_map), "sina": sina_payload(code_map)}
+    parsers = [
+        ("parse tencent split", "tencent", _split_tencent), ("parse tencent fast", "tencent", parse_tencent_quotes),
+        ("parse sina split", "sina", _split_sina), ("parse sina fast", "sina", parse_sina_quotes),
+    ]
+    for scenario, kind, parse in parsers:
+        samples = []
+        wall = time.perf_counter()
+        for _ in range(max(iterations, 5)):
+            start = time.perf_counter()
+            parse(payloads[kind], code_map)
+            samples.append(time.perf_counter() - start)
+        report.add(scenario, size, samples, time.perf_counter() - wall, 0)
+
+
+def seed_portfolio(main, size: int) -> int:
+    import models
+    db = main.SessionLocal()
+    try:
+        admin = db.query(models.User).filter(models.User.username == "admin").first()
+        db.query(models.Asset).filter(models.Asset.owner_id == admin.id).delete()
+        stock_codes, fund_codes = make_codes(size)
+        db.add_all([models.Asset(owner_id=admin.id, asset_type="stock", name=c, code=c, cost_price=10, quantity=100) for c in stock_codes])
+        db.add_all([models.Asset(owner_id=admin.id, asset_type="fund", name=c, code=c, cost_price=1, quantity=1000) for c in fund_codes])
+        db.commit()
+        return admin.id
+    finally:
+        db.close()
+
+
+async def bench_refresh(main, stubs: StubUpstreams, report: Report, size: int, iterations: int, concurrency: int):
+    import httpx
+    seed_portfolio(main, size)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        resp = await client.post("/token", data={"username": "admin", "password": "admin888"})
+        headers = {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+        # 冷启动：每次请求前清空行情缓存，测完整的上游抓取链路
+        samples = []
+        before = stubs.config.requests
+        wall = time.perf_counter()
+        for _ in range(iterations):
+            main.market_engine.cache.clear()
+            start = time.perf_counter()
+            (await client.get("/api/market/refresh", headers=headers)).raise_for_status()
+            samples.append(time.perf_counter() - start)
+        report.add("refresh (cold)", size, samples, time.perf_counter() - wall, stubs.config.requests - before)
+
+        # 热缓存 + 并发：模拟多个标签页同时轮询
+        samples = []
+
+        async def one():
+            start = time.perf_counter()
+            (await client.get("/api/market/refresh", headers=headers)).raise_for_status()
+            samples.append(time.perf_counter() - start)
+
+        before = stubs.config.requests
+        wall = time.perf_counter()
+        for _ in range(iterations):
+            await asyncio.gather(*(one() for _ in range(concurrency)))
+        report.add(f"refresh (warm x{concurrency})", size, samples, time.perf_counter() - wall, stubs.config.requests - before)
+
+
+async def bench_snapshot(main, stubs: StubUpstreams, report: Report, size: int, iterations: int):
+    seed_portfolio(main, size)
+    samples = []
+    before = stubs.config.requests
+    wall = time.perf_counter()
+    for _ in range(iterations):
+        main.market_engine.cache.clear()
+        start = time.perf_counter()
+        # force：周末 / 节假日跑压测时也完整执行一次快照
+        await main.perform_push_and_snapshot(force=True)
+        samples.append(time.perf_counter() - start)
+    report.add("push_and_snapshot", size, samples, time.perf_counter() - wall, stubs.config.requests - before)
+
+
+async def run(args):
+    report = Report()
+    config = StubConfig(latency=args.latency, jitter=args.latency / 2, error_rate=args.error_rate)
+    with tempfile.TemporaryDirectory() as tmp, StubUpstreams(config) as stubs:
+        # main 在导入时就会创建数据库引擎，必须先把数据库指到临时目录
+        os.environ["PACC_DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        import main
+        try:
+            main.startup_event()
+            main.market_engine.endpoints.update(stubs.endpoints)
+            for size in args.sizes:
+                bench_parser(report, size, args.iterations)
+                await bench_stocks(stubs, report, size, args.iterations)
+                await bench_engine(stubs, report, size, args.iterations)
+                await bench_refresh(main, stubs, report, size, args.iterations, args.concurrency)
+                await bench_snapshot(main, stubs, report, size, max(1, args.iterations // 4))
+        finally:
+            main.scheduler.shutdown(wait=False)
+            await main.market_engine.pool.aclose()
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report.rows, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PACC 行情刷新链路压测")
+    parser.add_argument("--sizes", type=lambda s: [int(x) for x in s.split(",")], default=[10, 100, 1000], help="持仓代码数量，逗号分隔")
+    parser.add_argument("--iterations", type=int, default=20, help="每个场景的采样次数")
+    parser.add_argument("--concurrency", type=int, default=8, help="热缓存场景的并发客户端数")
+    parser.add_argument("--latency", type=float, default=0.02, help="桩服务单次响应延迟 (秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="桩服务返回 502 的概率")
+    parser.add_argument("--json", help="把结果另存为 JSON 文件")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
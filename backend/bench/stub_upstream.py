@@ -0,0 +1,154 @@
+"""本地上游桩服务：模拟腾讯 / 新浪行情、fundgz 估值、FundSearchAPI 和批量净值接口。
+
+每个上游一个独立端口 (对应生产环境里不同的 host)，支持注入延迟和错误率，
+价格由代码哈希得出，同一代码每次返回相同的数据。
+"""
+import json
+import random
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import urlsplit, parse_qs
+
+import market_calendar
+
+
+def _quote(code: str):
+    seed = zlib.crc32(code.encode())
+    last_close = 5 + (seed % 5000) / 100
+    change = ((seed >> 8) % 2001 - 1000) / 100  # -10% ~ +10%
+    price = round(last_close * (1 + change / 100), 2)
+    return f"名称{code}", price, round(last_close, 2)
+
+
+def tencent_payload(full_codes) -> str:
+    # sh600000 -> v_sh600000="1~名称~600000~现价~昨收~...";  真实接口每条 88 个字段，第 32 个是涨跌幅
+    lines = []
+    for full in full_codes:
+        name, price, last_close = _quote(full[2:])
+        fields = ["1", name, full[2:], f"{price:.2f}", f"{last_close:.2f}"] + [f"{price * (i + 1):.2f}" for i in range(83)]
+        fields[32] = f"{(price - last_close) / last_close * 100:.2f}"
+        lines.append(f'v_{full}="{"~".join(fields)}";')
+    return "\n".join(lines)
+
+
+def sina_payload(full_codes) -> str:
+    # sh600000 -> var hq_str_sh600000="名称,今开,昨收,现价,最高,最低,...";  真实接口每条 33 个字段
+    lines = []
+    for full in full_codes:
+        name, price, last_close = _quote(full[2:])
+        fields = [name, f"{last_close:.2f}", f"{last_close:.2f}", f"{price:.2f}", f"{price:.2f}", f"{last_close:.2f}"] + [f"{price * (i + 1):.2f}" for i in range(27)]
+        lines.append(f'var hq_str_{full}="{",".join(fields)}";')
+    return "\n".join(lines)
+
+
+class StubConfig:
+    def __init__(self, latency: float = 0.02, jitter: float = 0.01, error_rate: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        # 模拟的官方净值日期：最新可公布日期；估值接口的 jzrq 比它晚一个交易日，逼出 B 接口
+        self.nav_date = market_calendar.latest_nav_date()
+        self.gz_date = market_calendar.last_trading_day(self.nav_date - timedelta(days=1))
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def count(self):
+        with self._lock:
+            self.requests += 1
+
+
+def _make_handler(kind: str, config: StubConfig):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status: int, body: bytes, content_type: str):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            config.count()
+            time.sleep(max(0.0, config.latency + random.uniform(-config.jitter, config.jitter)))
+            if config.error_rate and random.random() < config.error_rate:
+                self._send(502, b"bad gateway", "text/plain")
+                return
+            url = urlsplit(self.path)
+            body, content_type = getattr(self, f"_{kind}")(url)
+            self._send(200, body, content_type)
+
+        def _tencent(self, url):
+            codes = url.path.split("=", 1)[-1].split(",")
+            return tencent_payload(filter(None, codes)).encode("gbk"), "text/plain; charset=GBK"
+
+        def _sina(self, url):
+            codes = url.path.split("=", 1)[-1].split(",")
+            return sina_payload(filter(None, codes)).encode("gbk"), "application/javascript; charset=GBK"
+
+        def _fundgz(self, url):
+            code = url.path.rsplit("/", 1)[-1].split(".")[0]
+            name, price, last_close = _quote(code)
+            raw = {
+                "fundcode": code, "name": name, "jzrq": config.gz_date.strftime("%Y-%m-%d"),
+                "dwjz": f"{last_close / 10:.4f}", "gsz": f"{price / 10:.4f}",
+                "gszzl": f"{(price - last_close) / last_close * 100:.2f}",
+                "gztime": datetime.now().strftime("%Y-%m-%d %H:%M"),
+            }
+            return f"jsonpgz({json.dumps(raw, ensure_ascii=False)});".encode("utf-8"), "application/javascript"
+
+        def _fundsearch(self, url):
+            code = parse_qs(url.query).get("key", [""])[0]
+            name, price, _ = _quote(code)
+            raw = {"Datas": [{"CODE": code, "NAME": name, "FundBaseInfo": {
+                "DWJZ": round(price / 10, 4), "FSRQ": config.nav_date.strftime("%Y-%m-%d")}}]}
+            return json.dumps(raw, ensure_ascii=False).encode("utf-8"), "application/json"
+
+        def _fundnav(self, url):
+            codes = parse_qs(url.query).get("Fcodes", [""])[0].split(",")
+            datas = []
+            for code in filter(None, codes):
+                name, price, _ = _quote(code)
+                datas.append({"FCODE": code, "SHORTNAME": name, "NAV": f"{price / 10:.4f}",
+                              "PDATE": config.nav_date.strftime("%Y-%m-%d")})
+            return json.dumps({"Datas": datas, "ErrCode": 0}, ensure_ascii=False).encode("utf-8"), "application/json"
+
+    return Handler
+
+
+class StubUpstreams:
+    """启动全部桩服务，endpoints 可直接传给 MarketEngine(endpoints=...)。"""
+    KINDS = ("tencent", "sina", "fundgz", "fundsearch", "fundnav")
+
+    def __init__(self, config: Optional[StubConfig] = None):
+        self.config = config or StubConfig()
+        self.endpoints: Dict[str, str] = {}
+        self._servers = []
+
+    def start(self) -> "StubUpstreams":
+        for kind in self.KINDS:
+            server = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(kind, self.config))
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            self._servers.append(server)
+            self.endpoints[kind] = f"http://127.0.0.1:{server.server_address[1]}"
+        return self
+
+    def stop(self):
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+        self._servers.clear()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
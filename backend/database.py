@@ -1,15 +1,70 @@
-from sqlalchemy import create_engine
+import os
+import time
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
+import metrics
+
 # 修改前: SQLALCHEMY_DATABASE_URL = "sqlite:///./pacc_assets.db"
-# 修改后：存到 data 文件夹下
-SQLALCHEMY_DATABASE_URL = "sqlite:///./data/pacc_assets.db"
+# 修改后：存到 data 文件夹下 (压测等场景可用 PACC_DATABASE_URL 指向临时库)
+SQLALCHEMY_DATABASE_URL = os.environ.get("PACC_DATABASE_URL", "sqlite:///./data/pacc_assets.db")
+
+IS_SQLITE = SQLALCHEMY_DATABASE_URL.startswith("sqlite")
+
+# 连接池：每个 uvicorn worker 进程一个池，同步接口跑在 anyio 线程池里，
+# 池子按并发线程数估算；SQLite 开 WAL 后读不阻塞写，多给几个连接是安全的
+DB_POOL_SIZE = int(os.environ.get("PACC_DB_POOL_SIZE", "8"))
+DB_MAX_OVERFLOW = int(os.environ.get("PACC_DB_MAX_OVERFLOW", "16"))
+
+# SQLite 连接级参数：WAL 让快照写入不再阻塞读请求；NORMAL 同步在 WAL 下不会损坏数据库，
+# 只是掉电时可能丢最后一个事务；cache_size 为负数表示 KiB
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": os.environ.get("PACC_SQLITE_BUSY_TIMEOUT_MS", "5000"),
+    "cache_size": os.environ.get("PACC_SQLITE_CACHE_KB", "-20000"),
+    "mmap_size": os.environ.get("PACC_SQLITE_MMAP_BYTES", str(256 * 1024 * 1024)),
+    "temp_store": "MEMORY",
+}
 
 # check_same_thread=False 是 SQLite 在多线程环境下必须的配置
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+if IS_SQLITE:
+    engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        connect_args={"check_same_thread": False, "timeout": 30},
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+    )
+
+    @event.listens_for(engine, "connect")
+    def _apply_sqlite_pragmas(dbapi_conn, connection_record):
+        cursor = dbapi_conn.cursor()
+        try:
+            for key, value in SQLITE_PRAGMAS.items():
+                cursor.execute(f"PRAGMA {key}={value}")
+        finally:
+            cursor.close()
+else:
+    engine = create_engine(SQLALCHEMY_DATABASE_URL, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
+
+# SQL 耗时打点 (按语句类型聚合到 /metrics)
+@event.listens_for(engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+@event.listens_for(engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    verb = statement.lstrip().split(" ", 1)[0].lower()
+    metrics.DB_QUERY_SECONDS.observe(elapsed, statement=verb if verb in ("select", "insert", "update", "delete") else "other")
+
+@event.listens_for(engine, "handle_error")
+def _handle_error(context):
+    starts = context.connection.info.get("query_start") if context.connection is not None else None
+    if starts:
+        starts.pop()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
\ No newline at end of file
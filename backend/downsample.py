@@ -0,0 +1,33 @@
+"""曲线降采样：Largest-Triangle-Three-Buckets (LTTB)，保留形状的前提下把点数压到 n 个以内。"""
+import numpy as np
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n: int) -> np.ndarray:
+    """返回要保留的点的下标 (升序，含首尾)。x 需单调递增；点数不超过 n 时原样返回全部下标。"""
+    size = len(x)
+    if n >= size:
+        return np.arange(size)
+    if n < 3:
+        return np.array([0, size - 1], dtype=np.int64)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # 首尾固定，中间 size-2 个点均分成 n-2 个桶
+    edges = np.linspace(1, size - 1, n - 1).astype(np.int64)
+    picked = np.empty(n, dtype=np.int64)
+    picked[0], picked[-1] = 0, size - 1
+
+    prev = 0
+    for i in range(n - 2):
+        start, end = edges[i], edges[i + 1]
+        # 下一个桶的平均点 (最后一个桶用末点)
+        if i + 2 < len(edges):
+            nxt_x = x[end:edges[i + 2]].mean()
+            nxt_y = y[end:edges[i + 2]].mean()
+        else:
+            nxt_x, nxt_y = x[-1], y[-1]
+        # 桶内与 (上一个选中点, 下一桶均值) 构成三角形面积最大的点
+        area = np.abs((x[prev] - nxt_x) * (y[start:end] - y[prev]) - (x[prev] - x[start:end]) * (nxt_y - y[prev]))
+        prev = start + int(area.argmax())
+        picked[i + 1] = prev
+    return picked
@@ -0,0 +1,186 @@
+"""理财计息引擎：按买入明细 (asset_transactions) 逐笔计算每日利息，结果写进 fixed_accruals 台账。
+
+台账是增量的：每笔明细只从自己最后一条入账记录往后补，日常任务每天只追加一天；
+明细增删或年化/计息规则变动时 invalidate() 删掉该资产的台账，再从起息日重新生成。
+估值、快照和 /api/assets 直接读台账的汇总，不再按 市值 * 年化 / 365 估算。
+"""
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import Session
+
+import models
+import market_calendar
+from database import SessionLocal
+
+INTEREST_MODES = ("simple", "compound")
+HOLIDAY_RULES = ("calendar", "defer", "skip")
+DAYS_PER_YEAR = 365
+
+
+def value_date(buy_date: date, lag: int) -> date:
+    """起息日：T+0 为买入当天，T+N 为买入后第 N 个交易日。"""
+    d = buy_date
+    for _ in range(max(0, lag)):
+        d += timedelta(days=1)
+        while not market_calendar.is_trading_day(d):
+            d += timedelta(days=1)
+    return d
+
+
+def _normalize(asset) -> Tuple[str, int, str]:
+    mode = asset.interest_mode if asset.interest_mode in INTEREST_MODES else "simple"
+    rule = asset.holiday_rule if asset.holiday_rule in HOLIDAY_RULES else "calendar"
+    return mode, max(0, asset.value_lag or 0), rule
+
+
+def accrue_lot(principal: float, apy: float, mode: str, rule: str, start: date, through: date,
+               last: Optional[Tuple[date, float]] = None) -> List[Tuple[date, int, float, float]]:
+    """从 last (上次入账日, 累计利息) 之后补到 through，返回新增的 (入账日, 覆盖天数, 利息, 累计利息)。
+
+    start 为起息日；calendar 规则每个自然日入账一次，defer / skip 只在交易日入账，
+    defer 一次入账覆盖自上次入账以来的全部自然日，skip 只算当天。
+    """
+    rate = apy / 100 / DAYS_PER_YEAR
+    covered, accrued = last if last else (start - timedelta(days=1), 0.0)
+    rows = []
+    d = covered + timedelta(days=1)
+    while d <= through:
+        if rule == "calendar" or market_calendar.is_trading_day(d):
+            days = (d - covered).days if rule == "defer" else 1
+            if mode == "compound":
+                interest = (principal + accrued) * ((1 + rate) ** days - 1)
+            else:
+                interest = principal * rate * days
+            accrued += interest
+            rows.append((d, days, interest, accrued))
+            covered = d
+        d += timedelta(days=1)
+    return rows
+
+
+# ==========================================================
+# 台账维护
+# ==========================================================
+def accrue(db: Session, asset_ids: Optional[Iterable[int]] = None, through: Optional[date] = None) -> int:
+    """把台账补到 through (默认今天)，返回新增行数。不提交，由调用方 commit。
+
+    只处理填了年化的理财；没有年化的资产没有台账，估值时仍按市值反推。
+    """
+    through = through or date.today()
+    A, T, F = models.Asset, models.AssetTransaction, models.FixedAccrual
+    q = db.query(A.id, A.apy, A.interest_mode, A.value_lag, A.holiday_rule).filter(A.asset_type == "fixed", A.apy > 0)
+    if asset_ids is not None:
+        q = q.filter(A.id.in_(list(asset_ids)))
+    assets = {a.id: a for a in q.all()}
+    if not assets:
+        return 0
+    lots = db.query(T.id, T.asset_id, T.date, T.amount).filter(T.asset_id.in_(list(assets))).all()
+    # 每笔明细最近一条入账
+    last = {r.lot_id: (r.date, r.accrued) for r in _latest_entries(db, list(assets))}
+
+    new_rows: List[Dict[str, Any]] = []
+    for lot in lots:
+        if not lot.date or not lot.amount:
+            continue
+        asset = assets[lot.asset_id]
+        mode, lag, rule = _normalize(asset)
+        for d, days, interest, accrued in accrue_lot(lot.amount, asset.apy, mode, rule,
+                                                     value_date(lot.date, lag), through, last.get(lot.id)):
+            new_rows.append({"asset_id": lot.asset_id, "lot_id": lot.id, "date": d, "days": days,
+                             "interest": interest, "accrued": accrued})
+    if new_rows:
+        db.execute(insert(F), new_rows)
+    return len(new_rows)
+
+
+def invalidate(db: Session, asset_id: int, lot_id: Optional[int] = None):
+    """删掉某资产 (或其中一笔明细) 的台账，下次 accrue 时从起息日重算。"""
+    F = models.FixedAccrual
+    q = db.query(F).filter(F.asset_id == asset_id)
+    if lot_id is not None:
+        q = q.filter(F.lot_id == lot_id)
+    q.delete(synchronize_session=False)
+
+
+def rebuild(db: Session, asset_id: int):
+    """明细或计息规则变动后：作废该资产的台账并立即补到今天。"""
+    invalidate(db, asset_id)
+    db.flush()
+    accrue(db, [asset_id])
+
+
+def accrue_all():
+    """日常任务：全部理财的台账补到今天。"""
+    db = SessionLocal()
+    try:
+        added = accrue(db)
+        db.commit()
+        if added:
+            print(f">>> [ACCRUAL] Appended {added} ledger rows")
+        return added
+    finally:
+        db.close()
+
+
+def register(jobs):
+    # 每天零点后入账当天的利息；进程重启后补上停机期间漏掉的天数
+    jobs.add("fixed_accrual", accrue_all, 'cron', hour=0, minute=5)
+    jobs.add("fixed_accrual_startup", accrue_all, 'date', run_date=timedelta(seconds=5))
+
+
+# ==========================================================
+# 查询
+# ==========================================================
+def _latest_entries(db: Session, asset_ids: List[int], on: Optional[date] = None) -> List[Any]:
+    """每笔明细截至 on (默认不限) 的最后一条入账：(asset_id, lot_id, date, interest, accrued)。
+
+    按明细逐笔走 (lot_id, date) 唯一索引取最后一行，耗时只和明细笔数有关，和持有天数无关。
+    """
+    T, F = models.AssetTransaction, models.FixedAccrual
+    last_id = select(F.id).where(F.lot_id == T.id)
+    if on is not None:
+        last_id = last_id.where(F.date <= on)
+    last_id = last_id.order_by(F.date.desc()).limit(1).correlate(T).scalar_subquery()
+    ids = select(last_id).where(T.asset_id.in_(asset_ids))
+    return db.query(F.asset_id, F.lot_id, F.date, F.interest, F.accrued).filter(F.id.in_(ids)).all()
+
+
+def summarize(db: Session, asset_ids: List[int], on: Optional[date] = None) -> Dict[int, Dict[str, Any]]:
+    """每个资产截至 on (默认今天) 的累计利息、当天入账利息，以及逐笔的累计利息。
+
+    累计利息直接读每笔最后一条入账的 accrued 列，不对整张台账求和。
+    台账覆盖的资产 (有年化、有明细) 还没到起息日、没有任何入账时也返回一条全 0 的记录，
+    估值按台账算 (当天 0 利息)，不会退回 市值 * 年化 / 365 的估算。
+    """
+    if not asset_ids:
+        return {}
+    on = on or date.today()
+    result: Dict[int, Dict[str, Any]] = {}
+    A, T = models.Asset, models.AssetTransaction
+    for (asset_id,) in db.query(T.asset_id).join(A, A.id == T.asset_id).filter(
+        T.asset_id.in_(asset_ids), A.apy > 0, T.date.isnot(None), T.amount != 0
+    ).distinct():
+        result[asset_id] = {"accrued": 0.0, "day_interest": 0.0, "lots": {}}
+    for asset_id, lot_id, d, interest, accrued in _latest_entries(db, asset_ids, on):
+        today = interest if d == on else 0.0
+        item = result.setdefault(asset_id, {"accrued": 0.0, "day_interest": 0.0, "lots": {}})
+        item["accrued"] += accrued or 0
+        item["day_interest"] += today or 0
+        item["lots"][lot_id] = {"accrued": accrued or 0, "day_interest": today or 0}
+    return result
+
+
+def ledger(db: Session, asset_id: int, start: Optional[date] = None, end: Optional[date] = None) -> List[Dict[str, Any]]:
+    """某资产按入账日汇总的台账 (各笔明细合计)。"""
+    F = models.FixedAccrual
+    q = db.query(F.date, func.sum(F.interest), func.sum(F.accrued)).filter(F.asset_id == asset_id)
+    if start:
+        q = q.filter(F.date >= start)
+    if end:
+        q = q.filter(F.date <= end)
+    return [
+        {"date": d.strftime("%Y-%m-%d"), "interest": interest, "accrued": accrued}
+        for d, interest, accrued in q.group_by(F.date).order_by(F.date).all()
+    ]
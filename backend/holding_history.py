@@ -0,0 +1,170 @@
+"""逐持仓日线：快照任务每天给每只持仓写一行，累计盈亏和时间加权收益指数在写入时接着上一行算好。
+
+日收益率 r = 当日盈亏 / (当日市值 - 当日盈亏)，即按期初市值计的收益，和当天是否加减仓无关；
+twr_index 按 (1 + r) 连乘，所以任意区间的收益只需要区间两端各查一行。
+非交易日 (周末、节假日手动推送) 行情里的涨跌幅还是上一个交易日的，这天的行当日盈亏记 0，
+累计盈亏和收益指数沿用前一行，避免同一天的涨跌被重复累加。
+"""
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import func, and_
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+import models
+import market_calendar
+import valuation
+
+SERIES_FIELDS = ("price", "quantity", "market_value", "day_profit", "cum_profit", "twr_index")
+PERIODS = ("1W", "1M", "3M", "6M", "YTD", "1Y", "ALL")
+
+
+def _daily_return(market_value: np.ndarray, day_profit: np.ndarray) -> np.ndarray:
+    base = market_value - day_profit
+    return np.divide(day_profit, base, out=np.zeros_like(day_profit), where=base > 0)
+
+
+def _previous_rows(db: Session, asset_ids: Sequence[int], day: date) -> Dict[int, Any]:
+    """每只持仓在 day 之前最近的一行 (asset_id, cum_profit, twr_index)。"""
+    H = models.HoldingHistory
+    prev = db.query(H.asset_id, func.max(H.date).label("d")).filter(
+        H.asset_id.in_(asset_ids), H.date < day
+    ).group_by(H.asset_id).subquery()
+    rows = db.query(H.asset_id, H.cum_profit, H.twr_index).join(
+        prev, and_(H.asset_id == prev.c.asset_id, H.date == prev.c.d)
+    ).all()
+    return {r.asset_id: r for r in rows}
+
+
+def record_day(db: Session, owner_id: int, day: date, result: "valuation.PortfolioValuation"):
+    """把一次估值结果写成 day 这天的逐持仓记录 (同一天重复写入会覆盖)。调用方负责 commit。"""
+    record_days(db, day, {owner_id: result})
+
+
+def record_days(db: Session, day: date, results: Dict[int, "valuation.PortfolioValuation"]):
+    """多个用户的估值结果一起写：前一天的记录只查一次，所有行合并成批量 UPSERT。调用方负责 commit。"""
+    owners: List[int] = []
+    asset_ids: List[int] = []
+    cols = {"asset_type": [], "code": [], "price": [], "quantity": [], "market_value": [], "day_profit": []}
+    for owner_id, result in results.items():
+        for cls in result.classes.values():
+            h = cls.holdings
+            if not len(h):
+                continue
+            owners.extend([owner_id] * len(h))
+            asset_ids.extend(h.ids)
+            cols["asset_type"].extend([cls.asset_type] * len(h))
+            cols["code"].extend(h.codes)
+            cols["price"].append(cls.price)
+            cols["quantity"].append(h.qty)
+            cols["market_value"].append(cls.market_value)
+            cols["day_profit"].append(cls.day_profit)
+    if not asset_ids:
+        return
+
+    price, qty, mv, day_profit = (np.concatenate(cols[k]) for k in ("price", "quantity", "market_value", "day_profit"))
+    if not market_calendar.is_trading_day(day):
+        day_profit = np.zeros_like(day_profit)
+    prev = _previous_rows(db, asset_ids, day)
+    prev_cum = np.array([prev[a].cum_profit if a in prev else 0.0 for a in asset_ids])
+    prev_twr = np.array([prev[a].twr_index if a in prev else 1.0 for a in asset_ids])
+    cum = prev_cum + day_profit
+    twr = prev_twr * (1 + _daily_return(mv, day_profit))
+
+    rows = [{
+        "owner_id": o, "asset_id": a, "asset_type": t, "code": c, "date": day,
+        "price": p, "quantity": q, "market_value": m, "day_profit": d, "cum_profit": cp, "twr_index": tw,
+    } for o, a, t, c, p, q, m, d, cp, tw in zip(
+        owners, asset_ids, cols["asset_type"], cols["code"], price.tolist(), qty.tolist(), mv.tolist(),
+        day_profit.tolist(), cum.tolist(), twr.tolist())]
+    # 一条语句 executemany：多用户时行数上千，拼成多行 VALUES 的编译开销比写入本身还大
+    stmt = insert(models.HoldingHistory)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["asset_id", "date"],
+        set_={k: stmt.excluded[k] for k in ("price", "quantity", "market_value", "day_profit", "cum_profit", "twr_index")},
+    ), rows)
+
+    # 正常情况下 day 就是最新一天；如果是补写过去的日子，后面的行要接着重算
+    H = models.HoldingHistory
+    later = [a for (a,) in db.query(H.asset_id).filter(H.asset_id.in_(asset_ids), H.date > day).distinct().all()]
+    if later:
+        rebuild(db, later)
+
+
+def rebuild(db: Session, asset_ids: Sequence[int]):
+    """按日期顺序整条重算这些持仓的 cum_profit / twr_index (cumsum / cumprod)。调用方负责 commit。"""
+    H = models.HoldingHistory
+    rows = db.query(H.id, H.asset_id, H.market_value, H.day_profit).filter(
+        H.asset_id.in_(asset_ids)
+    ).order_by(H.asset_id, H.date).all()
+    if not rows:
+        return
+    ids = np.array([r.id for r in rows])
+    owner = np.array([r.asset_id for r in rows])
+    mv = np.array([r.market_value or 0.0 for r in rows])
+    day_profit = np.array([r.day_profit or 0.0 for r in rows])
+    growth = 1 + _daily_return(mv, day_profit)
+
+    starts = np.flatnonzero(np.r_[True, owner[1:] != owner[:-1]])
+    cum = np.empty_like(day_profit)
+    twr = np.empty_like(growth)
+    for s, e in zip(starts, np.r_[starts[1:], len(rows)]):
+        cum[s:e] = np.cumsum(day_profit[s:e])
+        twr[s:e] = np.cumprod(growth[s:e])
+    db.bulk_update_mappings(H, [
+        {"id": i, "cum_profit": c, "twr_index": t} for i, c, t in zip(ids.tolist(), cum.tolist(), twr.tolist())
+    ])
+
+
+# ==========================================================
+# 查询
+# ==========================================================
+def series(db: Session, asset_id: int, start: Optional[date] = None, end: Optional[date] = None) -> Dict[str, list]:
+    H = models.HoldingHistory
+    q = db.query(H.date, *[getattr(H, f) for f in SERIES_FIELDS]).filter(H.asset_id == asset_id)
+    if start:
+        q = q.filter(H.date >= start)
+    if end:
+        q = q.filter(H.date <= end)
+    rows = q.order_by(H.date).all()
+    data: Dict[str, list] = {"date": [r[0].strftime("%Y-%m-%d") for r in rows]}
+    for i, f in enumerate(SERIES_FIELDS, start=1):
+        data[f] = [r[i] for r in rows]
+    return data
+
+
+def _period_start(period: str, end: date) -> Optional[date]:
+    days = {"1W": 7, "1M": 30, "3M": 91, "6M": 182, "1Y": 365}
+    if period in days:
+        return end - timedelta(days=days[period])
+    if period == "YTD":
+        return date(end.year, 1, 1) - timedelta(days=1)
+    return None  # ALL
+
+
+def period_returns(db: Session, asset_id: int, periods: Sequence[str] = PERIODS) -> Dict[str, Any]:
+    """各区间的时间加权收益和盈亏：期末一行 + 每个区间的期初一行，都是索引点查。"""
+    H = models.HoldingHistory
+    last = db.query(H.date, H.cum_profit, H.twr_index).filter(H.asset_id == asset_id).order_by(H.date.desc()).first()
+    if not last:
+        return {"as_of": None, "periods": {}}
+
+    res = {}
+    for period in periods:
+        start = _period_start(period, last.date)
+        base = None
+        if start is not None:
+            # 期初取区间开始那天 (含) 之前最近的一行；持仓比区间还新就从建仓算起
+            base = db.query(H.date, H.cum_profit, H.twr_index).filter(
+                H.asset_id == asset_id, H.date <= start
+            ).order_by(H.date.desc()).first()
+        base_twr = base.twr_index if base else 1.0
+        base_cum = base.cum_profit if base else 0.0
+        res[period] = {
+            "from": base.date.strftime("%Y-%m-%d") if base else None,
+            "return": (last.twr_index / base_twr - 1) * 100 if base_twr else 0.0,
+            "profit": last.cum_profit - base_cum,
+        }
+    return {"as_of": last.date.strftime("%Y-%m-%d"), "periods": res}
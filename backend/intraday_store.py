@@ -0,0 +1,187 @@
+import asyncio
+import os
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy.dialects.sqlite import insert
+
+import models
+import market_calendar
+import metrics
+import valuation
+from database import SessionLocal
+from market_engine import MarketEngine
+
+VALUE_FIELDS = ("total_asset", "day_profit", "stock_value", "fund_value", "fixed_value")
+BAR_FIELDS = ("open", "high", "low", "close", "day_profit", "stock_value", "fund_value", "fixed_value")
+
+
+def _cents(v: float) -> int:
+    return int(round(v * 100))
+
+
+def _day_start_ts(d: date) -> int:
+    return int(time.mktime(d.timetuple()))
+
+
+class IntradayStore:
+    """盘中组合估值曲线。
+
+    交易时段内每 interval 秒给每个有持仓的用户采一个点，写入 intraday_points 窄表
+    (整数时间戳 + 整数分，WITHOUT ROWID)；超过 raw_days 天的采样每晚压缩成
+    bar_minutes 分钟一根的 OHLC 柱 (intraday_bars)，原始点随即删除，多年的数据也只有几万行。
+    """
+    def __init__(self, engine: MarketEngine, interval: Optional[int] = None,
+                 raw_days: Optional[int] = None, bar_minutes: Optional[int] = None):
+        self.engine = engine
+        self.interval = interval or int(os.environ.get("PACC_INTRADAY_INTERVAL", "60"))
+        self.raw_days = raw_days or int(os.environ.get("PACC_INTRADAY_RAW_DAYS", "7"))
+        self.bar_seconds = (bar_minutes or int(os.environ.get("PACC_INTRADAY_BAR_MINUTES", "30"))) * 60
+
+    def register(self, jobs):
+        jobs.add("intraday_sample", self.sample, 'interval', seconds=self.interval)
+        jobs.add("intraday_compact", self.compact, 'cron', hour=23, minute=50)
+
+    # ==========================================================
+    # 采样
+    # ==========================================================
+    @metrics.timed_job("intraday_sample")
+    async def sample(self, now: Optional[datetime] = None) -> int:
+        now = now or datetime.now()
+        if not market_calendar.is_trading_time(now):
+            return 0
+        ts = int(now.timestamp()) // self.interval * self.interval
+
+        # 查库、估值、写库都在线程池里，事件循环上只等行情
+        loop = asyncio.get_running_loop()
+        holdings = await loop.run_in_executor(None, self._load_holdings)
+        if not holdings:
+            return 0
+
+        # 所有用户的代码合并成一次行情请求
+        stock_codes, fund_codes = valuation.union_codes(holdings)
+        market = await self.engine.get_real_time_data(stock_codes, fund_codes)
+        return await loop.run_in_executor(None, self._store_points, holdings, market, now, ts)
+
+    @staticmethod
+    def _load_holdings() -> Dict[int, Dict[str, valuation.HoldingColumns]]:
+        db = SessionLocal()
+        try:
+            return valuation.load_all_holdings(db)
+        finally:
+            db.close()
+
+    @staticmethod
+    def _store_points(holdings: Dict[int, Dict[str, valuation.HoldingColumns]], market: Dict[str, Any],
+                      now: datetime, ts: int) -> int:
+        rows = []
+        for owner_id, h in holdings.items():
+            v = valuation.value_portfolio(h, market, now.date())
+            rows.append({
+                "owner_id": owner_id, "ts": ts,
+                "total_asset": _cents(v.total_market_value),
+                "day_profit": _cents(v.total_day_profit),
+                "stock_value": _cents(v["stock"].total_market_value),
+                "fund_value": _cents(v["fund"].total_market_value),
+                "fixed_value": _cents(v["fixed"].total_market_value),
+            })
+
+        db = SessionLocal()
+        try:
+            stmt = insert(models.IntradayPoint)
+            # 同一采样槽重复触发时覆盖
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=["owner_id", "ts"],
+                set_={f: stmt.excluded[f] for f in VALUE_FIELDS},
+            ), rows)
+            db.commit()
+        finally:
+            db.close()
+        return len(rows)
+
+    # ==========================================================
+    # 压缩
+    # ==========================================================
+    def compact(self, today: Optional[date] = None) -> int:
+        """把 raw_days 天以前的采样压缩成 OHLC 柱，返回生成的柱数。"""
+        today = today or date.today()
+        cutoff = _day_start_ts(today - timedelta(days=self.raw_days))
+        P = models.IntradayPoint
+        db = SessionLocal()
+        try:
+            rows = db.query(P.owner_id, P.ts, *[getattr(P, f) for f in VALUE_FIELDS]).filter(
+                P.ts < cutoff
+            ).order_by(P.owner_id, P.ts).all()
+            if not rows:
+                return 0
+            bars = self._to_bars(np.array(rows, dtype=np.int64))
+            # 分块写入，避免单条语句超过 SQLite 的参数个数上限
+            for i in range(0, len(bars), 1000):
+                stmt = insert(models.IntradayBar).values(bars[i:i + 1000])
+                # 柱已存在 (上次压缩后又补采了同一时段) 时以新算的为准
+                db.execute(stmt.on_conflict_do_update(
+                    index_elements=["owner_id", "ts"],
+                    set_={f: stmt.excluded[f] for f in BAR_FIELDS},
+                ))
+            db.query(P).filter(P.ts < cutoff).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+        print(f"Intraday compact: {len(rows)} points -> {len(bars)} bars")
+        return len(bars)
+
+    def _to_bars(self, arr: np.ndarray) -> List[Dict[str, Any]]:
+        # arr 列: owner_id, ts, total_asset, day_profit, stock_value, fund_value, fixed_value (已按 owner, ts 排序)
+        owner, ts, total = arr[:, 0], arr[:, 1], arr[:, 2]
+        bucket = ts - ts % self.bar_seconds
+        # 每根柱的起止下标
+        boundary = np.flatnonzero((np.diff(owner) != 0) | (np.diff(bucket) != 0)) + 1
+        starts = np.concatenate(([0], boundary))
+        ends = np.concatenate((boundary, [len(arr)])) - 1
+        high = np.maximum.reduceat(total, starts)
+        low = np.minimum.reduceat(total, starts)
+        return [{
+            "owner_id": int(owner[s]), "ts": int(bucket[s]),
+            "open": int(total[s]), "high": int(hi), "low": int(lo), "close": int(total[e]),
+            "day_profit": int(arr[e, 3]), "stock_value": int(arr[e, 4]),
+            "fund_value": int(arr[e, 5]), "fixed_value": int(arr[e, 6]),
+        } for s, e, hi, lo in zip(starts.tolist(), ends.tolist(), high.tolist(), low.tolist())]
+
+    # ==========================================================
+    # 查询
+    # ==========================================================
+    def query(self, owner_id: int, start: date, end: date) -> Dict[str, Any]:
+        """[start, end] 日期范围内的曲线，按列返回 (金额单位：元)。
+
+        较新的日子在 points 里是原始采样，已压缩的日子在 bars 里是 OHLC 柱。
+        """
+        lo, hi = _day_start_ts(start), _day_start_ts(end + timedelta(days=1))
+        P, B = models.IntradayPoint, models.IntradayBar
+        db = SessionLocal()
+        try:
+            points = db.query(P.ts, *[getattr(P, f) for f in VALUE_FIELDS]).filter(
+                P.owner_id == owner_id, P.ts >= lo, P.ts < hi
+            ).order_by(P.ts).all()
+            bars = db.query(B.ts, *[getattr(B, f) for f in BAR_FIELDS]).filter(
+                B.owner_id == owner_id, B.ts >= lo, B.ts < hi
+            ).order_by(B.ts).all()
+        finally:
+            db.close()
+        return {
+            "interval": self.interval,
+            "bar_seconds": self.bar_seconds,
+            "points": self._columns(points, VALUE_FIELDS),
+            "bars": self._columns(bars, BAR_FIELDS),
+        }
+
+    @staticmethod
+    def _columns(rows, fields) -> Dict[str, list]:
+        if not rows:
+            return {"ts": [], **{f: [] for f in fields}}
+        arr = np.array(rows, dtype=np.int64)
+        data = {"ts": arr[:, 0].tolist()}
+        for i, f in enumerate(fields, start=1):
+            data[f] = (arr[:, i] / 100).tolist()
+        return data
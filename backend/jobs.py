@@ -0,0 +1,225 @@
+import asyncio
+import os
+import secrets
+import socket
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from sqlalchemy import func, select, text
+
+import models
+from database import SessionLocal, engine as db_engine
+
+
+class JobRunner:
+    """定时任务子系统：APScheduler 的 AsyncIOScheduler 跑在应用自己的事件循环上。
+
+    多个 uvicorn worker 各有一份调度器，但单例任务 (抓行情、写快照、推送) 只在持有
+    job_leases 表里主节点租约的 worker 上执行；主节点每 HEARTBEAT 秒续租一次，
+    进程退出或卡死超过 LEASE_TTL 秒后由其他 worker 接手。每次执行都记进 job_runs。
+    singleton=False 的任务 (如刷新进程内的索引) 每个 worker 都会执行，不记录历史。
+    """
+    LEASE_NAME = "scheduler"
+    LEASE_TTL = 45
+    HEARTBEAT = 15
+    # 每个任务保留最近多少条执行记录
+    KEEP_RUNS = 200
+    # 错过触发时间多久以内仍然补跑 (秒)
+    MISFIRE_GRACE = 300
+
+    def __init__(self):
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(3)}"
+        self.is_leader = False
+        self._jobs: List[Dict[str, Any]] = []
+        self._scheduler: Optional[AsyncIOScheduler] = None
+        self._running: Dict[str, datetime] = {}
+        self._last_purge = 0.0
+
+    def add(self, name: str, func: Callable, trigger: str, singleton: bool = True, **trigger_args):
+        """注册任务。func 可以是协程函数 (在事件循环上执行) 或普通函数 (在线程池里执行)。
+
+        'date' 任务的 run_date 可以给 timedelta，表示调度器启动后多久执行 (启动慢也不会错过)。
+        """
+        job = {"name": name, "func": func, "trigger": trigger, "singleton": singleton, "args": trigger_args}
+        self._jobs.append(job)
+        if self._scheduler is not None:
+            self._schedule(job)
+
+    async def start(self):
+        """在当前事件循环上启动调度器 (应用 startup 时调用)。"""
+        self._scheduler = AsyncIOScheduler(event_loop=asyncio.get_running_loop())
+        # 先确定自己是不是主节点，再开始触发任务 (抢租约要写库，放到线程池里)
+        await self._heartbeat_async()
+        self._scheduler.add_job(self._heartbeat_async, 'interval', seconds=self.HEARTBEAT, id="_lease_heartbeat")
+        for job in self._jobs:
+            self._schedule(job)
+        self._scheduler.start()
+        print(f">>> [JOBS] Scheduler started on {self.owner} ({'leader' if self.is_leader else 'follower'})")
+
+    def shutdown(self, wait: bool = True):
+        if self._scheduler is not None and self._scheduler.running:
+            self._scheduler.shutdown(wait=False)
+        if self.is_leader:
+            # 主动让出租约，其他 worker 下一次心跳就能接手
+            self._release()
+
+    def _schedule(self, job: Dict[str, Any]):
+        args = dict(job["args"])
+        if isinstance(args.get("run_date"), timedelta):
+            args["run_date"] = datetime.now() + args["run_date"]
+        self._scheduler.add_job(
+            self._wrap(job["name"], job["func"], job["singleton"]), job["trigger"],
+            id=job["name"], name=job["name"], max_instances=1, coalesce=True,
+            misfire_grace_time=self.MISFIRE_GRACE, replace_existing=True, **args,
+        )
+
+    def _wrap(self, name: str, func: Callable, singleton: bool):
+        async def run():
+            if singleton and not self.is_leader:
+                return
+            loop = asyncio.get_running_loop()
+            run_id = await loop.run_in_executor(None, self._record_start, name) if singleton else None
+            self._running[name] = datetime.now()
+            start = time.perf_counter()
+            status, error = "ok", None
+            try:
+                if asyncio.iscoroutinefunction(func):
+                    await func()
+                else:
+                    await loop.run_in_executor(None, func)
+            except Exception as e:
+                status, error = "error", f"{type(e).__name__}: {e}"
+                print(f"Job {name} failed: {error}")
+            finally:
+                self._running.pop(name, None)
+                if run_id is not None:
+                    await loop.run_in_executor(None, self._record_finish, name, run_id, status, error, time.perf_counter() - start)
+        return run
+
+    # ==========================================================
+    # 主节点租约
+    # ==========================================================
+    async def _heartbeat_async(self):
+        await asyncio.get_running_loop().run_in_executor(None, self._heartbeat)
+
+    def _heartbeat(self):
+        """抢占或续租：租约空着、已过期或本来就是自己的才会写成功。"""
+        now = time.time()
+        try:
+            with db_engine.begin() as conn:
+                conn.execute(text(
+                    "INSERT INTO job_leases (name, owner, expires_at, acquired_at) VALUES (:n, :o, :e, :t) "
+                    "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at, "
+                    "acquired_at = CASE WHEN job_leases.owner = excluded.owner THEN job_leases.acquired_at ELSE excluded.acquired_at END "
+                    "WHERE job_leases.owner = excluded.owner OR job_leases.expires_at < :t"
+                ), {"n": self.LEASE_NAME, "o": self.owner, "e": now + self.LEASE_TTL, "t": now})
+                holder = conn.execute(text("SELECT owner FROM job_leases WHERE name = :n"), {"n": self.LEASE_NAME}).scalar()
+        except Exception as e:
+            # 数据库忙/出错时保守处理：本轮不当主节点，下次心跳再试
+            print(f"Job lease heartbeat failed: {e}")
+            holder = None
+        leader = holder == self.owner
+        if leader != self.is_leader:
+            print(f">>> [JOBS] {self.owner} {'became leader' if leader else 'lost leadership'}")
+        self.is_leader = leader
+
+    def _release(self):
+        try:
+            with db_engine.begin() as conn:
+                conn.execute(text("UPDATE job_leases SET expires_at = 0 WHERE name = :n AND owner = :o"),
+                             {"n": self.LEASE_NAME, "o": self.owner})
+        except Exception as e:
+            print(f"Job lease release failed: {e}")
+        self.is_leader = False
+
+    # ==========================================================
+    # 执行记录
+    # ==========================================================
+    def _record_start(self, name: str) -> Optional[int]:
+        db = SessionLocal()
+        try:
+            run = models.JobRun(name=name, owner=self.owner, started_at=datetime.now(), status="running")
+            db.add(run)
+            db.commit()
+            return run.id
+        except Exception as e:
+            print(f"Job run record failed: {e}")
+            return None
+        finally:
+            db.close()
+
+    def _record_finish(self, name: str, run_id: int, status: str, error: Optional[str], duration: float):
+        R = models.JobRun
+        db = SessionLocal()
+        try:
+            db.query(R).filter(R.id == run_id).update({
+                "status": status, "error": error[:500] if error else None,
+                "finished_at": datetime.now(), "duration": duration,
+            }, synchronize_session=False)
+            self._purge(db)
+            db.commit()
+        except Exception as e:
+            print(f"Job run record failed: {e}")
+        finally:
+            db.close()
+
+    def _purge(self, db):
+        # 每小时按任务裁掉旧记录，只留最近 KEEP_RUNS 条
+        if time.monotonic() - self._last_purge < 3600:
+            return
+        self._last_purge = time.monotonic()
+        R = models.JobRun
+        for (name,) in db.query(R.name).distinct().all():
+            cutoff = db.query(R.id).filter(R.name == name).order_by(R.id.desc()).offset(self.KEEP_RUNS).limit(1).scalar()
+            if cutoff:
+                db.query(R).filter(R.name == name, R.id <= cutoff).delete(synchronize_session=False)
+
+    # ==========================================================
+    # 查询
+    # ==========================================================
+    @staticmethod
+    def _run_dict(r) -> Dict[str, Any]:
+        return {
+            "id": r.id, "name": r.name, "owner": r.owner, "status": r.status, "error": r.error,
+            "started_at": r.started_at.isoformat() if r.started_at else None,
+            "finished_at": r.finished_at.isoformat() if r.finished_at else None,
+            "duration": r.duration,
+        }
+
+    def status(self) -> Dict[str, Any]:
+        """各任务的下次触发时间和最近一次执行结果，以及当前主节点。"""
+        R, L = models.JobRun, models.JobLease
+        db = SessionLocal()
+        try:
+            lease = db.query(L).filter(L.name == self.LEASE_NAME).first()
+            latest = select(func.max(R.id)).group_by(R.name)
+            last_runs = {r.name: self._run_dict(r) for r in db.query(R).filter(R.id.in_(latest)).all()}
+        finally:
+            db.close()
+        jobs = []
+        for job in self._jobs:
+            scheduled = self._scheduler.get_job(job["name"]) if self._scheduler else None
+            next_run = scheduled.next_run_time if scheduled else None
+            jobs.append({
+                "name": job["name"],
+                "singleton": job["singleton"],
+                "next_run_time": next_run.isoformat() if next_run else None,
+                "running_since": self._running[job["name"]].isoformat() if job["name"] in self._running else None,
+                "last_run": last_runs.get(job["name"]),
+            })
+        return {
+            "worker": self.owner,
+            "is_leader": self.is_leader,
+            "leader": lease.owner if lease and lease.expires_at > time.time() else None,
+            "jobs": jobs,
+        }
+
+    def runs(self, name: str, limit: int = 50) -> List[Dict[str, Any]]:
+        R = models.JobRun
+        db = SessionLocal()
+        try:
+            return [self._run_dict(r) for r in db.query(R).filter(R.name == name).order_by(R.id.desc()).limit(limit).all()]
+        finally:
+            db.close()
@@ -2,27 +2,55 @@ import time
 import asyncio
 import random
 from typing import List, Dict, Optional, Any
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, BackgroundTasks, Depends, File, Form, HTTPException, Query, Request, UploadFile, status
+from fastapi.responses import StreamingResponse, PlainTextResponse, Response
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy import text, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from passlib.context import CryptContext
-from apscheduler.schedulers.background import BackgroundScheduler
 from pydantic import BaseModel
 from datetime import timedelta, datetime, date
 import httpx
-import requests 
 import re
 import json
+import hashlib
+import numpy as np
 import models
+import metrics
 from database import engine as db_engine, SessionLocal
 from market_engine import MarketEngine
-
-# --- 1. 初始化配置 ---
-models.Base.metadata.create_all(bind=db_engine)
+from nav_store import NavStore
+from market_stream import MarketStreamHub
+from market_scheduler import MarketRefreshScheduler
+from intraday_store import IntradayStore
+from price_backfill import PriceBackfill
+from security_master import SecurityMaster
+from webhook_outbox import WebhookOutbox
+from jobs import JobRunner
+import webhook_outbox as outbox
+import asset_transactions
+import asset_bulk
+import quote_cache
+import fixed_accrual
+import auth
+import migrations
+import valuation
+import downsample
+import holding_history
+import market_calendar
+
+# --- 1. 初始化配置 (建表/升级在 startup_event 里由 migrations 完成) ---
 app = FastAPI(title="PACC Backend - Ultimate Edition")
-market_engine = MarketEngine()
+market_engine = MarketEngine(nav_store=NavStore(), cache=quote_cache.open_cache())
+market_stream = MarketStreamHub(market_engine)
+market_scheduler = MarketRefreshScheduler(market_engine)
+intraday_store = IntradayStore(market_engine)
+price_backfill = PriceBackfill(market_engine)
+security_master = SecurityMaster(market_engine)
+webhook_outbox = WebhookOutbox()
+scheduler = JobRunner()
 
 # 允许跨域
 app.add_middleware(
@@ -33,6 +61,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 接口耗时打点，route 取路由模板 (如 /api/assets/{code})，避免标签基数爆炸
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        metrics.HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            method=request.method, route=getattr(route, "path", "unmatched"), status=str(status_code),
+        )
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
@@ -51,80 +95,127 @@ class AssetCreate(BaseModel):
     tag: str = "稳健"
     start_date: Optional[str] = None
     apy: Optional[float] = None
+    # 理财计息规则 (见 fixed_accrual)：simple/compound、T+N 起息、calendar/defer/skip
+    interest_mode: Optional[str] = None
+    value_lag: Optional[int] = None
+    holiday_rule: Optional[str] = None
     # 🔴【核心修改】必须有这个，否则前端传来的明细会被丢弃
     extra: Optional[str] = None
 
+class TransactionCreate(BaseModel):
+    date: str    # YYYY-MM-DD
+    amount: float
+
 class ConfigUpdate(BaseModel):
     webhook_url: str
 
+class WebhookTarget(BaseModel):
+    url: str
+    format: Optional[str] = None  # 不填按域名识别
+
+class WebhookTargets(BaseModel):
+    targets: List[WebhookTarget]
+
+class PasswordChange(BaseModel):
+    old_password: str
+    new_password: str
+
+class UserCreate(BaseModel):
+    username: str
+    password: str
+
+class BackfillRequest(BaseModel):
+    start: str                 # YYYY-MM-DD
+    end: Optional[str] = None  # 默认今天
+    replay: bool = True        # 补完价格后顺带重放这段时间缺失的快照
+    overwrite: bool = False    # 重放时覆盖已有快照
+
 # --- 3. 启动时的数据库自动维护 ---
 @app.on_event("startup")
 def startup_event():
+    # 1. 表结构：schema_version 已是最新时只有一次只读查询，不再逐个探测字段
+    try:
+        migrations.run(db_engine)
+    except Exception as e:
+        print(f"Database migration failed: {e}")
+
+    # 2. 首次启动创建管理员；已存在就不碰 (bcrypt 哈希/校验都要上百毫秒，重启时没必要)
     db = SessionLocal()
     try:
-        # 1. 自动创建/重置管理员
-        hashed = pwd_context.hash("admin888")
-        user = db.query(models.User).filter(models.User.username == "admin").first()
-        if not user:
+        if not db.query(models.User.id).filter(models.User.username == "admin").first():
             print(">>> [INIT] Creating admin user...")
-            db.add(models.User(username="admin", hashed_password=hashed))
-        else:
-            user.hashed_password = hashed
-        
-        # 2. 【核心】自动检测并修复数据库字段
-        with db_engine.connect() as conn:
-            # 2.1 检查 assets 表是否有 extra 字段
-            try:
-                # 尝试查询 extra 字段，如果报错说明不存在
-                conn.execute(text("SELECT extra FROM assets LIMIT 1"))
-            except Exception:
-                print(">>> [AUTO-FIX] Adding 'extra' column to assets table...")
-                try:
-                    conn.execute(text("ALTER TABLE assets ADD COLUMN extra VARCHAR"))
-                    conn.commit()
-                    print(">>> [AUTO-FIX] Success: 'extra' column added.")
-                except Exception as e:
-                    print(f">>> [AUTO-FIX] Failed adding extra: {e}")
-
-            # 2.2 检查 asset_history 表的新字段
-            try:
-                conn.execute(text("SELECT stock_profit FROM asset_history LIMIT 1"))
-            except Exception:
-                print(">>> [AUTO-FIX] Upgrading asset_history table...")
-                try:
-                    conn.execute(text("ALTER TABLE asset_history ADD COLUMN total_principal FLOAT DEFAULT 0"))
-                    conn.execute(text("ALTER TABLE asset_history ADD COLUMN stock_profit FLOAT DEFAULT 0"))
-                    conn.execute(text("ALTER TABLE asset_history ADD COLUMN fund_profit FLOAT DEFAULT 0"))
-                    conn.execute(text("ALTER TABLE asset_history ADD COLUMN fixed_profit FLOAT DEFAULT 0"))
-                    conn.commit()
-                except Exception as e:
-                    print(f">>> [AUTO-FIX] History upgrade failed: {e}")
-
-        db.commit()
+            db.add(models.User(username="admin", hashed_password=pwd_context.hash("admin888")))
+            db.commit()
     except Exception as e:
-        print(f"Startup maintenance failed: {e}")
+        db.rollback()
+        print(f"Admin bootstrap failed: {e}")
     finally:
         db.close()
 
+@app.on_event("startup")
+async def start_background_workers():
+    # 定时任务和发件箱投递协程都跑在应用自己的事件循环上
+    await scheduler.start()
+    webhook_outbox.start()
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    scheduler.shutdown()
+    await webhook_outbox.stop()
+
 # --- 4. 认证模块 ---
 def verify_password(plain, hashed): return pwd_context.verify(plain, hashed)
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.username == "admin").first()
-    if not user: raise HTTPException(status_code=401, detail="Invalid auth")
+def get_current_user(token: str = Depends(oauth2_scheme)) -> auth.AuthUser:
+    # 只验签 + 查内存里的用户缓存，不开数据库会话
+    user = auth.authenticate(token)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid auth", headers={"WWW-Authenticate": "Bearer"})
     return user
 
+def get_current_user_from_query(token: str) -> auth.AuthUser:
+    # EventSource 无法自定义请求头，SSE 接口改从 ?token= 取凭证
+    return get_current_user(token)
+
 @app.post("/token")
 async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     user = db.query(models.User).filter(models.User.username == form_data.username).first()
     if not user or not verify_password(form_data.password, user.hashed_password):
         raise HTTPException(status_code=400, detail="Incorrect username or password")
-    return {"access_token": user.username, "token_type": "bearer"}
+    return {"access_token": auth.create_access_token(user), "token_type": "bearer"}
+
+@app.post("/api/auth/password")
+def change_password(req: PasswordChange, db: Session = Depends(get_db), user: auth.AuthUser = Depends(get_current_user)):
+    target = db.query(models.User).filter(models.User.id == user.id).first()
+    if not target or not verify_password(req.old_password, target.hashed_password):
+        raise HTTPException(status_code=400, detail="Incorrect password")
+    if len(req.new_password) < 6:
+        raise HTTPException(status_code=400, detail="Password must be at least 6 characters")
+    target.hashed_password = pwd_context.hash(req.new_password)
+    db.commit()
+    # 旧令牌里的密码指纹对不上了，立即失效
+    auth.invalidate(user.id)
+    return {"access_token": auth.create_access_token(target), "token_type": "bearer"}
+
+@app.post("/api/users")
+def create_user(req: UserCreate, db: Session = Depends(get_db), user: auth.AuthUser = Depends(get_current_user)):
+    # 只有管理员能开新账号；每个账号的资产、历史、推送互相隔离
+    if user.username != "admin":
+        raise HTTPException(status_code=403, detail="Only admin can create users")
+    username = req.username.strip()
+    if not username or len(req.password) < 6:
+        raise HTTPException(status_code=400, detail="Username required and password must be at least 6 characters")
+    if db.query(models.User).filter(models.User.username == username).first():
+        raise HTTPException(status_code=400, detail="Username already exists")
+    new_user = models.User(username=username, hashed_password=pwd_context.hash(req.password))
+    db.add(new_user)
+    db.commit()
+    return {"status": "ok", "id": new_user.id, "username": new_user.username}
 
 # --- 5. 资产管理接口 ---
 
 @app.post("/api/assets")
-def add_or_increase_asset(asset: AssetCreate, db: Session = Depends(get_db), user: models.User = Depends(get_current_user)):
+def add_or_increase_asset(asset: AssetCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db), user: auth.AuthUser = Depends(get_current_user)):
     # 先查重
     existing = db.query(models.Asset).filter(
         models.Asset.owner_id == user.id, 
@@ -145,25 +236,62 @@ def add_or_increase_asset(asset: AssetCreate, db: Session = Depends(get_db), use
             existing.name = asset.name 
             # 如果是追加模式，这里可以选择是否覆盖 extra，目前逻辑是覆盖
             if asset.extra:
-                existing.extra = asset.extra
+                _store_extra(db, existing, asset.extra)
         else:
             existing.quantity = 0
     else:
-        # 新增资产：🔴 必须要把 extra 存进去
+        # 新增资产：理财的买入明细拆成 asset_transactions 行，其它 extra 原样保存
         new_asset = models.Asset(
             owner_id=user.id, asset_type=asset.asset_type, 
             name=asset.name, code=asset.code, 
             cost_price=asset.cost_price, quantity=asset.quantity, 
             tag=asset.tag, start_date=asset.start_date, apy=asset.apy,
-            extra=asset.extra 
+            interest_mode=asset.interest_mode or "simple", value_lag=asset.value_lag or 0,
+            holiday_rule=asset.holiday_rule or "calendar"
         )
+        _check_accrual_rules(new_asset)
         db.add(new_asset)
+        if asset.extra:
+            db.flush()
+            _store_extra(db, new_asset, asset.extra)
+        # 带过去起始日的股票/基金：后台补齐这段时间的历史价格
+        start_d = _parse_day(asset.start_date) if asset.start_date else None
+        if asset.asset_type in ("stock", "fund") and start_d and start_d < date.today():
+            codes = ([asset.code], []) if asset.asset_type == "stock" else ([], [asset.code])
+            background_tasks.add_task(price_backfill.backfill, *codes, start_d, date.today())
     
     db.commit()
     return {"status": "ok", "msg": "Asset updated"}
 
+def _parse_day(value: str) -> Optional[date]:
+    try:
+        return datetime.strptime(value[:10], "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+def _store_extra(db: Session, asset: models.Asset, extra: str):
+    lots = asset_transactions.parse_extra_lots(extra) if asset.asset_type == "fixed" else None
+    if lots is None:
+        asset.extra = extra
+        return
+    fixed_accrual.invalidate(db, asset.id)
+    asset_transactions.replace_lots(db, asset, lots)
+    asset.extra = None
+    db.flush()
+    if lots:
+        asset_transactions.sync_asset_totals(db, asset)
+        fixed_accrual.accrue(db, [asset.id])
+
+def _check_accrual_rules(asset: models.Asset):
+    if asset.interest_mode not in fixed_accrual.INTEREST_MODES:
+        raise HTTPException(status_code=400, detail=f"interest_mode must be one of {', '.join(fixed_accrual.INTEREST_MODES)}")
+    if asset.holiday_rule not in fixed_accrual.HOLIDAY_RULES:
+        raise HTTPException(status_code=400, detail=f"holiday_rule must be one of {', '.join(fixed_accrual.HOLIDAY_RULES)}")
+    if not 0 <= (asset.value_lag or 0) <= 30:
+        raise HTTPException(status_code=400, detail="value_lag must be between 0 and 30")
+
 @app.put("/api/assets/{code}")
-def update_asset_directly(code: str, asset: AssetCreate, db: Session = Depends(get_db), user: models.User = Depends(get_current_user)):
+def update_asset_directly(code: str, asset: AssetCreate, db: Session = Depends(get_db), user: auth.AuthUser = Depends(get_current_user)):
     target = db.query(models.Asset).filter(
         models.Asset.owner_id == user.id, 
         models.Asset.code == code, 
@@ -177,18 +305,46 @@ def update_asset_directly(code: str, asset: AssetCreate, db: Session = Depends(g
     target.name = asset.name
     target.tag = asset.tag
     if asset.start_date: target.start_date = asset.start_date
+    rules = (target.apy, target.interest_mode, target.value_lag, target.holiday_rule)
     if asset.apy is not None: target.apy = asset.apy
+    if asset.interest_mode is not None: target.interest_mode = asset.interest_mode
+    if asset.value_lag is not None: target.value_lag = asset.value_lag
+    if asset.holiday_rule is not None: target.holiday_rule = asset.holiday_rule
+    if target.asset_type == "fixed":
+        _check_accrual_rules(target)
     
-    # 🔴 更新逻辑：允许更新 extra 字段
+    # 🔴 更新逻辑：允许更新 extra 字段 (新前端改用明细接口逐笔增删，这里只为兼容整包提交)
     if asset.extra is not None: 
-        target.extra = asset.extra
+        _store_extra(db, target, asset.extra)
+    # 年化或计息规则变了：台账按新规则从起息日重算
+    if target.asset_type == "fixed" and rules != (target.apy, target.interest_mode, target.value_lag, target.holiday_rule):
+        fixed_accrual.rebuild(db, target.id)
     
     db.commit()
     return {"status": "updated"}
 
 @app.get("/api/assets")
-def read_assets(db: Session = Depends(get_db), user: models.User = Depends(get_current_user)):
-    assets = db.query(models.Asset).filter(models.Asset.owner_id == user.id).all()
+def read_assets(db: Session = Depends(get_db), user: auth.AuthUser = Depends(get_current_user)):
+    with metrics.STAGE_SECONDS.time(stage="read_assets.db"):
+        assets = db.query(models.Asset).filter(models.Asset.owner_id == user.id).all()
+        fixed = {a.id: a for a in assets if a.asset_type == 'fixed'}
+        lots: Dict[int, list] = {}
+        accruals: Dict[int, Dict[str, Any]] = {}
+        lot_summary: Dict[int, Dict[str, Any]] = {}
+        if fixed:
+            fixed_ids = list(fixed)
+            accruals = fixed_accrual.summarize(db, fixed_ids)
+            lot_summary = asset_transactions.summarize(db, fixed_ids)
+            today = date.today()
+            for t in db.query(models.AssetTransaction).filter(models.AssetTransaction.asset_id.in_(fixed_ids)).order_by(models.AssetTransaction.date).all():
+                # 每笔的起息日、计息天数、累计利息都由台账给出，前端不再自己算
+                vd = fixed_accrual.value_date(t.date, fixed[t.asset_id].value_lag or 0)
+                accrued = accruals.get(t.asset_id, {}).get("lots", {}).get(t.id, {})
+                lots.setdefault(t.asset_id, []).append({
+                    "id": t.id, "date": t.date.strftime("%Y-%m-%d"), "amount": t.amount,
+                    "value_date": vd.strftime("%Y-%m-%d"), "days": max(0, (today - vd).days + 1),
+                    "accrued": accrued.get("accrued", 0.0),
+                })
     res = {"stocks": [], "funds": [], "fixed_income": []}
     for a in assets:
         data = { 
@@ -201,255 +357,567 @@ def read_assets(db: Session = Depends(get_db), user: models.User = Depends(get_c
         }
         if a.asset_type == 'stock': res["stocks"].append(data)
         elif a.asset_type == 'fund': res["funds"].append(data)
-        elif a.asset_type == 'fixed': res["fixed_income"].append(data)
-    return res
+        elif a.asset_type == 'fixed':
+            # 买入明细已是结构化数据，前端不用再逐行 JSON.parse
+            data["transactions"] = lots.get(a.id, [])
+            data.update({
+                "interest_mode": a.interest_mode or "simple", "value_lag": a.value_lag or 0,
+                "holiday_rule": a.holiday_rule or "calendar",
+                # 没有台账 (未填年化或没有明细) 时为 null，前端按市值估算
+                "accrued_interest": accruals[a.id]["accrued"] if a.id in accruals else None,
+                "day_interest": accruals[a.id]["day_interest"] if a.id in accruals else None,
+                "days_held": lot_summary[a.id]["days_held"] if a.id in lot_summary else None,
+            })
+            res["fixed_income"].append(data)
+    with metrics.STAGE_SECONDS.time(stage="read_assets.serialize"):
+        body = json.dumps(res, ensure_ascii=False)
+    return Response(body, media_type="application/json")
 
 @app.delete("/api/assets/{asset_id}")
-def delete_asset(asset_id: int, db: Session = Depends(get_db), user: models.User = Depends(get_current_user)):
-    db.query(models.Asset).filter(
+def delete_asset(asset_id: int, db: Session = Depends(get_db), user: auth.AuthUser = Depends(get_current_user)):
+    deleted = db.query(models.Asset).filter(
         models.Asset.owner_id == user.id, 
         models.Asset.id == asset_id
     ).delete()
+    if deleted:
+        fixed_accrual.invalidate(db, asset_id)
+        db.query(models.AssetTransaction).filter(models.AssetTransaction.asset_id == asset_id).delete()
+        db.query(models.HoldingHistory).filter(models.HoldingHistory.asset_id == asset_id).delete()
     db.commit()
     return {"status": "deleted"}
 
+# --- 5.0 批量导入 / 导出 ---
+
+@app.post("/api/assets/bulk")
+async def import_assets(request: Request, background_tasks: BackgroundTasks, asset_type: str = "stock", skip_invalid: bool = False,
+                        mode: str = "merge", user: auth.AuthUser = Depends(get_current_user)):
+    # mode=merge 追加到已有持仓 (加权平均成本)，mode=replace 用文件覆盖已有持仓 (导出再导入结果不变)
+    if mode not in asset_bulk.MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(asset_bulk.MODES)}")
+    # 支持 multipart 上传 (file 字段) 或直接以 JSON / CSV 作为请求体
+    if request.headers.get("content-type", "").startswith("multipart/"):
+        upload = (await request.form()).get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Missing file")
+        filename, content = upload.filename or "", await upload.read()
+    else:
+        is_json = "json" in request.headers.get("content-type", "")
+        filename, content = ("upload.json" if is_json else "upload.csv"), await request.body()
+    try:
+        rows = asset_bulk.combine(asset_bulk.parse(filename, content, asset_type))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # 代码校验：先查内存证券主表，主表里没有的合并成一次行情请求
+    unknown = {"stock": [], "fund": []}
+    for r in rows:
+        if r["asset_type"] not in unknown:
+            continue
+        info = security_master.lookup(r["code"], r["asset_type"])
+        if info:
+            r["name"] = r["name"] or info["name"]
+        else:
+            unknown[r["asset_type"]].append(r)
+    invalid = []
+    if unknown["stock"] or unknown["fund"]:
+        try:
+            quotes = await market_engine.get_real_time_data([r["code"] for r in unknown["stock"]], [r["code"] for r in unknown["fund"]])
+        except Exception as e:
+            print(f"Bulk import quote check failed: {e}")
+            raise HTTPException(status_code=503, detail="Quote service unavailable, cannot validate codes")
+        for t, key in (("stock", "stocks"), ("fund", "funds")):
+            for r in unknown[t]:
+                quote = quotes[key].get(r["code"])
+                if quote and quote.get("name"):
+                    r["name"] = r["name"] or quote["name"]
+                else:
+                    invalid.append(r)
+    if invalid and not skip_invalid:
+        raise HTTPException(status_code=400, detail={
+            "msg": "Unknown codes", "invalid": [{"row": r["line"], "asset_type": r["asset_type"], "code": r["code"]} for r in invalid],
+        })
+    if invalid:
+        bad = {id(r) for r in invalid}
+        rows = [r for r in rows if id(r) not in bad]
+
+    def store():
+        db = SessionLocal()
+        try:
+            counts = asset_bulk.upsert(db, user.id, rows, mode)
+            db.commit()
+            return counts
+        finally:
+            db.close()
+    counts = await asyncio.get_running_loop().run_in_executor(None, store)
+    # 带过去起始日的股票/基金：后台一次补齐历史价格
+    ranges = asset_bulk.backfill_ranges(rows)
+    if ranges:
+        background_tasks.add_task(price_backfill.backfill, *ranges, date.today())
+    skipped = [{"row": r["line"], "asset_type": r["asset_type"], "code": r["code"], "reason": "unknown code"} for r in invalid]
+    skipped += [{"row": r["line"], "asset_type": r["asset_type"], "code": r["code"], "reason": "fixed income already exists, use mode=replace"}
+                for r in counts["skipped"]]
+    return {"status": "ok", "created": counts["created"], "updated": counts["updated"], "skipped": skipped}
+
+@app.get("/api/assets/bulk")
+def export_assets(format: str = "csv", db: Session = Depends(get_db), user: auth.AuthUser = Depends(get_current_user)):
+    if format not in ("csv", "json"):
+        raise HTTPException(status_code=400, detail="format must be csv or json")
+    rows = asset_bulk.export(db, user.id)
+    if format == "json":
+        return {"assets": rows}
+    return Response(asset_bulk.to_csv(rows), media_type="text/csv; charset=utf-8",
+                    headers={"Content-Disposition": f'attachment; filename="assets-{date.today():%Y%m%d}.csv"'})
+
+# --- 5.1 理财买入明细：逐笔增删，只动一行 ---
+
+def _get_owned_asset(db: Session, user: auth.AuthUser, asset_id: int) -> models.Asset:
+    target = db.query(models.Asset).filter(models.Asset.owner_id == user.id, models.Asset.id == asset_id).first()
+    if not target: raise HTTPException(status_code=404, detail="Asset not found")
+    return target
+
+@app.get("/api/assets/{asset_id}/transactions")
+def list_transactions(asset_id: int, db: Session = Depends(get_db), user: auth.AuthUser = Depends(get_current_user)):
+    _get_owned_asset(db, user, asset_id)
+    rows = db.query(models.AssetTransaction).filter(models.AssetTransaction.asset_id == asset_id).order_by(models.AssetTransaction.date).all()
+    return {
+        "transactions": [{"id": t.id, "date": t.date.strftime("%Y-%m-%d"), "amount": t.amount} for t in rows],
+        "summary": asset_transactions.summarize(db, [asset_id]).get(asset_id),
+    }
+
+@app.post("/api/assets/{asset_id}/transactions")
+def append_transaction(asset_id: int, tx: TransactionCreate, db: Session = Depends(get_db), user: auth.AuthUser = Depends(get_current_user)):
+    target = _get_owned_asset(db, user, asset_id)
+    try:
+        tx_date = datetime.strptime(tx.date, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date, expected YYYY-MM-DD")
+    row = models.AssetTransaction(asset_id=asset_id, date=tx_date, amount=tx.amount)
+    db.add(row)
+    db.flush()
+    summary = asset_transactions.sync_asset_totals(db, target)
+    # 新的一笔从自己的起息日补到今天，其它明细的台账不动
+    fixed_accrual.accrue(db, [asset_id])
+    db.commit()
+    return {"status": "ok", "id": row.id, "summary": summary}
+
+@app.delete("/api/assets/{asset_id}/transactions/{tx_id}")
+def delete_transaction(asset_id: int, tx_id: int, db: Session = Depends(get_db), user: auth.AuthUser = Depends(get_current_user)):
+    target = _get_owned_asset(db, user, asset_id)
+    fixed_accrual.invalidate(db, asset_id, tx_id)
+    deleted = db.query(models.AssetTransaction).filter(
+        models.AssetTransaction.asset_id == asset_id,
+        models.AssetTransaction.id == tx_id
+    ).delete()
+    if not deleted: raise HTTPException(status_code=404, detail="Transaction not found")
+    db.flush()
+    summary = asset_transactions.sync_asset_totals(db, target)
+    db.commit()
+    return {"status": "deleted", "summary": summary}
+
+# --- 5.2 单只持仓的日线与区间收益 ---
+
+@app.get("/api/assets/{asset_id}/history")
+def read_holding_history(asset_id: int, start: Optional[str] = None, end: Optional[str] = None,
+                         db: Session = Depends(get_db), user: auth.AuthUser = Depends(get_current_user)):
+    _get_owned_asset(db, user, asset_id)
+    try:
+        start_d = datetime.strptime(start, "%Y-%m-%d").date() if start else None
+        end_d = datetime.strptime(end, "%Y-%m-%d").date() if end else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date, expected YYYY-MM-DD")
+    return holding_history.series(db, asset_id, start_d, end_d)
+
+@app.get("/api/assets/{asset_id}/returns")
+def read_holding_returns(asset_id: int, periods: str = ",".join(holding_history.PERIODS),
+                         db: Session = Depends(get_db), user: auth.AuthUser = Depends(get_current_user)):
+    _get_owned_asset(db, user, asset_id)
+    wanted = [p.strip().upper() for p in periods.split(",") if p.strip()]
+    bad = [p for p in wanted if p not in holding_history.PERIODS]
+    if bad: raise HTTPException(status_code=400, detail=f"Unknown periods: {', '.join(bad)}")
+    return holding_history.period_returns(db, asset_id, wanted)
+
+@app.get("/api/assets/{asset_id}/accruals")
+def read_accruals(asset_id: int, start: Optional[str] = None, end: Optional[str] = None,
+                  db: Session = Depends(get_db), user: auth.AuthUser = Depends(get_current_user)):
+    # 理财计息台账：按入账日汇总的当日利息和累计利息
+    _get_owned_asset(db, user, asset_id)
+    try:
+        start_d = datetime.strptime(start, "%Y-%m-%d").date() if start else None
+        end_d = datetime.strptime(end, "%Y-%m-%d").date() if end else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date, expected YYYY-MM-DD")
+    return {"items": fixed_accrual.ledger(db, asset_id, start_d, end_d), "summary": fixed_accrual.summarize(db, [asset_id]).get(asset_id)}
+
 # --- 6. 行情接口 ---
 
 @app.get("/api/market/refresh")
-async def refresh_market(source: str = "sina", db: Session = Depends(get_db), user: models.User = Depends(get_current_user)):
-    stocks = db.query(models.Asset).filter(models.Asset.owner_id == user.id, models.Asset.asset_type == "stock").all()
-    funds = db.query(models.Asset).filter(models.Asset.owner_id == user.id, models.Asset.asset_type == "fund").all()
-    return market_engine.get_real_time_data([s.code for s in stocks], [f.code for f in funds], source=source)
+async def refresh_market(source: str = "sina", db: Session = Depends(get_db), user: auth.AuthUser = Depends(get_current_user)):
+    with metrics.STAGE_SECONDS.time(stage="refresh_market.db"):
+        stocks = db.query(models.Asset).filter(models.Asset.owner_id == user.id, models.Asset.asset_type == "stock").all()
+        funds = db.query(models.Asset).filter(models.Asset.owner_id == user.id, models.Asset.asset_type == "fund").all()
+    with metrics.STAGE_SECONDS.time(stage="refresh_market.upstream"):
+        return await market_engine.get_real_time_data([s.code for s in stocks], [f.code for f in funds], source=source)
+
+@app.get("/api/market/stream")
+async def stream_market(request: Request, source: Optional[str] = None, user: auth.AuthUser = Depends(get_current_user_from_query)):
+    # source 和 /api/market/refresh 一样取前端设置里的行情源，不传时用引擎默认源
+    return StreamingResponse(
+        market_stream.events(user.id, request.is_disconnected, source),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.get("/api/market/check")
-def check_asset_code(code: str, type: str = 'stock'): 
-    if not code: return {"valid": False}
-    if type == 'stock':
-        prefix = "sh" if code.startswith(('5','6','9')) else "sz" if code.startswith(('0','1','3')) else "bj"
-        full_code = f"{prefix}{code}"
-        try:
-            url = f"http://hq.sinajs.cn/list={full_code}"
-            headers = {"Referer": "https://finance.sina.com.cn/"}
-            resp = requests.get(url, headers=headers, timeout=3)
-            if '="' in resp.text:
-                content = resp.text.split('="')[1]
-                if len(content) > 10:
-                    data = content.split(',')
-                    price = float(data[3])
-                    if price == 0: price = float(data[2])
-                    return {"valid": True, "name": data[0], "price": price}
-        except: pass
-    elif type == 'fund':
-        try:
-            ts = int(time.time()*1000)
-            url = f"http://fundgz.1234567.com.cn/js/{code}.js?rt={ts}"
-            resp = requests.get(url, timeout=3)
-            match = re.search(r'jsonpgz\((.*?)\);', resp.text)
-            if match:
-                data = json.loads(match.group(1))
-                return {"valid": True, "name": data.get('name'), "price": float(data.get('dwjz',0))}
-        except: pass
+async def check_asset_code(code: str, type: str = 'stock', source: str = "sina"):
+    # 名称来自内存里的证券主表，上游只用来取现价 (走 MarketEngine 的缓存/熔断)；
+    # 主表里没有的代码 (当天新上市或主表还没拉到) 仍按行情接口校验
+    code = code.strip()
+    if not code or type not in ("stock", "fund"): return {"valid": False}
+    info = security_master.lookup(code, type)
+    try:
+        if type == 'stock':
+            quote = (await market_engine.get_real_time_data([code], [], source=source))["stocks"].get(code)
+            price = quote["price"] if quote else None
+        else:
+            quote = (await market_engine.get_real_time_data([], [code]))["funds"].get(code)
+            price = quote["netValue"] if quote else None
+    except Exception as e:
+        print(f"Check quote failed: {e}")
+        quote, price = None, None
+    if info:
+        return {"valid": True, "name": info["name"], "price": price, "kind": info["kind"]}
+    if quote and quote["name"]:
+        return {"valid": True, "name": quote["name"], "price": price}
     return {"valid": False}
 
+@app.get("/api/market/search")
+def search_securities(q: str, type: Optional[str] = None, limit: int = Query(10, ge=1, le=50)):
+    # 输入联想：代码 / 拼音首字母 / 名称前缀，纯内存查询
+    if type and type not in ("stock", "fund"):
+        raise HTTPException(status_code=400, detail="type must be stock or fund")
+    items = security_master.search(q, type, limit)
+    return {"items": [{"code": r["code"], "name": r["name"], "type": r["type"], "kind": r["kind"]} for r in items]}
+
+# --- 6.1 组合估值：快照推送和前端看板共用 ---
+
+@app.get("/api/portfolio/summary")
+async def portfolio_summary(source: str = "sina", items: bool = True, db: Session = Depends(get_db), user: auth.AuthUser = Depends(get_current_user)):
+    with metrics.STAGE_SECONDS.time(stage="portfolio_summary.db"):
+        holdings = valuation.load_holdings(db, user.id)
+    with metrics.STAGE_SECONDS.time(stage="portfolio_summary.upstream"):
+        market = await market_engine.get_real_time_data(holdings["stock"].codes, holdings["fund"].codes, source=source)
+    with metrics.STAGE_SECONDS.time(stage="portfolio_summary.valuation"):
+        # 看板口径：没填年化的理财按市值反推年化 (和前端本地兜底的算法一致)
+        return valuation.value_portfolio(holdings, market, derive_apy=True).to_dict(with_items=items)
+
 # --- 7. 历史与配置 ---
 
+def _config_owner(user: auth.AuthUser) -> Optional[int]:
+    # 推送配置按用户隔离；管理员沿用单用户时代的全局配置
+    return None if user.username == "admin" else user.id
+
 @app.post("/api/config/webhook")
-def set_webhook(config: ConfigUpdate, db: Session = Depends(get_db)):
-    item = db.query(models.SystemConfig).filter(models.SystemConfig.key == "webhook_url").first()
-    if not item:
-        item = models.SystemConfig(key="webhook_url", value=config.webhook_url)
-        db.add(item)
-    else:
-        item.value = config.webhook_url
+def set_webhook(config: ConfigUpdate, db: Session = Depends(get_db), user: auth.AuthUser = Depends(get_current_user)):
+    outbox.save_config(db, outbox.config_key(outbox.LEGACY_URL_KEY, _config_owner(user)), config.webhook_url)
     db.commit()
     return {"status": "saved"}
 
-@app.get("/api/history")
-def get_history(db: Session = Depends(get_db), user: models.User = Depends(get_current_user)):
-    history = db.query(models.AssetHistory).filter(models.AssetHistory.owner_id == user.id).order_by(models.AssetHistory.date).all()
-    return [{
-        "date": h.date.strftime("%Y-%m-%d"),
-        "total": h.total_asset,        
-        "profit": h.total_profit,      
-        "total_asset": h.total_asset,  
-        "total_profit": h.total_profit,
-        "total_principal": getattr(h, 'total_principal', 0),
-        "stock_profit": getattr(h, 'stock_profit', 0),
-        "fund_profit": getattr(h, 'fund_profit', 0),
-        "fixed_profit": getattr(h, 'fixed_profit', 0)
-    } for h in history]
+@app.get("/api/config/webhooks")
+def get_webhook_targets(db: Session = Depends(get_db), user: auth.AuthUser = Depends(get_current_user)):
+    # 当前用户的全部推送目标 (含设置页保存的 webhook_url)
+    return {
+        "targets": outbox.load_targets(db, _config_owner(user)),
+        "formats": list(outbox.FORMATS),
+    }
+
+@app.put("/api/config/webhooks")
+def set_webhook_targets(req: WebhookTargets, db: Session = Depends(get_db), user: auth.AuthUser = Depends(get_current_user)):
+    targets = []
+    for t in req.targets:
+        url = t.url.strip()
+        if not url.startswith("http"):
+            raise HTTPException(status_code=400, detail=f"Invalid webhook url: {url}")
+        if t.format and t.format not in outbox.FORMATS:
+            raise HTTPException(status_code=400, detail=f"Unknown format: {t.format}")
+        targets.append({"url": url, "format": t.format or outbox.detect_format(url)})
+    outbox.save_targets(db, targets, _config_owner(user))
+    db.commit()
+    return {"status": "saved", "count": len(targets)}
 
-# --- 8. 核心任务：快照与推送 (满血复活版：精准分账 + 理财推送) ---
+HISTORY_FIELDS = ("total_asset", "total_profit", "total_principal", "stock_profit", "fund_profit", "fixed_profit")
+HISTORY_RANGES = {"1m": 31, "3m": 92, "6m": 183, "1y": 366, "3y": 1096, "5y": 1827}
 
-async def perform_push_and_snapshot():
-    db = SessionLocal()
+@app.get("/api/history")
+def get_history(request: Request, since: Optional[str] = None, range_: Optional[str] = Query(None, alias="range"), max_points: Optional[int] = None,
+                db: Session = Depends(get_db), user: auth.AuthUser = Depends(get_current_user)):
+    """按列返回每日快照：{"date": [...], "total_asset": [...], ...}
+
+    since=YYYY-MM-DD 只取该日之后的增量；range=1m/3m/6m/1y/3y/5y/all 限定时间窗；
+    max_points 超过时按 total_asset 做 LTTB 降采样。带 ETag，数据没变时返回 304。
+    """
+    H = models.AssetHistory
+    q = db.query(H).filter(H.owner_id == user.id)
     try:
-        admin = db.query(models.User).filter(models.User.username == "admin").first()
-        if not admin: return
+        if since:
+            q = q.filter(H.date > datetime.strptime(since, "%Y-%m-%d").date())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid since, expected YYYY-MM-DD")
+    if range_ and range_ != "all":
+        if range_ not in HISTORY_RANGES:
+            raise HTTPException(status_code=400, detail=f"Invalid range, expected one of {', '.join(HISTORY_RANGES)}, all")
+        q = q.filter(H.date >= date.today() - timedelta(days=HISTORY_RANGES[range_]))
+    if max_points is not None and max_points < 2:
+        raise HTTPException(status_code=400, detail="max_points must be >= 2")
+
+    # 校验值：快照只会追加新日期或覆盖最后一天，所以 (行数, 最后一行) 就能反映变化，两条都走 (owner_id, date) 索引
+    with metrics.STAGE_SECONDS.time(stage="history.etag"):
+        count = q.with_entities(func.count(H.id)).scalar()
+        last = q.with_entities(H.date, *[getattr(H, f) for f in HISTORY_FIELDS]).order_by(H.date.desc()).first()
+        raw_tag = f"{user.id}|{since}|{range_}|{max_points}|{count}|{tuple(last) if last else ''}"
+        etag = '"' + hashlib.sha1(raw_tag.encode()).hexdigest()[:20] + '"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    with metrics.STAGE_SECONDS.time(stage="history.db"):
+        rows = q.with_entities(H.date, *[getattr(H, f) for f in HISTORY_FIELDS]).order_by(H.date).all()
+    dates = [r[0] for r in rows]
+    cols = np.array([r[1:] for r in rows], dtype=float).reshape(len(rows), len(HISTORY_FIELDS))
+    # 老数据里新字段可能为 NULL
+    cols = np.nan_to_num(cols)
+
+    keep = None
+    if max_points and len(rows) > max_points:
+        x = np.fromiter((d.toordinal() for d in dates), dtype=float, count=len(dates))
+        keep = downsample.lttb(x, cols[:, 0], max_points)
+        dates = [dates[i] for i in keep.tolist()]
+        cols = cols[keep]
+
+    res: Dict[str, Any] = {
+        "count": len(rows),
+        "downsampled": keep is not None,
+        "date": [d.strftime("%Y-%m-%d") for d in dates],
+    }
+    for i, f in enumerate(HISTORY_FIELDS):
+        res[f] = cols[:, i].tolist()
+    return Response(json.dumps(res), media_type="application/json", headers=headers)
+
+# --- 7.1 历史价格补录 / 导入，以及快照重放 ---
+
+@app.post("/api/prices/backfill")
+async def backfill_prices(req: BackfillRequest, db: Session = Depends(get_db), user: auth.AuthUser = Depends(get_current_user)):
+    start_d = _parse_day(req.start)
+    end_d = _parse_day(req.end) if req.end else date.today()
+    if not start_d or not end_d or end_d < start_d:
+        raise HTTPException(status_code=400, detail="Invalid start/end, expected YYYY-MM-DD with start <= end")
+    codes = db.query(models.Asset.asset_type, models.Asset.code).filter(models.Asset.owner_id == user.id).distinct().all()
+    # 多取几天，重放区间第一天也有前收盘
+    stored = await price_backfill.backfill(
+        [c for t, c in codes if t == "stock"], [c for t, c in codes if t == "fund"],
+        start_d - timedelta(days=price_backfill.LOOKBACK_DAYS), end_d,
+    )
+    replayed = []
+    if req.replay:
+        loop = asyncio.get_running_loop()
+        replayed = await loop.run_in_executor(None, price_backfill.replay, user.id, start_d, end_d, req.overwrite)
+    return {"stored": stored, "replayed": [d.strftime("%Y-%m-%d") for d in replayed]}
+
+@app.post("/api/prices/import")
+async def import_prices(file: UploadFile = File(...), asset_type: str = Form("stock"), user: auth.AuthUser = Depends(get_current_user)):
+    # price_history 是所有用户共用的 (基金净值按它判断是否已确权)，只允许管理员导入
+    _require_admin(user)
+    content = await file.read()
+    try:
+        rows = price_backfill.parse_import(file.filename or "", content, asset_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    loop = asyncio.get_running_loop()
+    count = await loop.run_in_executor(None, price_backfill.store, rows)
+    return {"status": "ok", "imported": count}
+
+@app.post("/api/history/replay")
+def replay_history(req: BackfillRequest, user: auth.AuthUser = Depends(get_current_user)):
+    start_d = _parse_day(req.start)
+    end_d = _parse_day(req.end) if req.end else date.today()
+    if not start_d or not end_d or end_d < start_d:
+        raise HTTPException(status_code=400, detail="Invalid start/end, expected YYYY-MM-DD with start <= end")
+    replayed = price_backfill.replay(user.id, start_d, end_d, req.overwrite)
+    return {"replayed": [d.strftime("%Y-%m-%d") for d in replayed]}
+
+@app.get("/api/history/intraday")
+def get_intraday_history(start: Optional[str] = None, end: Optional[str] = None, user: auth.AuthUser = Depends(get_current_user)):
+    # 默认取最近一个交易日
+    try:
+        start_d = datetime.strptime(start, "%Y-%m-%d").date() if start else market_calendar.last_trading_day()
+        end_d = datetime.strptime(end, "%Y-%m-%d").date() if end else start_d
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date, expected YYYY-MM-DD")
+    if end_d < start_d: raise HTTPException(status_code=400, detail="end must not be before start")
+    return intraday_store.query(user.id, start_d, end_d)
 
-        stocks = db.query(models.Asset).filter(models.Asset.owner_id == admin.id, models.Asset.asset_type == "stock").all()
-        funds = db.query(models.Asset).filter(models.Asset.owner_id == admin.id, models.Asset.asset_type == "fund").all()
-        fixed = db.query(models.Asset).filter(models.Asset.owner_id == admin.id, models.Asset.asset_type == "fixed").all()
-        
-        # 1. 抓取行情
-        market = market_engine.get_real_time_data([s.code for s in stocks], [f.code for f in funds])
-        
-        # 初始化分账统计
-        stock_val = 0.0
-        stock_profit_day = 0.0
-        stock_principal = 0.0
-
-        fund_val = 0.0
-        fund_profit_day = 0.0
-        fund_principal = 0.0
-
-        fixed_val = 0.0
-        fixed_profit_day = 0.0
-        fixed_principal = 0.0
-
-        details_text = [] 
-
-        # 2. 计算股票 (反推逻辑，对齐前端)
-        if stocks: details_text.append("【股票/ETF】")
-        for s in stocks:
-            m = market['stocks'].get(s.code, {'price': s.cost_price, 'change': 0})
-            price = m['price']
-            qty = s.quantity
-            change = m['change']
-            
-            mv = price * qty
-            cost = s.cost_price * qty
-            
-            # 日盈亏 = 市值 * 涨幅 / (100+涨幅)
-            day_p = 0
-            if (100 + change) != 0:
-                day_p = (mv * change) / (100 + change)
-            
-            stock_val += mv
-            stock_principal += cost
-            stock_profit_day += day_p
-            
-            if abs(change) > 0.1:
-                icon = "📈" if change > 0 else "📉"
-                details_text.append(f"{icon} {s.name}: {change}%")
-
-        # 3. 计算基金 (估值)
-        if funds: details_text.append("\n【场外基金】")
-        for f in funds:
-            m = market['funds'].get(f.code)
-            if m:
-                price = m.get('price', m.get('nav', f.cost_price))
-                change = m.get('estimatedChange', m.get('change', 0)) 
-                nav_date = m.get('navDate', '') 
-            else:
-                price = f.cost_price
-                change = 0
-                nav_date = ""
-
-            qty = f.quantity
-            mv = price * qty
-            cost = f.cost_price * qty
-            
-            day_p = mv * (change / 100)
-            
-            fund_val += mv
-            fund_principal += cost
-            fund_profit_day += day_p
-            
-            if abs(change) > 0.1:
-                icon = "📈" if change > 0 else "📉"
-                d_str = f"({nav_date})" if nav_date else ""
-                details_text.append(f"{icon} {f.name}: {change}% {d_str}")
-
-        # 4. 计算固收 (按 APY 推算)
-        fixed_items_text = []
-        for x in fixed:
-            principal = x.quantity
-            # 优先用市值，没市值用本金
-            current_mv = x.cost_price if x.cost_price > 0 else principal 
-            
-            # 修正：日收益 = 市值 * APY% / 365
-            day_earn = (current_mv * (x.apy or 0) / 100) / 365
-            
-            fixed_val += current_mv
-            fixed_principal += principal
-            fixed_profit_day += day_earn
-            
-            # 收集理财明细 (只显示日赚大于 0.01 的)
-            if day_earn > 0.01:
-                fixed_items_text.append(f"💰 {x.name}: +{day_earn:.2f}")
-
-        # 【新增】将理财明细加入日报
-        if fixed_items_text:
-            details_text.append("\n【理财固收】")
-            details_text.extend(fixed_items_text)
-
-        # 汇总
-        total_asset = stock_val + fund_val + fixed_val
-        total_profit_day = stock_profit_day + fund_profit_day + fixed_profit_day
-        total_principal = stock_principal + fund_principal + fixed_principal
-
-        # 5. 存入数据库快照
-        today = date.today()
-        existing = db.query(models.AssetHistory).filter(models.AssetHistory.owner_id==admin.id, models.AssetHistory.date==today).first()
-        
-        if not existing:
-            db.add(models.AssetHistory(
-                owner_id=admin.id, 
-                date=today, 
-                total_asset=total_asset, 
-                total_profit=total_profit_day,
-                total_principal=total_principal,
-                stock_profit=stock_profit_day,
-                fund_profit=fund_profit_day,
-                fixed_profit=fixed_profit_day
-            ))
-        else:
-            existing.total_asset = total_asset
-            existing.total_profit = total_profit_day
-            existing.total_principal = total_principal
-            existing.stock_profit = stock_profit_day
-            existing.fund_profit = fund_profit_day
-            existing.fixed_profit = fixed_profit_day
-            
-        db.commit()
+# --- 8. 核心任务：快照与推送 (满血复活版：精准分账 + 理财推送) ---
 
-        # 6. 发送 Webhook
-        webhook_cfg = db.query(models.SystemConfig).filter(models.SystemConfig.key == "webhook_url").first()
-        if webhook_cfg and webhook_cfg.value and webhook_cfg.value.startswith("http"):
-            
-            sign = "+" if total_profit_day >= 0 else ""
-            
-            content = (
-                f"📅 资产日报 {today.strftime('%Y-%m-%d')}\n"
-                f"----------------\n"
-                f"💰 总资产: ¥{total_asset:,.2f}\n"
-                f"📊 今日盈亏: {sign}¥{total_profit_day:,.2f}\n"
-                f"----------------\n"
-                + "\n".join(details_text)
-            )
-            
-            payload = { "msgtype": "text", "text": { "content": content } }
-            try:
-                requests.post(webhook_cfg.value, json=payload, timeout=5)
-                print("Webhook push success")
-            except Exception as e:
-                print(f"Webhook push failed: {e}")
+def _daily_report(today: date, result: valuation.PortfolioValuation, market: Dict[str, Any]) -> str:
+    stock_v, fund_v, fixed_v = result["stock"], result["fund"], result["fixed"]
+    details_text = []
+
+    # 股票/基金：只列涨跌幅超过 0.1% 的
+    if len(stock_v.holdings): details_text.append("【股票/ETF】")
+    for name, change in zip(stock_v.holdings.names, stock_v.rate.tolist()):
+        if abs(change) > 0.1:
+            icon = "📈" if change > 0 else "📉"
+            details_text.append(f"{icon} {name}: {change}%")
+
+    if len(fund_v.holdings): details_text.append("\n【场外基金】")
+    for code, name, change in zip(fund_v.holdings.codes, fund_v.holdings.names, fund_v.rate.tolist()):
+        if abs(change) > 0.1:
+            icon = "📈" if change > 0 else "📉"
+            nav_date = market['funds'].get(code, {}).get('navDate', '')
+            d_str = f"({nav_date})" if nav_date else ""
+            details_text.append(f"{icon} {name}: {change}% {d_str}")
+
+    # 理财明细 (只显示日赚大于 0.01 的)
+    fixed_items_text = [
+        f"💰 {name}: +{day_earn:.2f}"
+        for name, day_earn in zip(fixed_v.holdings.names, fixed_v.day_profit.tolist()) if day_earn > 0.01
+    ]
+    if fixed_items_text:
+        details_text.append("\n【理财固收】")
+        details_text.extend(fixed_items_text)
+
+    total_profit_day = result.total_day_profit
+    sign = "+" if total_profit_day >= 0 else ""
+    return (
+        f"📅 资产日报 {today.strftime('%Y-%m-%d')}\n"
+        f"----------------\n"
+        f"💰 总资产: ¥{result.total_market_value:,.2f}\n"
+        f"📊 今日盈亏: {sign}¥{total_profit_day:,.2f}\n"
+        f"----------------\n"
+        + "\n".join(details_text)
+    )
+
+@metrics.timed_job("push_and_snapshot")
+async def perform_push_and_snapshot(force: bool = False, owner_ids: Optional[List[int]] = None) -> int:
+    """全部用户 (或 owner_ids 指定的用户) 的收盘快照 + 日报，返回写进发件箱的消息数。
+
+    所有持仓一次查出，代码去重后只抓一次行情，逐用户估值后快照和逐持仓日线各一条批量 UPSERT，
+    耗时随不同证券的数量增长，而不是随 用户数 × 持仓数。
+    查库、估值、写库都在线程池里执行，事件循环上只等行情。
+    """
+    try:
+        if not force and not market_calendar.is_trading_day():
+            # 节假日行情停在上一个交易日，收盘快照和日报都不做 (手动推送 force=True 照常)
+            print(">>> [SNAPSHOT] Not a trading day, skipped")
+            return 0
+        loop = asyncio.get_running_loop()
+        # 1. 全部持仓 + 合并行情
+        holdings = await loop.run_in_executor(None, _load_snapshot_holdings, owner_ids)
+        if not holdings:
+            return 0
+        stock_codes, fund_codes = valuation.union_codes(holdings)
+        market = await market_engine.get_real_time_data(stock_codes, fund_codes)
+        # 2. 估值、快照、日报入队，同一个事务
+        queued = await loop.run_in_executor(None, _store_snapshot, holdings, market, force)
+        print(f">>> [SNAPSHOT] {len(holdings)} users, {len(stock_codes)} stocks / {len(fund_codes)} funds, {queued} reports queued")
+        if queued:
+            webhook_outbox.notify()
+        return queued
 
     except Exception as e:
+        # 继续抛出：timed_job 和 job_runs 要把这次记为失败
         print(f"Task error: {e}")
+        raise
+
+def _load_snapshot_holdings(owner_ids: Optional[List[int]]) -> Dict[int, Dict[str, valuation.HoldingColumns]]:
+    db = SessionLocal()
+    try:
+        return valuation.load_all_holdings(db, owner_ids)
     finally:
         db.close()
 
+def _store_snapshot(holdings: Dict[int, Dict[str, valuation.HoldingColumns]], market: Dict[str, Any], force: bool) -> int:
+    # 批量估值 (与 /api/portfolio/summary 同一套公式)
+    results = {owner_id: valuation.value_portfolio(h, market) for owner_id, h in holdings.items()}
+    today = date.today()
+    db = SessionLocal()
+    try:
+        # 每个用户当天一条快照，依赖 (owner_id, date) 唯一索引，一条 UPSERT 语句 executemany
+        rows = [{
+            "owner_id": owner_id, "date": today,
+            "total_asset": r.total_market_value,
+            "total_profit": r.total_day_profit,
+            "total_principal": r.total_principal,
+            "stock_profit": r["stock"].total_day_profit,
+            "fund_profit": r["fund"].total_day_profit,
+            "fixed_profit": r["fixed"].total_day_profit,
+        } for owner_id, r in results.items()]
+        stmt = sqlite_insert(models.AssetHistory)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=["owner_id", "date"],
+            set_={k: stmt.excluded[k] for k in HISTORY_FIELDS},
+        ), rows)
+        # 逐持仓日线 (累计盈亏 / 时间加权收益在写入时接着前一天算好)
+        holding_history.record_days(db, today, results)
+
+        # 日报按用户写进各自推送目标的发件箱 (和快照同一个事务)，由后台协程投递，这里不等网络
+        targets = outbox.load_all_targets(db)
+        admins = {u for (u,) in db.query(models.User.id).filter(models.User.username == "admin").all()}
+        queued = 0
+        for owner_id, r in results.items():
+            owner_targets = targets.get(None if owner_id in admins else owner_id)
+            if owner_targets:
+                queued += webhook_outbox.enqueue(db, owner_id, today, _daily_report(today, r, market),
+                                                 r.to_dict(with_items=False), owner_targets, force=force)
+        db.commit()
+        return queued
+    finally:
+        db.close()
+
+def _require_admin(user: auth.AuthUser):
+    if user.username != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+
+@app.get("/api/jobs")
+def read_jobs(user: auth.AuthUser = Depends(get_current_user)):
+    # 调度器和主节点状态是全局信息，只给管理员看
+    _require_admin(user)
+    return scheduler.status()
+
+@app.get("/api/jobs/{name}/runs")
+def read_job_runs(name: str, limit: int = Query(50, ge=1, le=200), user: auth.AuthUser = Depends(get_current_user)):
+    _require_admin(user)
+    return {"name": name, "runs": scheduler.runs(name, limit)}
+
+@app.get("/metrics")
+def read_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.post("/api/push/test")
-async def manual_push():
-    await perform_push_and_snapshot()
-    return {"status": "ok"}
-
-# 定时任务
-scheduler = BackgroundScheduler()
-scheduler.add_job(lambda: asyncio.run(perform_push_and_snapshot()), 'cron', hour=15, minute=5)
-scheduler.start()
+async def manual_push(user: auth.AuthUser = Depends(get_current_user)):
+    # 手动推送：只针对当前用户，今天已经发过的日报也重新发一次
+    try:
+        queued = await perform_push_and_snapshot(force=True, owner_ids=[user.id])
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Snapshot failed: {e}")
+    return {"status": "ok", "queued": queued}
+
+@app.get("/api/push/outbox")
+def read_push_outbox(limit: int = Query(20, ge=1, le=200), db: Session = Depends(get_db), user: auth.AuthUser = Depends(get_current_user)):
+    # 只看自己的推送记录；管理员和配置接口一样，连同全局配置时代的老记录
+    return {"items": WebhookOutbox.recent(db, user.id, limit, include_global=_config_owner(user) is None)}
+
+# 定时任务 (应用启动后在事件循环上运行，多 worker 时只有主节点执行)
+scheduler.add("daily_snapshot", perform_push_and_snapshot, 'cron', day_of_week='mon-fri', hour=15, minute=5)
+# 晚间基金净值补扫 (只刷新 navDate 过期的基金)
+market_scheduler.register(scheduler)
+# 盘中估值曲线采样 + 夜间压缩
+intraday_store.register(scheduler)
+# 漏掉的收盘快照：补拉历史价格后重放
+price_backfill.register(scheduler)
+# 证券主表每日刷新
+security_master.register(scheduler)
+# 理财计息台账每日入账
+fixed_accrual.register(scheduler)
 
 if __name__ == "__main__":
     import uvicorn
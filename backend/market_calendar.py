@@ -0,0 +1,93 @@
+import os
+from datetime import date, datetime, time as dtime, timedelta
+from typing import List, Optional, Set
+
+# A 股交易时段 (开盘前后各留一点余量，覆盖集合竞价和收盘后行情落定)
+TRADING_SESSIONS = ((dtime(9, 15), dtime(11, 31)), (dtime(12, 59), dtime(15, 5)))
+# 收盘时间，基金当日净值最早在此之后公布
+MARKET_CLOSE = dtime(15, 0)
+
+# 沪深交易所休市日 (周末之外)，以交易所年度公告为准；
+# 新的一年可通过环境变量 PACC_MARKET_HOLIDAYS="2027-01-01,2027-02-08" 追加，无需改代码
+_BUILTIN_HOLIDAYS = """
+2025-01-01 2025-01-28 2025-01-29 2025-01-30 2025-01-31 2025-02-03 2025-02-04
+2025-04-04 2025-05-01 2025-05-02 2025-05-05 2025-06-02
+2025-10-01 2025-10-02 2025-10-03 2025-10-06 2025-10-07 2025-10-08
+2026-01-01 2026-01-02 2026-02-16 2026-02-17 2026-02-18 2026-02-19 2026-02-20 2026-02-23
+2026-04-06 2026-05-01 2026-05-04 2026-05-05 2026-06-19 2026-09-25
+2026-10-01 2026-10-02 2026-10-05 2026-10-06 2026-10-07
+"""
+
+def _load_holidays() -> Set[date]:
+    raw = _BUILTIN_HOLIDAYS.split() + os.environ.get("PACC_MARKET_HOLIDAYS", "").replace(",", " ").split()
+    days = set()
+    for item in raw:
+        try:
+            days.add(datetime.strptime(item, "%Y-%m-%d").date())
+        except ValueError:
+            print(f"Market calendar: bad holiday '{item}' ignored")
+    return days
+
+HOLIDAYS = _load_holidays()
+
+
+def is_trading_day(d: Optional[date] = None) -> bool:
+    d = d or date.today()
+    return d.weekday() < 5 and d not in HOLIDAYS
+
+
+def is_trading_time(now: Optional[datetime] = None) -> bool:
+    now = now or datetime.now()
+    if not is_trading_day(now.date()):
+        return False
+    t = now.time()
+    return any(start <= t < end for start, end in TRADING_SESSIONS)
+
+
+def last_trading_day(d: Optional[date] = None) -> date:
+    """d 当天或之前最近的一个交易日。"""
+    d = d or date.today()
+    while not is_trading_day(d):
+        d -= timedelta(days=1)
+    return d
+
+
+def trading_days(start: date, end: date) -> List[date]:
+    """[start, end] 闭区间内的全部交易日，升序。"""
+    days = []
+    d = start
+    while d <= end:
+        if is_trading_day(d):
+            days.append(d)
+        d += timedelta(days=1)
+    return days
+
+
+def latest_nav_date(now: Optional[datetime] = None) -> date:
+    """此刻理论上可能已公布的最新基金净值日期：交易日收盘后为当天，否则为上一个交易日。"""
+    now = now or datetime.now()
+    if is_trading_day(now.date()) and now.time() >= MARKET_CLOSE:
+        return now.date()
+    return last_trading_day(now.date() - timedelta(days=1))
+
+
+def next_session_open(now: Optional[datetime] = None) -> datetime:
+    """now 之后最近一次开盘 (含午间开盘) 的时间点；盘中调用返回 now 本身。"""
+    now = now or datetime.now()
+    if is_trading_time(now):
+        return now
+    d = now.date()
+    for _ in range(60):
+        if is_trading_day(d):
+            for start, _end in TRADING_SESSIONS:
+                candidate = datetime.combine(d, start)
+                if candidate > now:
+                    return candidate
+        d += timedelta(days=1)
+    # 日历异常 (比如误配了连续几十天的休市) 时兜底，避免无限期不刷新
+    return now + timedelta(hours=1)
+
+
+def seconds_until_open(now: Optional[datetime] = None) -> float:
+    now = now or datetime.now()
+    return (next_session_open(now) - now).total_seconds()
@@ -1,16 +1,127 @@
-import requests
+import asyncio
 import re
 import json
 import time
+import threading
+import weakref
+from collections import OrderedDict
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Set, Tuple
+
+import market_calendar
+import metrics
+from upstream import UpstreamPool, CircuitOpenError, hedged
+
+
+class QuoteCache:
+    """按 (source, code) 缓存行情，每条带独立过期时间，超过容量按 LRU 淘汰。
+
+    调度线程和请求线程会同时读写，所以所有操作都在锁里完成。
+    """
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[Tuple[str, str], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    # 纯内存，可以直接在事件循环上调用 (共享缓存要读写文件，由 MarketEngine 放进线程池)
+    blocking = False
+
+    def peek(self, keys: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        return self.get_many(keys)
+
+    def get_many(self, keys: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        found = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                found[key] = value
+        return found
+
+    def set(self, key: Tuple[str, str], value: Dict[str, Any], ttl: float):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def set_many(self, items: List[Tuple[Tuple[str, str], Dict[str, Any], float]], version: Optional[int] = None):
+        for key, value, ttl in items:
+            self.set(key, value, ttl)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    # 单进程没有别人和它抢：抓取租约永远归自己 (多进程共享见 quote_cache.SharedQuoteCache)
+    def claim(self, keys: List[Tuple[str, str]], ttl: float) -> Set[Tuple[str, str]]:
+        return set(keys)
+
+    def leased(self, keys: List[Tuple[str, str]]) -> Dict[Tuple[str, str], float]:
+        return {}
+
+    def release(self, keys: List[Tuple[str, str]]):
+        pass
+
+
+# 上游接口地址，压测时可通过 MarketEngine(endpoints=...) 指向本地桩服务
+DEFAULT_ENDPOINTS = {
+    "tencent": "http://qt.gtimg.cn",
+    "sina": "http://hq.sinajs.cn",
+    "fundgz": "http://fundgz.1234567.com.cn",
+    "fundsearch": "http://fundsuggest.eastmoney.com",
+    "fundnav": "https://fundmobapi.eastmoney.com",
+    "stockkline": "https://web.ifzq.gtimg.cn",
+    "stocklist": "https://push2.eastmoney.com",
+    "fundlist": "http://fund.eastmoney.com",
+}
+
 
 class MarketEngine:
-    def __init__(self):
+    # 缓存有效期 (秒)：盘中股票变化快，基金估值 fundgz 本身约 1 分钟才更新一次；
+    # 休市期间价格不会再动，缓存直接用到下一次开盘 (基金晚间净值由 NAV 补扫任务负责刷新)
+    STOCK_TTL = 5
+    FUND_TTL = 30
+    MIN_CLOSED_TTL = 60
+    # 批量净值接口每次查询的基金数量
+    NAV_BATCH_SIZE = 50
+    # 股票主源超过这个时间 (秒) 还没返回，就同时向备源发起请求
+    HEDGE_DELAY = 0.3
+    # 单个股票行情请求最多带多少个代码
+    STOCK_CHUNK_SIZE = 60
+    # 别的 worker 正在抓同一批代码时，多久查一次共享缓存 (秒)
+    SHARED_POLL = 0.05
+
+    def __init__(self, max_concurrency: int = 16, batch_timeout: float = 6.0, cache_size: int = 4096, nav_store=None, endpoints: Optional[Dict[str, str]] = None, cache=None):
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
             "Referer": "https://finance.qq.com/"
         }
+        # 同时在途的上游请求上限，防止持仓多时把对方接口打爆
+        self.max_concurrency = max_concurrency
+        # 整批请求的总截止时间 (秒)，超时未返回的请求直接放弃
+        self.batch_timeout = batch_timeout
+        # 行情缓存：默认进程内；多 worker 部署时传入 quote_cache.SharedQuoteCache 共用一份
+        self.cache = cache if cache is not None else QuoteCache(cache_size)
+        # 正在抓取中的 (source, code) -> Future，同一事件循环里的并发调用共用一次上游请求
+        self._inflight: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple[str, str], asyncio.Future]]" = weakref.WeakKeyDictionary()
+        self._inflight_lock = threading.Lock()
+        # 基金确权净值日表 (nav_store.NavStore)，为 None 时每次都走 B 接口
+        self.nav_store = nav_store
+        self.endpoints = dict(DEFAULT_ENDPOINTS, **(endpoints or {}))
+        # 上游访问层：按 host 复用长连接 + 熔断
+        self.pool = UpstreamPool(self.headers, max_connections=max_concurrency)
 
     def _add_stock_prefix(self, code: str) -> str:
         code = str(code).strip()
@@ -23,107 +134,425 @@ class MarketEngine:
             return f"bj{code}"
         return f"sh{code}"
 
-    def get_real_time_data(self, stock_codes: List[str], fund_codes: List[str], source: str = "tencent") -> Dict[str, Any]:
+    def _ttl(self, bucket: str) -> float:
+        now = datetime.now()
+        if market_calendar.is_trading_time(now):
+            return self.STOCK_TTL if bucket == "stocks" else self.FUND_TTL
+        return max(self.MIN_CLOSED_TTL, market_calendar.seconds_until_open(now))
+
+    def cached_funds(self, codes: List[str]) -> Dict[str, Dict[str, Any]]:
+        """缓存里现有的基金行情 (同步调用，共享缓存时会读文件，不要直接在事件循环上用)。"""
+        found = self.cache.get_many([("fund", str(code).strip()) for code in codes])
+        return {code: value for (_, code), value in found.items()}
+
+    async def _cache_io(self, func, *args):
+        # 共享缓存的读写要碰 SQLite 文件 (还可能等写锁)，放到线程池里，不卡事件循环
+        if not self.cache.blocking:
+            return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    def _poll_shared(self, keys: List[Tuple[str, str]]):
+        # 先看租约再读缓存：对方是先写缓存后释放租约的，这个顺序不会漏掉刚写回的数据
+        held = self.cache.leased(keys)
+        return held, self.cache.get_many(keys)
+
+    def _publish(self, fresh: List[Tuple[Tuple[str, str], Dict[str, Any], float]], version: int, mine: List[Tuple[str, str]]):
+        self.cache.set_many(fresh, version)
+        self.cache.release(mine)
+
+    async def get_real_time_data(self, stock_codes: List[str], fund_codes: List[str], source: str = "tencent", force: bool = False) -> Dict[str, Any]:
         result = {
             "stocks": {},
             "funds": {}
         }
 
-        # ==========================================================
-        # 1. 股票部分 (保持不变，这部分是稳的)
-        # ==========================================================
-        if stock_codes:
-            code_map = {self._add_stock_prefix(c): c for c in stock_codes}
-            query_str = ",".join(code_map.keys())
+        loop = asyncio.get_running_loop()
+        with self._inflight_lock:
+            inflight = self._inflight.setdefault(loop, {})
+
+        # 1. 先查缓存 (force 时跳过)，再看有没有别的请求正在抓同一个代码；剩下的才由本次调用去抓
+        owned: Dict[Tuple[str, str], Tuple[str, str, asyncio.Future]] = {}
+        waiting: List[Tuple[str, str, asyncio.Future]] = []
+        stock_source = self._stock_source(source)
+        requested = [
+            (bucket, (src, str(code).strip()))
+            for bucket, src, codes in (("stocks", stock_source, stock_codes), ("funds", "fund", fund_codes))
+            for code in codes
+        ]
+        hits = {}
+        if not force:
+            # 进程内的第一层直接查；没命中的再去共享缓存 (线程池里读文件)
+            hits = self.cache.peek([key for _, key in requested])
+            missing = [key for _, key in requested if key not in hits]
+            if missing and self.cache.blocking:
+                hits.update(await self._cache_io(self.cache.get_many, missing))
+        for bucket, key in requested:
+            code = key[1]
+            if key in owned:
+                continue
+            hit = hits.get(key)
+            if hit is not None:
+                metrics.QUOTE_CACHE_TOTAL.inc(bucket=bucket, result="hit")
+                result[bucket][code] = hit
+                continue
+            fut = inflight.get(key)
+            if fut is not None:
+                metrics.QUOTE_CACHE_TOTAL.inc(bucket=bucket, result="coalesced")
+                waiting.append((bucket, code, fut))
+                continue
+            metrics.QUOTE_CACHE_TOTAL.inc(bucket=bucket, result="miss")
+            fut = loop.create_future()
+            inflight[key] = fut
+            owned[key] = (bucket, code, fut)
+
+        # 2. 抓取本次负责的代码，结果写入缓存并唤醒等待者。
+        #    多进程共享缓存时先抢抓取租约：别的 worker 正在抓的代码不重复请求上游，等它写回共享缓存
+        if owned:
+            fetched = {"stocks": {}, "funds": {}}
+            version = time.time_ns()
+            mine = set(owned) if force else await self._cache_io(self.cache.claim, list(owned), self.batch_timeout + 1)
             try:
-                url = f"http://qt.gtimg.cn/q={query_str}"
-                resp = requests.get(url, headers=self.headers, timeout=5)
-                resp.encoding = 'gbk'
-                content = resp.text
-                matches = re.findall(r'v_([a-z]{2}\d+)="([^"]+)"', content)
-
-                for key, data_str in matches:
-                    data = data_str.split('~')
-                    if len(data) > 30:
-                        name = data[1]
-                        current_price = float(data[3])
-                        yesterday_close = float(data[4])
-                        
-                        if yesterday_close > 0:
-                            change_percent = ((current_price - yesterday_close) / yesterday_close) * 100
-                        else:
-                            change_percent = float(data[32])
-
-                        if current_price == 0 and yesterday_close > 0:
-                            current_price = yesterday_close
-                            change_percent = 0.0
-
-                        original_code = code_map.get(key)
-                        if original_code:
-                            result["stocks"][original_code] = {
-                                "name": name,
-                                "price": current_price,
-                                "change": change_percent
-                            }
-            except Exception as e:
-                print(f"Stock Fetch Error: {e}")
-
-        # ==========================================================
-        # 2. 基金部分 (终极修复：双接口比对，确权净值优先)
-        # ==========================================================
+                remote = [key for key in owned if key not in mine]
+                fetch = self._fetch_batch(
+                    [code for key, (bucket, code, _) in owned.items() if key in mine and bucket == "stocks"],
+                    [code for key, (bucket, code, _) in owned.items() if key in mine and bucket == "funds"],
+                    fetched,
+                    stock_source,
+                )
+                if remote:
+                    _, stalled = await asyncio.gather(fetch, self._await_shared(remote, owned, fetched))
+                else:
+                    await fetch
+                    stalled = []
+                # 对方到截止时间还没写回 (卡住或挂了)：本进程自己补抓
+                if stalled:
+                    mine.update(stalled)
+                    await self._fetch_batch(
+                        [owned[key][1] for key in stalled if owned[key][0] == "stocks"],
+                        [owned[key][1] for key in stalled if owned[key][0] == "funds"],
+                        fetched,
+                        stock_source,
+                    )
+            finally:
+                fresh = []
+                for key, (bucket, code, fut) in owned.items():
+                    value = fetched[bucket].get(code)
+                    if value is not None:
+                        if key in mine:
+                            fresh.append((key, value, self._ttl(bucket)))
+                        result[bucket][code] = value
+                    if not fut.done():
+                        fut.set_result(value)
+                    inflight.pop(key, None)
+                # 即使本调用被取消，线程池里的写入也会照常完成
+                await self._cache_io(self._publish, fresh, version, list(mine))
+
+        # 3. 等待其他调用正在进行的抓取 (shield: 本调用被取消时不影响共享的 Future)
+        if waiting:
+            values = await asyncio.gather(*(asyncio.shield(fut) for _, _, fut in waiting), return_exceptions=True)
+            for (bucket, code, _), value in zip(waiting, values):
+                if isinstance(value, dict):
+                    result[bucket][code] = value
+
+        return result
+
+    async def _await_shared(self, keys: List[Tuple[str, str]], owned: Dict[Tuple[str, str], Tuple[str, str, asyncio.Future]],
+                            fetched: Dict[str, Any]) -> List[Tuple[str, str]]:
+        """轮询共享缓存，等其他 worker 把这些代码写回；返回需要本进程自己补抓的代码
+        (对方租约已过期却没释放，或到截止时间还没写回)。
+
+        租约已释放却没有数据的代码说明对方也没抓到，不再重复请求。
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.batch_timeout
+        pending = list(keys)
+        stalled: List[Tuple[str, str]] = []
+        while pending:
+            held, found = await self._cache_io(self._poll_shared, pending)
+            for key, value in found.items():
+                bucket, code, _ = owned[key]
+                fetched[bucket][code] = value
+                metrics.QUOTE_CACHE_TOTAL.inc(bucket=bucket, result="shared")
+            now = time.time()
+            stalled.extend(key for key in pending if key not in found and key in held and held[key] <= now)
+            pending = [key for key in pending if key not in found and held.get(key, 0) > now]
+            if not pending or loop.time() >= deadline:
+                break
+            await asyncio.sleep(self.SHARED_POLL)
+        return stalled + pending
+
+    async def _fetch_batch(self, stock_codes: List[str], fund_codes: List[str], result: Dict[str, Any], source: str = "tencent"):
+        limiter = asyncio.Semaphore(self.max_concurrency)
+        tasks = []
+        if stock_codes:
+            tasks.append(asyncio.ensure_future(self._fetch_stocks(limiter, stock_codes, result, source)))
+        if fund_codes:
+            tasks.append(asyncio.ensure_future(self._fetch_funds(limiter, fund_codes, result)))
+
+        if tasks:
+            # 整批共用一个截止时间：到点没回来的请求全部取消，已拿到的数据照常返回
+            done, pending = await asyncio.wait(tasks, timeout=self.batch_timeout)
+            for t in pending:
+                t.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+                print(f"Market Fetch: batch deadline {self.batch_timeout}s exceeded")
+
+    # ==========================================================
+    # 1. 股票部分 (腾讯 / 新浪双源对冲，按 source 决定主源)
+    # ==========================================================
+    async def _fetch_stocks(self, limiter: asyncio.Semaphore, stock_codes: List[str], result: Dict[str, Any], source: str):
+        # 代码按 STOCK_CHUNK_SIZE 分块并发请求，每块单独做主备对冲：URL 长度有上限，
+        # 一个慢响应也只拖住自己那一块；每块回来就写进结果，整批超时时已完成的块照常返回
+        code_map = {self._add_stock_prefix(c): c for c in stock_codes}
+        keys = list(code_map)
+        chunks = [{k: code_map[k] for k in keys[i:i + self.STOCK_CHUNK_SIZE]} for i in range(0, len(keys), self.STOCK_CHUNK_SIZE)]
+        await asyncio.gather(*(self._fetch_stock_chunk(limiter, chunk, result, source) for chunk in chunks))
+
+    async def _fetch_stock_chunk(self, limiter: asyncio.Semaphore, code_map: Dict[str, str], result: Dict[str, Any], source: str):
+        providers = {"tencent": self._query_tencent, "sina": self._query_sina}
+        primary = self._stock_source(source)
+        backup = "sina" if primary == "tencent" else "tencent"
+        quotes = await hedged(
+            lambda: providers[primary](limiter, code_map),
+            lambda: providers[backup](limiter, code_map),
+            delay=self.HEDGE_DELAY,
+        )
+        if quotes:
+            result["stocks"].update(quotes)
+
+    @staticmethod
+    def _stock_source(source: str) -> str:
+        return "sina" if source == "sina" else "tencent"
+
+    async def _query_tencent(self, limiter: asyncio.Semaphore, code_map: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+        try:
+            url = f"{self.endpoints['tencent']}/q={','.join(code_map.keys())}"
+            async with limiter:
+                resp = await self.pool.get(url, timeout=5)
+            return parse_tencent_quotes(resp.content.decode('gbk', errors='ignore'), code_map)
+        except CircuitOpenError:
+            pass
+        except Exception as e:
+            print(f"Stock Fetch Error (tencent): {e}")
+        return {}
+
+    async def _query_sina(self, limiter: asyncio.Semaphore, code_map: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+        try:
+            url = f"{self.endpoints['sina']}/list={','.join(code_map.keys())}"
+            async with limiter:
+                resp = await self.pool.get(url, timeout=5, headers={"Referer": "https://finance.sina.com.cn/"})
+            return parse_sina_quotes(resp.content.decode('gbk', errors='ignore'), code_map)
+        except CircuitOpenError:
+            pass
+        except Exception as e:
+            print(f"Stock Fetch Error (sina): {e}")
+        return {}
+
+    # ==========================================================
+    # 2. 基金部分 (终极修复：双接口比对，确权净值优先)
+    # ==========================================================
+    async def _fetch_funds(self, limiter: asyncio.Semaphore, fund_codes: List[str], result: Dict[str, Any]):
         timestamp = int(time.time() * 1000)
         # 获取当前日期 YYYY-MM-DD
         today_str = datetime.now().strftime('%Y-%m-%d')
-        
-        for code in fund_codes:
-            clean_code = str(code).strip()
-            
-            # 定义两个数据容器
-            data_realtime = None  # 方案A数据
-            data_official = None  # 方案B数据
-
-            # --- 步骤 1: 获取 A 接口 (实时估值) ---
-            try:
-                url = f"http://fundgz.1234567.com.cn/js/{clean_code}.js?rt={timestamp}"
-                resp = requests.get(url, timeout=2)
-                match = re.search(r'jsonpgz\((.*?)\);', resp.text)
-                if match:
-                    raw = json.loads(match.group(1))
-                    data_realtime = {
-                        "name": raw.get('name'),
-                        "gsz": float(raw.get('gsz', 0)),
-                        "dwjz": float(raw.get('dwjz', 0)),
-                        "gszzl": float(raw.get('gszzl', 0)),
-                        "jzrq": raw.get('jzrq', ''), # 净值日期
-                        "gztime": raw.get('gztime', '') # 估值时间
-                    }
-            except:
-                pass
-
-            # --- 步骤 2: 获取 B 接口 (官方结算信息) ---
-            # 无论 A 是否成功，为了保证晚间数据的绝对准确，必须尝试获取 B
-            try:
-                url_backup = f"http://fundsuggest.eastmoney.com/FundSearch/api/FundSearchAPI.ashx?m=1&key={clean_code}"
-                resp = requests.get(url_backup, timeout=3)
-                if resp.status_code == 200:
-                    raw = resp.json()
-                    if "Datas" in raw and len(raw["Datas"]) > 0:
-                        info = raw["Datas"][0]
-                        if info.get("CODE") == clean_code:
-                            base = info.get("FundBaseInfo", {})
-                            data_official = {
-                                "name": info.get("NAME"),
-                                "dwjz": float(base.get("DWJZ", 0)), # 官方确权净值
-                                "fsrq": base.get("FSRQ", "")        # 官方净值日期
-                            }
-            except:
-                pass
-
-            # --- 步骤 3: 终极裁决逻辑 (The Judge) ---
-            final_data = None
-            
-            # 情况 1: 只有 A，没有 B -> 只能用 A
-            if data_realtime and not data_official:
+        codes = [str(c).strip() for c in fund_codes]
+        loop = asyncio.get_running_loop()
+
+        # A 接口全部并发发出，同时从本地净值表取每只基金已知的最新确权净值
+        realtime_list = await asyncio.gather(*(self._fetch_fund_realtime(limiter, c, timestamp) for c in codes))
+        realtime = dict(zip(codes, realtime_list))
+        known: Dict[str, Dict[str, Any]] = {}
+        if self.nav_store is not None:
+            known = await loop.run_in_executor(None, self.nav_store.latest, codes)
+
+        # 只有“此刻可能已经公布、但本地和 A 接口都还没有”的净值才需要去问 B 接口：
+        # 盘中今天的净值不可能出来；A 的 jzrq 已经是最新日期，或者净值表里已有，都直接跳过
+        expected = market_calendar.latest_nav_date().strftime('%Y-%m-%d')
+        official: Dict[str, Dict[str, Any]] = {}
+        need_official: List[str] = []
+        for code in codes:
+            stored = known.get(code)
+            if stored and stored['fsrq'] >= expected:
+                official[code] = stored
+            elif not (realtime[code] and realtime[code]['jzrq'] >= expected):
+                need_official.append(code)
+
+        # 先用手头数据出一版结果，B 接口超时被取消时也有值可用 (待查 B 的基金此时不计入裁决统计)
+        pending = set(need_official)
+        for code in codes:
+            final_data = self._judge_fund(realtime[code], official.get(code) or known.get(code), today_str, record=code not in pending)
+            if final_data:
+                result["funds"][code] = final_data
+
+        if need_official:
+            fetched = await self._fetch_fund_official_batch(limiter, need_official)
+            official.update(fetched)
+            for code in need_official:
+                final_data = self._judge_fund(realtime[code], fetched.get(code) or known.get(code), today_str)
+                if final_data:
+                    result["funds"][code] = final_data
+
+        # A 接口的 (jzrq, dwjz) 本身就是一条确权净值，和 B 的结果一起落库
+        if self.nav_store is not None:
+            records = {c: {"name": r['name'], "dwjz": r['dwjz'], "fsrq": r['jzrq']} for c, r in realtime.items() if r}
+            for code, rec in official.items():
+                if rec['fsrq'] >= records.get(code, {}).get('fsrq', ''):
+                    records[code] = rec
+            await loop.run_in_executor(None, self.nav_store.record, records)
+
+    async def _fetch_fund_official_batch(self, limiter: asyncio.Semaphore, codes: List[str]) -> Dict[str, Dict[str, Any]]:
+        # 天天基金 App 接口一次可查多只基金的确权净值，按块并发；没查到的再逐只走 FundSearchAPI
+        chunks = [codes[i:i + self.NAV_BATCH_SIZE] for i in range(0, len(codes), self.NAV_BATCH_SIZE)]
+        found: Dict[str, Dict[str, Any]] = {}
+        for part in await asyncio.gather(*(self._fetch_fund_nav_chunk(limiter, chunk) for chunk in chunks)):
+            found.update(part)
+
+        missing = [c for c in codes if c not in found]
+        if missing:
+            singles = await asyncio.gather(*(self._fetch_fund_official(limiter, c) for c in missing))
+            found.update({c: r for c, r in zip(missing, singles) if r})
+        return found
+
+    async def _fetch_fund_nav_chunk(self, limiter: asyncio.Semaphore, codes: List[str]) -> Dict[str, Dict[str, Any]]:
+        found: Dict[str, Dict[str, Any]] = {}
+        try:
+            url = f"{self.endpoints['fundnav']}/FundMNewApi/FundMNFInfo"
+            params = {
+                "pageIndex": 1, "pageSize": len(codes), "plat": "Android", "appType": "ttjj",
+                "product": "EFund", "Version": "1", "deviceid": "pacc", "Fcodes": ",".join(codes),
+            }
+            async with limiter:
+                resp = await self.pool.get(url, params=params, timeout=3)
+            if resp.status_code == 200:
+                for info in resp.json().get("Datas") or []:
+                    code = info.get("FCODE")
+                    try:
+                        nav = float(info.get("NAV"))
+                    except (TypeError, ValueError):
+                        continue
+                    if code in codes and nav > 0 and info.get("PDATE"):
+                        found[code] = {
+                            "name": info.get("SHORTNAME"),
+                            "dwjz": nav,               # 官方确权净值
+                            "fsrq": info.get("PDATE")  # 官方净值日期
+                        }
+        except CircuitOpenError:
+            pass
+        except Exception as e:
+            print(f"Fund NAV Batch Error: {e}")
+        return found
+
+    async def _fetch_fund_realtime(self, limiter: asyncio.Semaphore, clean_code: str, timestamp: int) -> Optional[Dict[str, Any]]:
+        # --- 步骤 1: 获取 A 接口 (实时估值) ---
+        try:
+            url = f"{self.endpoints['fundgz']}/js/{clean_code}.js?rt={timestamp}"
+            async with limiter:
+                resp = await self.pool.get(url, timeout=2)
+            match = re.search(r'jsonpgz\((.*?)\);', resp.text)
+            if match:
+                raw = json.loads(match.group(1))
+                return {
+                    "name": raw.get('name'),
+                    "gsz": float(raw.get('gsz', 0)),
+                    "dwjz": float(raw.get('dwjz', 0)),
+                    "gszzl": float(raw.get('gszzl', 0)),
+                    "jzrq": raw.get('jzrq', ''), # 净值日期
+                    "gztime": raw.get('gztime', '') # 估值时间
+                }
+        except Exception:
+            # 网络类失败已由熔断器记录；单只基金解析失败交给 B 接口兜底
+            pass
+        return None
+
+    async def _fetch_fund_official(self, limiter: asyncio.Semaphore, clean_code: str) -> Optional[Dict[str, Any]]:
+        # --- 步骤 2: 获取 B 接口 (官方结算信息) ---
+        # 批量净值接口没查到的基金，逐只兜底查询
+        try:
+            url_backup = f"{self.endpoints['fundsearch']}/FundSearch/api/FundSearchAPI.ashx?m=1&key={clean_code}"
+            async with limiter:
+                resp = await self.pool.get(url_backup, timeout=3)
+            if resp.status_code == 200:
+                raw = resp.json()
+                if "Datas" in raw and len(raw["Datas"]) > 0:
+                    info = raw["Datas"][0]
+                    if info.get("CODE") == clean_code:
+                        base = info.get("FundBaseInfo", {})
+                        return {
+                            "name": info.get("NAME"),
+                            "dwjz": float(base.get("DWJZ", 0)), # 官方确权净值
+                            "fsrq": base.get("FSRQ", "")        # 官方净值日期
+                        }
+        except Exception:
+            pass
+        return None
+
+    @staticmethod
+    def _judge_fund(data_realtime: Optional[Dict[str, Any]], data_official: Optional[Dict[str, Any]], today_str: str, record: bool = True) -> Optional[Dict[str, Any]]:
+        # --- 步骤 3: 终极裁决逻辑 (The Judge) ---
+        final_data = None
+        case = "none"
+
+        # 情况 1: 只有 A，没有 B -> 只能用 A
+        if data_realtime and not data_official:
+            case = "realtime_only"
+            price = data_realtime['gsz'] if data_realtime['gsz'] > 0 else data_realtime['dwjz']
+            final_data = {
+                "name": data_realtime['name'],
+                "price": price,
+                "change": data_realtime['gszzl'],
+                "netValue": data_realtime['dwjz'],
+                "navDate": data_realtime['jzrq'],
+                "estimatedChange": data_realtime['gszzl']
+            }
+
+        # 情况 2: 只有 B，没有 A -> 只能用 B (通常是QDII或A接口挂了)
+        elif data_official and not data_realtime:
+            case = "official_only"
+            final_data = {
+                "name": data_official['name'],
+                "price": data_official['dwjz'],
+                "change": 0, # B接口无实时涨跌
+                "netValue": data_official['dwjz'],
+                "navDate": data_official['fsrq'],
+                "estimatedChange": 0
+            }
+
+        # 情况 3: A 和 B 都有 -> 关键比对！
+        elif data_realtime and data_official:
+            # 核心逻辑：如果 B(官方) 的日期 >= A(实时) 的日期，说明官方已更新，必须用官方！
+            # 或者，如果 B 的日期是今天，那绝对是用 B。
+            use_official = False
+
+            if data_official['fsrq'] > data_realtime['jzrq']:
+                use_official = True
+            elif data_official['fsrq'] == today_str:
+                use_official = True
+
+            case = "official_preferred" if use_official else "realtime_preferred"
+            if use_official:
+                # 使用官方确权数据
+                # 需要反推涨跌幅: (今日净值 - 昨日净值) / 昨日净值
+                # 由于我们没有直接的“昨日净值”，我们用 A 接口的“估值”反推“昨日收盘价”
+                # 昨收 ≈ 估值 / (1 + 估值涨幅%)
+                real_change = 0
+                try:
+                    if data_realtime['gsz'] > 0:
+                        last_close = data_realtime['gsz'] / (1 + data_realtime['gszzl'] / 100)
+                        real_change = ((data_official['dwjz'] - last_close) / last_close) * 100
+                except Exception:
+                    real_change = 0
+
+                final_data = {
+                    "name": data_official['name'],
+                    "price": data_official['dwjz'], # 强制用官方净值
+                    "change": real_change,          # 用反推的真实涨跌
+                    "netValue": data_official['dwjz'],
+                    "navDate": data_official['fsrq'],
+                    "estimatedChange": real_change
+                }
+            else:
+                # 官方还没更，还是盘中，或者A数据更新一点 -> 继续用 A 的估值
                 price = data_realtime['gsz'] if data_realtime['gsz'] > 0 else data_realtime['dwjz']
                 final_data = {
                     "name": data_realtime['name'],
@@ -134,63 +563,67 @@ class MarketEngine:
                     "estimatedChange": data_realtime['gszzl']
                 }
 
-            # 情况 2: 只有 B，没有 A -> 只能用 B (通常是QDII或A接口挂了)
-            elif data_official and not data_realtime:
-                 final_data = {
-                    "name": data_official['name'],
-                    "price": data_official['dwjz'],
-                    "change": 0, # B接口无实时涨跌
-                    "netValue": data_official['dwjz'],
-                    "navDate": data_official['fsrq'],
-                    "estimatedChange": 0
-                }
+        if record:
+            metrics.FUND_JUDGE_TOTAL.inc(case=case)
+        return final_data
+
+
+# ==========================================================
+# 股票行情解析：只捕获用到的几个字段，其余字段不切分成字符串
+# ==========================================================
+# 腾讯: v_sh600000="1~名称~代码~现价~昨收~今开~...~涨跌幅(第 32 个字段)~...";
+# 一条记录 80 多个字段，正则只匹配到第 5 个字段为止，记录尾部用 find / count 跳过
+_TENCENT_HEAD = re.compile(r'v_([a-z]{2}\d+)="[^~"]*~([^~"]*)~[^~"]*~([^~"]*)~([^~"]*)~')
+# 新浪: var hq_str_sh600000="名称,今开,昨收,现价,最高,最低,..."; 字段数不足 6 的视为无效记录
+_SINA_RECORD = re.compile(r'hq_str_([a-z]{2}\d+)="([^,"]*),[^,"]*,([^,"]*),([^,"]*)(?:,[^,"]*){2}[^"]*"')
+
+
+def _quote(name: str, current_price: float, yesterday_close: float) -> Dict[str, Any]:
+    change_percent = 0.0
+    if current_price == 0 and yesterday_close > 0:
+        current_price = yesterday_close
+    elif yesterday_close > 0:
+        change_percent = ((current_price - yesterday_close) / yesterday_close) * 100
+    return {"name": name, "price": current_price, "change": change_percent}
+
+
+def parse_tencent_quotes(content: str, code_map: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+    quotes: Dict[str, Dict[str, Any]] = {}
+    search, find, count = _TENCENT_HEAD.search, content.find, content.count
+    pos = 0
+    while True:
+        m = search(content, pos)
+        if m is None:
+            break
+        end = find('"', m.end())
+        if end < 0:
+            break
+        pos = end + 1
+        key, name, price, close = m.groups()
+        code = code_map.get(key)
+        # 字段总数不足 31 的视为无效记录 (停牌/代码不存在时接口返回的短记录)；正则已吃掉 5 个 ~，剩余至少 25 个
+        if code is None or count('~', m.end(), end) < 25:
+            continue
+        try:
+            yesterday_close = float(close)
+            quote = _quote(name, float(price), yesterday_close)
+            if yesterday_close <= 0:
+                # 没有昨收时才用接口自带的涨跌幅，只有这种少见情况需要把记录尾部切开
+                quote["change"] = float(content[m.end():end].split('~')[27])
+        except (ValueError, IndexError):
+            continue
+        quotes[code] = quote
+    return quotes
 
-            # 情况 3: A 和 B 都有 -> 关键比对！
-            elif data_realtime and data_official:
-                # 核心逻辑：如果 B(官方) 的日期 >= A(实时) 的日期，说明官方已更新，必须用官方！
-                # 或者，如果 B 的日期是今天，那绝对是用 B。
-                use_official = False
-                
-                if data_official['fsrq'] > data_realtime['jzrq']:
-                    use_official = True
-                elif data_official['fsrq'] == today_str:
-                    use_official = True
-                
-                if use_official:
-                    # 使用官方确权数据
-                    # 需要反推涨跌幅: (今日净值 - 昨日净值) / 昨日净值
-                    # 由于我们没有直接的“昨日净值”，我们用 A 接口的“估值”反推“昨日收盘价”
-                    # 昨收 ≈ 估值 / (1 + 估值涨幅%)
-                    real_change = 0
-                    try:
-                        if data_realtime['gsz'] > 0:
-                             last_close = data_realtime['gsz'] / (1 + data_realtime['gszzl'] / 100)
-                             real_change = ((data_official['dwjz'] - last_close) / last_close) * 100
-                    except:
-                        real_change = 0
-
-                    final_data = {
-                        "name": data_official['name'],
-                        "price": data_official['dwjz'], # 强制用官方净值
-                        "change": real_change,          # 用反推的真实涨跌
-                        "netValue": data_official['dwjz'],
-                        "navDate": data_official['fsrq'],
-                        "estimatedChange": real_change
-                    }
-                else:
-                    # 官方还没更，还是盘中，或者A数据更新一点 -> 继续用 A 的估值
-                    price = data_realtime['gsz'] if data_realtime['gsz'] > 0 else data_realtime['dwjz']
-                    final_data = {
-                        "name": data_realtime['name'],
-                        "price": price,
-                        "change": data_realtime['gszzl'],
-                        "netValue": data_realtime['dwjz'],
-                        "navDate": data_realtime['jzrq'],
-                        "estimatedChange": data_realtime['gszzl']
-                    }
-
-            # --- 存入结果 ---
-            if final_data:
-                result["funds"][clean_code] = final_data
 
-        return result
\ No newline at end of file
+def parse_sina_quotes(content: str, code_map: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+    quotes: Dict[str, Dict[str, Any]] = {}
+    for key, name, close, price in _SINA_RECORD.findall(content):
+        code = code_map.get(key)
+        if code is None:
+            continue
+        try:
+            quotes[code] = _quote(name, float(price), float(close))
+        except ValueError:
+            continue
+    return quotes
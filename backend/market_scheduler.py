@@ -0,0 +1,54 @@
+import asyncio
+from typing import List
+
+import models
+import market_calendar
+import metrics
+from database import SessionLocal
+from market_engine import MarketEngine
+
+
+class MarketRefreshScheduler:
+    """按交易日历决定什么时候真正去上游拉数据。
+
+    盘中由 MarketEngine 的短 TTL 缓存控制刷新频率；休市时缓存一直用到下次开盘，
+    唯一的例外是晚间基金净值：官方净值在收盘后陆续公布，这里按时间点补扫
+    navDate 还停留在上一交易日的基金，其余基金和股票整晚不再访问上游。
+    """
+    # 晚间净值补扫时间点 (基金公司一般 18:00~23:00 陆续公布当日净值)
+    NAV_SWEEP_TIMES = ((19, 0), (20, 30), (22, 0), (23, 30))
+
+    def __init__(self, engine: MarketEngine):
+        self.engine = engine
+
+    def register(self, jobs):
+        for hour, minute in self.NAV_SWEEP_TIMES:
+            jobs.add(f"nav_sweep_{hour:02d}{minute:02d}", self.sweep_stale_navs, 'cron', day_of_week='mon-fri', hour=hour, minute=minute)
+
+    @staticmethod
+    def _load_fund_codes() -> List[str]:
+        db = SessionLocal()
+        try:
+            rows = db.query(models.Asset.code).filter(models.Asset.asset_type == "fund").distinct().all()
+        finally:
+            db.close()
+        return sorted({str(code).strip() for (code,) in rows})
+
+    def stale_fund_codes(self, codes: List[str]) -> List[str]:
+        nav_day = market_calendar.last_trading_day().strftime('%Y-%m-%d')
+        cached = self.engine.cached_funds(codes)
+        return [code for code in codes if code not in cached or (cached[code].get("navDate") or "") < nav_day]
+
+    def _stale_holdings(self) -> List[str]:
+        return self.stale_fund_codes(self._load_fund_codes())
+
+    @metrics.timed_job("nav_sweep")
+    async def sweep_stale_navs(self):
+        if not market_calendar.is_trading_day():
+            return
+        # 查库和读缓存都是阻塞调用，放到线程池里
+        stale = await asyncio.get_running_loop().run_in_executor(None, self._stale_holdings)
+        if not stale:
+            return
+        result = await self.engine.get_real_time_data([], stale, force=True)
+        print(f"NAV sweep: refreshed {len(result['funds'])}/{len(stale)} stale funds")
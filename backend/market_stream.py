@@ -0,0 +1,166 @@
+import asyncio
+import json
+from typing import Dict, Any, Set, Tuple, Optional
+
+import models
+from database import SessionLocal
+import market_calendar
+from market_engine import MarketEngine
+
+
+class MarketStreamHub:
+    """行情推送中心：一个后台生产者刷新所有持仓的行情，把变化的部分推给每个订阅者。
+
+    不管开了多少个浏览器标签页，每一轮只查一次库、每个行情源只抓一次上游。
+    订阅时带上前端设置里选的股票行情源 (sina / tencent)，每个源各维护一份最新行情。
+    """
+    # 推送间隔 (秒)：盘中尽量快，收盘后价格不动，只需低频兜底
+    TRADING_INTERVAL = 3
+    CLOSED_INTERVAL = 60
+    # 订阅者队列上限，消费太慢时直接丢弃积压改发全量快照
+    QUEUE_SIZE = 32
+    # 不带 source 的订阅沿用 MarketEngine 的默认源
+    DEFAULT_SOURCE = "tencent"
+
+    def __init__(self, engine: MarketEngine):
+        self.engine = engine
+        # 行情源 -> 最新行情
+        self.latest: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        # 订阅者队列 -> (owner_id, 行情源)，用于按用户持仓和所选行情源过滤推送内容
+        self._subscribers: Dict[asyncio.Queue, Tuple[int, str]] = {}
+        # 已经收到过全量快照的订阅者
+        self._primed: Set[asyncio.Queue] = set()
+        # owner_id -> (股票代码集合, 基金代码集合)，每轮由生产者刷新
+        self._holdings: Dict[int, Tuple[Set[str], Set[str]]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    @classmethod
+    def normalize_source(cls, source: Optional[str]) -> str:
+        if source in ("sina", "tencent"):
+            return source
+        return cls.DEFAULT_SOURCE
+
+    def _latest(self, source: str) -> Dict[str, Dict[str, Any]]:
+        return self.latest.setdefault(source, {"stocks": {}, "funds": {}})
+
+    def interval(self) -> float:
+        return self.TRADING_INTERVAL if market_calendar.is_trading_time() else self.CLOSED_INTERVAL
+
+    @staticmethod
+    def _load_holdings() -> Dict[int, Tuple[Set[str], Set[str]]]:
+        db = SessionLocal()
+        try:
+            rows = db.query(models.Asset.owner_id, models.Asset.asset_type, models.Asset.code).filter(
+                models.Asset.asset_type.in_(("stock", "fund"))
+            ).all()
+        finally:
+            db.close()
+        holdings: Dict[int, Tuple[Set[str], Set[str]]] = {}
+        for owner_id, asset_type, code in rows:
+            stocks, funds = holdings.setdefault(owner_id, (set(), set()))
+            (stocks if asset_type == "stock" else funds).add(str(code).strip())
+        return holdings
+
+    def _view(self, owner_id: int, data: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        stocks, funds = self._holdings.get(owner_id, (set(), set()))
+        return {
+            "stocks": {c: v for c, v in data["stocks"].items() if c in stocks},
+            "funds": {c: v for c, v in data["funds"].items() if c in funds},
+        }
+
+    def _push(self, queue: asyncio.Queue, event: str, payload: Dict[str, Any]):
+        try:
+            queue.put_nowait((event, payload))
+        except asyncio.QueueFull:
+            # 积压说明客户端跟不上，清空后补发一份该用户的全量快照
+            while not queue.empty():
+                queue.get_nowait()
+            owner_id, source = self._subscribers[queue]
+            queue.put_nowait(("snapshot", self._view(owner_id, self._latest(source))))
+
+    async def subscribe(self, owner_id: int, source: Optional[str] = None) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(self.QUEUE_SIZE)
+        source = self.normalize_source(source)
+        self._subscribers[queue] = (owner_id, source)
+        # 这个源还没抓过 (第一次有人选它) 时等生产者跑完一轮再发快照
+        if owner_id in self._holdings and source in self.latest:
+            queue.put_nowait(("snapshot", self._view(owner_id, self.latest[source])))
+            self._primed.add(queue)
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+        else:
+            # 新用户的持仓或新选的行情源可能还没被生产者加载，立即触发一轮
+            self._wakeup.set()
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.pop(queue, None)
+        self._primed.discard(queue)
+
+    async def _tick(self):
+        loop = asyncio.get_running_loop()
+        self._holdings = await loop.run_in_executor(None, self._load_holdings)
+
+        stock_codes: Set[str] = set()
+        fund_codes: Set[str] = set()
+        for stocks, funds in self._holdings.values():
+            stock_codes |= stocks
+            fund_codes |= funds
+
+        # 每个在用的行情源抓一次；基金不分源，第二次会直接命中引擎缓存
+        sources = sorted({source for _, source in self._subscribers.values()})
+        markets = await asyncio.gather(*(
+            self.engine.get_real_time_data(sorted(stock_codes), sorted(fund_codes), source=source) for source in sources
+        ))
+
+        deltas: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for source, market in zip(sources, markets):
+            latest = self._latest(source)
+            delta = deltas[source] = {"stocks": {}, "funds": {}}
+            for bucket in ("stocks", "funds"):
+                for code, value in market[bucket].items():
+                    if latest[bucket].get(code) != value:
+                        delta[bucket][code] = value
+                latest[bucket].update(delta[bucket])
+
+        for queue, (owner_id, source) in list(self._subscribers.items()):
+            if source not in deltas:
+                # 本轮开始后才订阅的新行情源，下一轮再发
+                continue
+            if queue not in self._primed:
+                self._push(queue, "snapshot", self._view(owner_id, self.latest[source]))
+                self._primed.add(queue)
+                continue
+            view = self._view(owner_id, deltas[source])
+            if view["stocks"] or view["funds"]:
+                self._push(queue, "delta", view)
+
+    async def _run(self):
+        # 没有订阅者时生产者自动退出，下次有人订阅再拉起
+        while self._subscribers:
+            self._wakeup.clear()
+            try:
+                await self._tick()
+            except Exception as e:
+                print(f"Market stream tick failed: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval())
+            except asyncio.TimeoutError:
+                pass
+
+    async def events(self, owner_id: int, is_disconnected, source: Optional[str] = None, heartbeat: float = 15):
+        """SSE 事件流：首包为全量快照，之后只推送变化的代码。"""
+        queue = await self.subscribe(owner_id, source)
+        try:
+            while not await is_disconnected():
+                try:
+                    event, payload = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    # 心跳注释行，防止代理层因空闲断开长连接
+                    yield ": ping\n\n"
+                    continue
+                yield f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+        finally:
+            self.unsubscribe(queue)
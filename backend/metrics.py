@@ -0,0 +1,167 @@
+"""轻量级 Prometheus 指标：Counter / Gauge / Histogram，输出标准文本格式供 /metrics 抓取。
+
+不依赖 prometheus_client；每次记录只是加锁后改一个 dict，热路径上常开也没有负担。
+"""
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_registry: List["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) and not v.is_integer() else str(int(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        return [f"{self.name}{_fmt_labels(self.labelnames, k)} {_fmt_value(v)}" for k, v in self._values.items()]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _samples(self):
+        return [f"{self.name}{_fmt_labels(self.labelnames, k)} {_fmt_value(v)}" for k, v in self._values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # key -> [各桶计数..., sum, count]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+                    break
+            row[-2] += value
+            row[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        lines = []
+        for key, row in self._values.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets, row):
+                cumulative += n
+                le = 'le="%s"' % _fmt_value(bound)
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, key)} {_fmt_value(row[-2])}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, key)} {_fmt_value(row[-1])}")
+        return lines
+
+
+def timed_job(job: str):
+    """记录异步定时任务的耗时和成败。"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            outcome = "ok"
+            try:
+                return await fn(*args, **kwargs)
+            except BaseException:
+                outcome = "error"
+                raise
+            finally:
+                JOB_SECONDS.observe(time.perf_counter() - start, job=job, outcome=outcome)
+        return wrapper
+    return decorator
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ==========================================================
+# 全局指标定义 (各模块直接 import 使用)
+# ==========================================================
+HTTP_REQUEST_SECONDS = Histogram("pacc_http_request_seconds", "HTTP 接口耗时", ("method", "route", "status"))
+STAGE_SECONDS = Histogram("pacc_stage_seconds", "接口内部各阶段耗时 (查库/抓行情/序列化)", ("stage",))
+UPSTREAM_SECONDS = Histogram("pacc_upstream_request_seconds", "上游请求耗时", ("host", "outcome"))
+UPSTREAM_CIRCUIT_OPEN = Counter("pacc_upstream_circuit_rejected_total", "熔断期间被直接拒绝的上游请求数", ("host",))
+UPSTREAM_CIRCUIT_STATE = Gauge("pacc_upstream_circuit_open", "熔断器状态 (1=打开, 0=关闭)", ("host",))
+QUOTE_CACHE_TOTAL = Counter("pacc_quote_cache_requests_total", "行情缓存查询结果 (hit/miss/coalesced/shared)", ("bucket", "result"))
+FUND_JUDGE_TOTAL = Counter("pacc_fund_judge_total", "基金裁决结果分布", ("case",))
+DB_QUERY_SECONDS = Histogram("pacc_db_query_seconds", "SQLite 语句耗时", ("statement",), buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1))
+WEBHOOK_DELIVERIES = Counter("pacc_webhook_deliveries_total", "Webhook 投递结果 (sent/retry/dead)", ("outcome",))
+JOB_SECONDS = Histogram("pacc_job_duration_seconds", "定时任务耗时", ("job", "outcome"), buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120))
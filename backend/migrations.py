@@ -0,0 +1,166 @@
+"""版本化的数据库迁移。
+
+schema_version 表记录已经执行到的版本，启动时只读一次这个表：版本是最新的就直接返回，
+不再逐个探测字段、建表、建索引。需要升级时先拿 SQLite 写锁 (BEGIN IMMEDIATE) 再复查版本，
+多个 worker 同时启动也只有一个真正执行迁移，其余的等锁释放后发现已是最新版本直接返回。
+
+新增表/字段/索引时在 MIGRATIONS 末尾追加一步，版本号递增；每一步都要能在
+"新库 (第 1 步已按当前模型建好全部表)" 和 "老库" 上安全执行。
+"""
+import time
+from typing import Callable, List, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+import models
+import asset_transactions
+from database import IS_SQLITE
+
+VERSION_TABLE = "schema_version"
+
+
+# ==========================================================
+# 工具
+# ==========================================================
+def _columns(conn: Connection, table: str) -> set:
+    return {c["name"] for c in inspect(conn).get_columns(table)}
+
+
+def _add_columns(conn: Connection, table: str, columns: List[Tuple[str, str]]):
+    existing = _columns(conn, table)
+    for name, ddl in columns:
+        if name not in existing:
+            print(f">>> [MIGRATE] Adding '{name}' column to {table}")
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+
+
+# ==========================================================
+# 迁移步骤 (只能追加，不能改已发布步骤的含义)
+# ==========================================================
+def _create_tables(conn: Connection):
+    # 新库一步建好当前模型的全部表和索引；老库只补缺失的表
+    models.Base.metadata.create_all(bind=conn)
+
+
+def _assets_extra(conn: Connection):
+    _add_columns(conn, "assets", [("extra", "VARCHAR")])
+
+
+def _asset_history_profit(conn: Connection):
+    _add_columns(conn, "asset_history", [
+        ("total_principal", "FLOAT DEFAULT 0"),
+        ("stock_profit", "FLOAT DEFAULT 0"),
+        ("fund_profit", "FLOAT DEFAULT 0"),
+        ("fixed_profit", "FLOAT DEFAULT 0"),
+    ])
+
+
+def _hot_path_indexes(conn: Connection):
+    # 老库补建热点查询的复合索引 (create_all 不会给已存在的表加索引)；
+    # 唯一索引之前先清掉同一天的重复快照，只保留最新写入的一条
+    conn.execute(text(
+        "DELETE FROM asset_history WHERE id NOT IN "
+        "(SELECT MAX(id) FROM asset_history GROUP BY owner_id, date)"
+    ))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_assets_owner_type ON assets (owner_id, asset_type)"))
+    conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ux_asset_history_owner_date ON asset_history (owner_id, date)"))
+
+
+def _fixed_lots(conn: Connection):
+    # 把理财的 extra JSON 明细拆进 asset_transactions 表；
+    # 以前由 system_config 的标记保证只做一次，已经做过的老库这里直接跳过
+    db = Session(bind=conn)
+    try:
+        marker = db.query(models.SystemConfig).filter(models.SystemConfig.key == "migrated_asset_transactions").first()
+        if marker:
+            return
+        migrated = asset_transactions.backfill_from_extra(db)
+        db.add(models.SystemConfig(key="migrated_asset_transactions", value="1"))
+        db.flush()
+        print(f">>> [MIGRATE] Migrated buy details of {migrated} fixed assets into asset_transactions")
+    finally:
+        db.close()
+
+
+def _securities(conn: Connection):
+    models.Security.__table__.create(bind=conn, checkfirst=True)
+
+
+def _webhook_outbox(conn: Connection):
+    models.WebhookOutbox.__table__.create(bind=conn, checkfirst=True)
+
+
+def _jobs(conn: Connection):
+    models.JobLease.__table__.create(bind=conn, checkfirst=True)
+    models.JobRun.__table__.create(bind=conn, checkfirst=True)
+
+
+def _fixed_accruals(conn: Connection):
+    _add_columns(conn, "assets", [
+        ("interest_mode", "VARCHAR DEFAULT 'simple'"),
+        ("value_lag", "INTEGER DEFAULT 0"),
+        ("holiday_rule", "VARCHAR DEFAULT 'calendar'"),
+    ])
+    models.FixedAccrual.__table__.create(bind=conn, checkfirst=True)
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "create tables", _create_tables),
+    (2, "assets.extra", _assets_extra),
+    (3, "asset_history profit columns", _asset_history_profit),
+    (4, "hot path indexes", _hot_path_indexes),
+    (5, "fixed income lots", _fixed_lots),
+    (6, "securities", _securities),
+    (7, "webhook outbox", _webhook_outbox),
+    (8, "job leases and runs", _jobs),
+    (9, "fixed income accrual ledger", _fixed_accruals),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+# ==========================================================
+# 执行
+# ==========================================================
+def _current_version(conn: Connection) -> int:
+    return conn.execute(text(f"SELECT COALESCE(MAX(version), 0) FROM {VERSION_TABLE}")).scalar() or 0
+
+
+def run(engine: Engine) -> int:
+    """把数据库升级到最新版本，返回升级后的版本号。已是最新版本时只有一次只读查询。"""
+    with engine.connect() as conn:
+        try:
+            version = _current_version(conn)
+        except Exception:
+            version = -1  # 版本表还不存在：新库，或者是引入迁移之前的老库
+        conn.rollback()
+    if version >= LATEST_VERSION:
+        return version
+
+    with engine.connect() as conn:
+        if IS_SQLITE:
+            # 先拿写锁再复查版本，别的 worker 已经迁移完的话这里什么都不做
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {VERSION_TABLE} "
+            "(version INTEGER PRIMARY KEY, name VARCHAR, applied_at FLOAT)"
+        ))
+        version = _current_version(conn)
+        try:
+            for number, name, step in MIGRATIONS:
+                if number <= version:
+                    continue
+                start = time.perf_counter()
+                step(conn)
+                conn.execute(
+                    text(f"INSERT INTO {VERSION_TABLE} (version, name, applied_at) VALUES (:v, :n, :t)"),
+                    {"v": number, "n": name, "t": time.time()},
+                )
+                print(f">>> [MIGRATE] v{number} {name} ({(time.perf_counter() - start) * 1000:.0f} ms)")
+                version = number
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return version
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Date
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Date, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from database import Base
 import datetime
@@ -13,6 +13,8 @@ class User(Base):
 
 class Asset(Base):
     __tablename__ = "assets"
+    # 几乎所有查询都是“某用户的某类资产”
+    __table_args__ = (Index("ix_assets_owner_type", "owner_id", "asset_type"),)
     id = Column(Integer, primary_key=True, index=True)
     owner_id = Column(Integer, ForeignKey("users.id"))
     asset_type = Column(String)  # stock, fund, fixed
@@ -23,11 +25,44 @@ class Asset(Base):
     tag = Column(String, default="稳健")
     start_date = Column(String, nullable=True) # 理财起始日
     apy = Column(Float, nullable=True)         # 理财年化
+    # 理财计息规则：simple 单利 / compound 按日复利；买入后第几个交易日起息 (T+N)；
+    # 非交易日 calendar 照常计息 / defer 顺延到下一个交易日入账 / skip 不计息
+    interest_mode = Column(String, nullable=True, default="simple")
+    value_lag = Column(Integer, nullable=True, default=0)
+    holiday_rule = Column(String, nullable=True, default="calendar")
     
     # 【新增】万能扩展字段，用于存储买入明细的 JSON 字符串
     extra = Column(String, nullable=True)      
     
     owner = relationship("User", back_populates="assets")
+    transactions = relationship("AssetTransaction", back_populates="asset", order_by="AssetTransaction.date")
+
+class AssetTransaction(Base):
+    """理财买入明细，一笔一行 (以前整体序列化成 JSON 存在 Asset.extra 里)"""
+    __tablename__ = "asset_transactions"
+    __table_args__ = (Index("ix_asset_transactions_asset_date", "asset_id", "date"),)
+    id = Column(Integer, primary_key=True, index=True)
+    asset_id = Column(Integer, ForeignKey("assets.id"))
+    date = Column(Date)
+    amount = Column(Float, default=0)
+
+    asset = relationship("Asset", back_populates="transactions")
+
+class FixedAccrual(Base):
+    """理财逐笔计息台账：每笔买入明细每个入账日一行，每天只追加当天的利息；
+    明细或计息规则变动时删掉该资产的台账，从起息日重新生成"""
+    __tablename__ = "fixed_accruals"
+    __table_args__ = (
+        Index("ux_fixed_accruals_lot_date", "lot_id", "date", unique=True),
+        Index("ix_fixed_accruals_asset_date", "asset_id", "date"),
+    )
+    id = Column(Integer, primary_key=True)
+    asset_id = Column(Integer, ForeignKey("assets.id"))
+    lot_id = Column(Integer, ForeignKey("asset_transactions.id"))
+    date = Column(Date)          # 入账日
+    days = Column(Integer)       # 本次入账覆盖的自然日天数 (defer 规则下周一会是 3)
+    interest = Column(Float)     # 本次入账利息
+    accrued = Column(Float)      # 截至本次的累计利息
 
 class SystemConfig(Base):
     __tablename__ = "system_config"
@@ -37,6 +72,8 @@ class SystemConfig(Base):
 # 你的 AssetHistory 保持现状即可，它是完美的
 class AssetHistory(Base):
     __tablename__ = "asset_history"
+    # 每个用户每天只有一条快照，同时覆盖历史曲线的按用户 + 日期排序查询
+    __table_args__ = (Index("ux_asset_history_owner_date", "owner_id", "date", unique=True),)
     id = Column(Integer, primary_key=True, index=True)
     owner_id = Column(Integer, ForeignKey("users.id"))
     date = Column(Date, index=True)
@@ -51,4 +88,120 @@ class AssetHistory(Base):
     fund_profit = Column(Float, default=0)     # 基金当日盈亏
     fixed_profit = Column(Float, default=0)    # 理财当日收益
     
-    owner = relationship("User", back_populates="history")
\ No newline at end of file
+    owner = relationship("User", back_populates="history")
+
+class PriceHistory(Base):
+    """按 (类型, 代码, 日期) 存的确权价格：基金为官方单位净值，股票为收盘价，一天一条，确认后不再向上游重复查询"""
+    __tablename__ = "price_history"
+    __table_args__ = (UniqueConstraint("asset_type", "code", "date", name="uq_price_history_type_code_date"),)
+    id = Column(Integer, primary_key=True, index=True)
+    asset_type = Column(String)  # stock / fund
+    code = Column(String)
+    date = Column(Date)
+    price = Column(Float)
+    name = Column(String, nullable=True)
+
+class IntradayPoint(Base):
+    """盘中组合估值采样：一行一个采样点，金额按整数分存，(owner_id, ts) 为主键的 WITHOUT ROWID 窄表"""
+    __tablename__ = "intraday_points"
+    __table_args__ = {"sqlite_with_rowid": False}
+    owner_id = Column(Integer, primary_key=True)
+    ts = Column(Integer, primary_key=True)    # unix 秒 (按采样间隔对齐)
+    total_asset = Column(Integer)             # 以下均为分
+    day_profit = Column(Integer)
+    stock_value = Column(Integer)
+    fund_value = Column(Integer)
+    fixed_value = Column(Integer)
+
+class IntradayBar(Base):
+    """过了保留期的盘中采样压缩成的 OHLC 柱 (按总资产)，分类市值和当日盈亏取柱内最后一个值"""
+    __tablename__ = "intraday_bars"
+    __table_args__ = {"sqlite_with_rowid": False}
+    owner_id = Column(Integer, primary_key=True)
+    ts = Column(Integer, primary_key=True)    # 柱起始 unix 秒
+    open = Column(Integer)
+    high = Column(Integer)
+    low = Column(Integer)
+    close = Column(Integer)
+    day_profit = Column(Integer)
+    stock_value = Column(Integer)
+    fund_value = Column(Integer)
+    fixed_value = Column(Integer)
+
+class HoldingHistory(Base):
+    """每只持仓每天一行：当日价格/数量/市值/盈亏，外加写入时顺手维护的累计盈亏和时间加权收益指数。
+
+    twr_index 从 1.0 起按日收益连乘，任意区间收益 = 期末指数 / 期初指数 - 1，查一行即可。
+    理财的 price 存当前市值 (与 assets.cost_price 同义)，quantity 存本金。
+    """
+    __tablename__ = "holding_history"
+    __table_args__ = (
+        Index("ux_holding_history_asset_date", "asset_id", "date", unique=True),
+        Index("ix_holding_history_owner_date", "owner_id", "date"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(Integer, ForeignKey("users.id"))
+    asset_id = Column(Integer, ForeignKey("assets.id"))
+    asset_type = Column(String)
+    code = Column(String)
+    date = Column(Date)
+    price = Column(Float)
+    quantity = Column(Float)
+    market_value = Column(Float)
+    day_profit = Column(Float)
+    cum_profit = Column(Float)    # 自第一条记录起的累计盈亏
+    twr_index = Column(Float)     # 时间加权收益指数，首日之前为 1.0
+
+class Security(Base):
+    """证券主表：全部 A 股、场内 ETF 和开放式基金的代码和名称，每天从上游整表刷新一次"""
+    __tablename__ = "securities"
+    __table_args__ = {"sqlite_with_rowid": False}
+    asset_type = Column(String, primary_key=True)  # stock (含场内 ETF) / fund
+    code = Column(String, primary_key=True)
+    name = Column(String)
+    kind = Column(String, nullable=True)    # A股 / ETF / 基金类型 (混合型、债券型...)
+    pinyin = Column(String, nullable=True)  # 名称拼音首字母，小写
+    updated_at = Column(DateTime)
+
+class WebhookOutbox(Base):
+    """待发送的 Webhook 消息：快照任务只负责写入，后台协程负责投递和重试；
+    (owner_id, kind, report_date, target) 唯一，同一份日报对同一个地址最多一条"""
+    __tablename__ = "webhook_outbox"
+    __table_args__ = (
+        UniqueConstraint("owner_id", "kind", "report_date", "target", name="uq_webhook_outbox_report_target"),
+        Index("ix_webhook_outbox_status_due", "status", "next_attempt_at"),
+    )
+    id = Column(Integer, primary_key=True)
+    owner_id = Column(Integer)
+    kind = Column(String)          # daily_report
+    report_date = Column(Date)
+    target = Column(String)        # Webhook 地址
+    format = Column(String)        # wecom / dingtalk / feishu / slack / json
+    payload = Column(String)       # 已按 format 渲染好的请求体 (JSON 文本)
+    status = Column(String, default="pending")  # pending / sent / dead
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime)
+    sent_at = Column(DateTime, nullable=True)
+
+class JobLease(Base):
+    """定时任务的主节点租约：多个 worker 里只有持有未过期租约的那个执行单例任务"""
+    __tablename__ = "job_leases"
+    name = Column(String, primary_key=True)
+    owner = Column(String)          # 主机名:进程号:随机串
+    expires_at = Column(Float)      # unix 秒
+    acquired_at = Column(Float)
+
+class JobRun(Base):
+    """定时任务执行记录"""
+    __tablename__ = "job_runs"
+    __table_args__ = (Index("ix_job_runs_name_id", "name", "id"),)
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    owner = Column(String)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime, nullable=True)
+    duration = Column(Float, nullable=True)  # 秒
+    status = Column(String)                  # running / ok / error
+    error = Column(String, nullable=True)
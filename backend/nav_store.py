@@ -0,0 +1,82 @@
+import threading
+from datetime import datetime
+from typing import Dict, Any, List, Set
+
+from sqlalchemy import func, and_
+from sqlalchemy.dialects.sqlite import insert
+
+import models
+from database import SessionLocal
+
+
+class NavStore:
+    """基金官方净值的本地日表 (price_history)，外加一份每只基金最新净值的内存索引。
+
+    某只基金某天的确权净值一旦拿到就落库，之后直接从这里取，不再请求 B 接口。
+    返回的记录和 B 接口解析结果同构：{"name", "dwjz", "fsrq"}。
+    """
+    def __init__(self):
+        self._latest: Dict[str, Dict[str, Any]] = {}
+        # 已经从数据库加载过的代码 (库里没有记录的也算，避免每次刷新都重复查库)
+        self._loaded: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def latest(self, codes: List[str]) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            missing = [c for c in codes if c not in self._loaded]
+        if missing:
+            self._load(missing)
+        with self._lock:
+            return {c: self._latest[c] for c in codes if c in self._latest}
+
+    def _load(self, codes: List[str]):
+        db = SessionLocal()
+        try:
+            P = models.PriceHistory
+            newest = db.query(P.code, func.max(P.date).label("max_date")).filter(
+                P.asset_type == "fund", P.code.in_(codes)
+            ).group_by(P.code).subquery()
+            rows = db.query(P).join(newest, and_(P.code == newest.c.code, P.date == newest.c.max_date)).filter(
+                P.asset_type == "fund"
+            ).all()
+        finally:
+            db.close()
+        with self._lock:
+            for r in rows:
+                self._remember(r.code, {"name": r.name, "dwjz": r.price, "fsrq": r.date.strftime('%Y-%m-%d')})
+            self._loaded.update(codes)
+
+    def _remember(self, code: str, record: Dict[str, Any]) -> bool:
+        current = self._latest.get(code)
+        if current and current["fsrq"] >= record["fsrq"]:
+            return False
+        self._latest[code] = record
+        return True
+
+    def record(self, records: Dict[str, Dict[str, Any]]):
+        """写入新拿到的确权净值，只有比已知更新的日期才会落库。"""
+        fresh = []
+        with self._lock:
+            for code, rec in records.items():
+                if not rec.get("fsrq") or not rec.get("dwjz"):
+                    continue
+                if self._remember(code, rec):
+                    fresh.append((code, rec))
+        if not fresh:
+            return
+
+        db = SessionLocal()
+        try:
+            stmt = insert(models.PriceHistory).values([{
+                "asset_type": "fund",
+                "code": code,
+                "date": datetime.strptime(rec["fsrq"], '%Y-%m-%d').date(),
+                "price": rec["dwjz"],
+                "name": rec.get("name"),
+            } for code, rec in fresh])
+            db.execute(stmt.on_conflict_do_nothing(index_elements=["asset_type", "code", "date"]))
+            db.commit()
+        except Exception as e:
+            print(f"NAV store write failed: {e}")
+        finally:
+            db.close()
@@ -0,0 +1,355 @@
+import asyncio
+import csv
+import io
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert
+
+import models
+import market_calendar
+import metrics
+import holding_history
+import valuation
+from database import SessionLocal
+from market_engine import MarketEngine
+from upstream import CircuitOpenError
+
+
+def _parse_date(value: Any) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    s = str(value).strip()
+    for fmt in ("%Y-%m-%d", "%Y%m%d", "%Y/%m/%d"):
+        try:
+            return datetime.strptime(s[:10], fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"bad date '{value}'")
+
+
+class PriceBackfill:
+    """历史价格库 (price_history，按 类型+代码+日期 一行) 的批量补录，以及据此重放过去的每日快照。
+
+    价格来源有两个：上游历史接口 (股票日 K / 基金历史净值，按大页翻取) 和 CSV / Parquet 导入。
+    漏掉的 AssetHistory 日子由 replay 一次性用价格矩阵算出来，不再逐日请求行情。
+    """
+    # 腾讯日 K 单次最多返回 640 条，按 900 个自然日 (约 620 个交易日) 一段切
+    STOCK_PAGE = 640
+    STOCK_WINDOW_DAYS = 900
+    # 基金历史净值每页条数
+    FUND_PAGE = 500
+    MAX_CONCURRENCY = 8
+    # 重放时往前多取几天价格，用于区间第一天的前收盘
+    LOOKBACK_DAYS = 15
+    # 自动补漏检查的天数
+    RECOVER_DAYS = 30
+
+    def __init__(self, engine: MarketEngine):
+        self.engine = engine
+
+    def register(self, jobs):
+        # 收盘快照 (15:05) 之后检查一次漏掉的日子；启动后也检查一次 (容器停机期间的缺口)
+        jobs.add("snapshot_recover", self.recover_missed, 'cron', day_of_week='mon-fri', hour=15, minute=30)
+        jobs.add("snapshot_recover_startup", self.recover_missed, 'date', run_date=timedelta(seconds=60))
+
+    # ==========================================================
+    # 上游历史接口
+    # ==========================================================
+    async def backfill(self, stock_codes: Sequence[str], fund_codes: Sequence[str], start: date, end: date) -> Dict[str, int]:
+        """拉取 [start, end] 的历史价格写入 price_history，返回各类型写入的行数。"""
+        limiter = asyncio.Semaphore(self.MAX_CONCURRENCY)
+        stock_codes = sorted({str(c).strip() for c in stock_codes if c})
+        fund_codes = sorted({str(c).strip() for c in fund_codes if c})
+        jobs = [self._stock_history(limiter, c, start, end) for c in stock_codes]
+        jobs += [self._fund_history(limiter, c, start, end) for c in fund_codes]
+        results = await asyncio.gather(*jobs, return_exceptions=True)
+
+        rows: List[Dict[str, Any]] = []
+        for code, asset_type, res in zip(stock_codes + fund_codes, ["stock"] * len(stock_codes) + ["fund"] * len(fund_codes), results):
+            if isinstance(res, Exception):
+                if not isinstance(res, CircuitOpenError):
+                    print(f"Price backfill {asset_type} {code} failed: {res}")
+                continue
+            rows.extend({"asset_type": asset_type, "code": code, "date": d, "price": p} for d, p in res)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.store, rows)
+        return {
+            "stock": sum(1 for r in rows if r["asset_type"] == "stock"),
+            "fund": sum(1 for r in rows if r["asset_type"] == "fund"),
+        }
+
+    async def _stock_history(self, limiter: asyncio.Semaphore, code: str, start: date, end: date) -> List[Tuple[date, float]]:
+        symbol = self.engine._add_stock_prefix(code)
+        url = f"{self.engine.endpoints['stockkline']}/appstock/app/fqkline/get"
+        out = []
+        window_start = start
+        while window_start <= end:
+            window_end = min(end, window_start + timedelta(days=self.STOCK_WINDOW_DAYS))
+            # 不复权日 K：[日期, 开, 收, 高, 低, 量]
+            params = {"param": f"{symbol},day,{window_start},{window_end},{self.STOCK_PAGE},"}
+            async with limiter:
+                resp = await self.engine.pool.get(url, params=params, timeout=10)
+            data = (resp.json().get("data") or {}).get(symbol) or {}
+            for row in data.get("day") or data.get("qfqday") or []:
+                try:
+                    out.append((_parse_date(row[0]), float(row[2])))
+                except (ValueError, IndexError, TypeError):
+                    continue
+            window_start = window_end + timedelta(days=1)
+        return out
+
+    async def _fund_history(self, limiter: asyncio.Semaphore, code: str, start: date, end: date) -> List[Tuple[date, float]]:
+        url = f"{self.engine.endpoints['fundnav']}/FundMNewApi/FundMNHisNetList"
+        out = []
+        page = 1
+        while True:
+            params = {
+                "FCODE": code, "pageIndex": page, "pagesize": self.FUND_PAGE, "plat": "Android",
+                "appType": "ttjj", "product": "EFund", "Version": "1", "deviceid": "pacc",
+            }
+            async with limiter:
+                resp = await self.engine.pool.get(url, params=params, timeout=10)
+            datas = resp.json().get("Datas") or []
+            oldest = None
+            # 接口按日期倒序返回
+            for item in datas:
+                try:
+                    d, nav = _parse_date(item.get("FSRQ")), float(item.get("DWJZ"))
+                except (ValueError, TypeError):
+                    continue
+                oldest = d
+                if start <= d <= end and nav > 0:
+                    out.append((d, nav))
+            if len(datas) < self.FUND_PAGE or (oldest and oldest < start):
+                return out
+            page += 1
+
+    # ==========================================================
+    # 写入 / 导入
+    # ==========================================================
+    @staticmethod
+    def store(rows: List[Dict[str, Any]]) -> int:
+        """按 (类型, 代码, 日期) 覆盖写入，分块提交。"""
+        if not rows:
+            return 0
+        P = models.PriceHistory
+        db = SessionLocal()
+        try:
+            for i in range(0, len(rows), 500):
+                chunk = [{"name": None, **r} for r in rows[i:i + 500]]
+                stmt = insert(P).values(chunk)
+                db.execute(stmt.on_conflict_do_update(
+                    index_elements=["asset_type", "code", "date"],
+                    set_={"price": stmt.excluded.price, "name": func.coalesce(stmt.excluded.name, P.name)},
+                ))
+            db.commit()
+        finally:
+            db.close()
+        return len(rows)
+
+    @staticmethod
+    def parse_import(filename: str, content: bytes, default_type: str = "stock") -> List[Dict[str, Any]]:
+        """CSV / Parquet 转成 price_history 行。必需列：code, date, price；可选列：asset_type, name。"""
+        if filename.lower().endswith(".parquet"):
+            try:
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise ValueError("Parquet import requires pyarrow")
+            table = pq.read_table(io.BytesIO(content)).to_pydict()
+            n = len(next(iter(table.values()), []))
+            records = [{k: v[i] for k, v in table.items()} for i in range(n)]
+        else:
+            text = content.decode("utf-8-sig")
+            records = list(csv.DictReader(io.StringIO(text)))
+
+        rows = []
+        for lineno, rec in enumerate(records, start=2):
+            rec = {str(k).strip().lower(): v for k, v in rec.items() if k is not None}
+            missing = [k for k in ("code", "date", "price") if rec.get(k) in (None, "")]
+            if missing:
+                raise ValueError(f"row {lineno}: missing {', '.join(missing)}")
+            asset_type = str(rec.get("asset_type") or default_type).strip()
+            if asset_type not in ("stock", "fund"):
+                raise ValueError(f"row {lineno}: asset_type must be stock or fund")
+            try:
+                rows.append({
+                    "asset_type": asset_type,
+                    "code": str(rec["code"]).strip(),
+                    "date": _parse_date(rec["date"]),
+                    "price": float(rec["price"]),
+                    "name": rec.get("name") or None,
+                })
+            except ValueError as e:
+                raise ValueError(f"row {lineno}: {e}")
+        return rows
+
+    # ==========================================================
+    # 重放历史快照
+    # ==========================================================
+    def replay(self, owner_id: int, start: date, end: date, overwrite: bool = False) -> List[date]:
+        """用 price_history 重算 [start, end] 内交易日的 AssetHistory (及逐持仓日线)。
+
+        按当前持仓数量计算；overwrite=False 时只补没有快照的日子。返回重算的日期。
+        """
+        db = SessionLocal()
+        try:
+            days = market_calendar.trading_days(start, end)
+            if not overwrite:
+                H = models.AssetHistory
+                have = {d for (d,) in db.query(H.date).filter(H.owner_id == owner_id, H.date >= start, H.date <= end)}
+                days = [d for d in days if d not in have]
+            if not days:
+                return []
+
+            holdings = valuation.load_holdings(db, owner_id)
+            lo = days[0] - timedelta(days=self.LOOKBACK_DAYS)
+            classes = {}
+            for asset_type in ("stock", "fund"):
+                h = holdings[asset_type]
+                px, prev = self._price_matrix(db, asset_type, h, lo, days)
+                mv = h.qty[:, None] * px
+                classes[asset_type] = (h, px, mv, h.qty[:, None] * (px - prev))
+            h = holdings["fixed"]
+            fixed = []
+            for d in days:
+                # 理财的当日收益取台账里当天入账的利息
+                valuation.attach_accruals(db, h, d)
+                fixed.append(valuation.value_fixed(h, d))
+            classes["fixed"] = (
+                h,
+                np.stack([v.price for v in fixed], axis=1) if len(h) else np.zeros((0, len(days))),
+                np.stack([v.market_value for v in fixed], axis=1) if len(h) else np.zeros((0, len(days))),
+                np.stack([v.day_profit for v in fixed], axis=1) if len(h) else np.zeros((0, len(days))),
+            )
+
+            principal = sum(float((c.cost * c.qty).sum()) for c in (holdings["stock"], holdings["fund"])) + float(h.qty.sum())
+            day_by_class = {k: v[3].sum(axis=0) for k, v in classes.items()}
+            total_mv = sum(v[2].sum(axis=0) for v in classes.values())
+
+            history_rows = [{
+                "owner_id": owner_id, "date": d,
+                "total_asset": float(total_mv[j]),
+                "total_profit": float(day_by_class["stock"][j] + day_by_class["fund"][j] + day_by_class["fixed"][j]),
+                "total_principal": principal,
+                "stock_profit": float(day_by_class["stock"][j]),
+                "fund_profit": float(day_by_class["fund"][j]),
+                "fixed_profit": float(day_by_class["fixed"][j]),
+            } for j, d in enumerate(days)]
+            stmt = insert(models.AssetHistory).values(history_rows)
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=["owner_id", "date"],
+                set_={k: stmt.excluded[k] for k in history_rows[0] if k not in ("owner_id", "date")},
+            ))
+
+            # 逐持仓日线：先写当日数值，累计值最后整条重算
+            holding_rows = []
+            for asset_type, (hc, px, mv, dp) in classes.items():
+                for i, (asset_id, code) in enumerate(zip(hc.ids, hc.codes)):
+                    for j, d in enumerate(days):
+                        holding_rows.append({
+                            "owner_id": owner_id, "asset_id": asset_id, "asset_type": asset_type, "code": code,
+                            "date": d, "price": float(px[i, j]), "quantity": float(hc.qty[i]),
+                            "market_value": float(mv[i, j]), "day_profit": float(dp[i, j]),
+                            "cum_profit": 0.0, "twr_index": 1.0,
+                        })
+            for i in range(0, len(holding_rows), 500):
+                stmt = insert(models.HoldingHistory).values(holding_rows[i:i + 500])
+                db.execute(stmt.on_conflict_do_update(
+                    index_elements=["asset_id", "date"],
+                    set_={k: stmt.excluded[k] for k in ("price", "quantity", "market_value", "day_profit")},
+                ))
+            asset_ids = [a for hc in holdings.values() for a in hc.ids]
+            if asset_ids:
+                db.flush()
+                holding_history.rebuild(db, asset_ids)
+            db.commit()
+            return days
+        finally:
+            db.close()
+
+    @staticmethod
+    def _price_matrix(db, asset_type: str, h: "valuation.HoldingColumns", lo: date, days: List[date]) -> Tuple[np.ndarray, np.ndarray]:
+        """(代码 × 交易日) 的收盘价矩阵和前收盘矩阵。当天没价格沿用之前最近的一个 (当日盈亏为 0)，
+        完全没有价格的用成本价兜底。"""
+        n_days = len(days)
+        px = np.repeat(h.cost[:, None], n_days, axis=1)
+        prev = px.copy()
+        if not len(h):
+            return px, prev
+
+        P = models.PriceHistory
+        rows = db.query(P.code, P.date, P.price).filter(
+            P.asset_type == asset_type, P.code.in_(set(h.codes)), P.date >= lo, P.date <= days[-1]
+        ).order_by(P.code, P.date).all()
+        series: Dict[str, Tuple[List[int], List[float]]] = {}
+        for code, d, price in rows:
+            ords, prices = series.setdefault(code, ([], []))
+            ords.append(d.toordinal())
+            prices.append(price)
+
+        day_ords = np.array([d.toordinal() for d in days])
+        for i, code in enumerate(h.codes):
+            if code not in series:
+                continue
+            ords, prices = (np.array(x) for x in series[code])
+            cur = np.searchsorted(ords, day_ords, side="right") - 1   # 当天 (含) 之前最近的价格
+            before = np.searchsorted(ords, day_ords, side="left") - 1  # 严格早于当天的价格
+            has_cur, has_before = cur >= 0, before >= 0
+            px[i, has_cur] = prices[cur[has_cur]]
+            prev[i] = px[i]
+            both = has_cur & has_before
+            prev[i, both] = prices[before[both]]
+        return px, prev
+
+    # ==========================================================
+    # 自动补漏
+    # ==========================================================
+    @staticmethod
+    def _find_gaps(start: date, end: date) -> Tuple[Dict[int, List[date]], List[Tuple[str, str]]]:
+        """[start, end] 内每个用户缺快照的交易日 (只算第一条快照之后)，以及这些用户持有的股票/基金代码。"""
+        H, A = models.AssetHistory, models.Asset
+        db = SessionLocal()
+        try:
+            owners = [o for (o,) in db.query(A.owner_id).distinct().all() if o is not None]
+            gaps: Dict[int, List[date]] = {}
+            for owner_id in owners:
+                first = db.query(func.min(H.date)).filter(H.owner_id == owner_id).scalar()
+                if not first:
+                    continue
+                have = {d for (d,) in db.query(H.date).filter(H.owner_id == owner_id, H.date >= start)}
+                missing = [d for d in market_calendar.trading_days(max(start, first), end) if d not in have]
+                if missing:
+                    gaps[owner_id] = missing
+            if not gaps:
+                return {}, []
+            codes = db.query(A.asset_type, A.code).filter(A.owner_id.in_(list(gaps)), A.asset_type.in_(("stock", "fund"))).distinct().all()
+            return gaps, [(t, c) for t, c in codes]
+        finally:
+            db.close()
+
+    @metrics.timed_job("snapshot_recover")
+    async def recover_missed(self, lookback_days: Optional[int] = None) -> Dict[int, int]:
+        """最近 lookback_days 天内漏掉的快照：补拉价格后重放。只补每个用户第一条快照之后的日子。"""
+        end = market_calendar.latest_nav_date()
+        start = end - timedelta(days=lookback_days or self.RECOVER_DAYS)
+        # 查缺口要扫每个用户的快照日期，放进线程池，不占事件循环
+        loop = asyncio.get_running_loop()
+        gaps, codes = await loop.run_in_executor(None, self._find_gaps, start, end)
+        if not gaps:
+            return {}
+
+        first_gap = min(d for days in gaps.values() for d in days)
+        last_gap = max(d for days in gaps.values() for d in days)
+        await self.backfill([c for t, c in codes if t == "stock"], [c for t, c in codes if t == "fund"],
+                            first_gap - timedelta(days=self.LOOKBACK_DAYS), last_gap)
+        done = {}
+        for owner_id, days in gaps.items():
+            replayed = await loop.run_in_executor(None, self.replay, owner_id, days[0], days[-1])
+            done[owner_id] = len(replayed)
+        print(f"Snapshot recovery: {done}")
+        return done
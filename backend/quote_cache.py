@@ -0,0 +1,269 @@
+"""跨进程共享的行情缓存：多个 uvicorn worker 共用一份 SQLite 文件 (默认放在主库旁边的 quote_cache.db)。
+
+- quotes 表按 (source, code) 存行情 JSON、过期时间 (墙上时间) 和版本号 (抓取开始时的纳秒时间戳)，
+  写入是带版本判断的 UPSERT：先发起的抓取不会覆盖后发起的结果，一批写入在一个事务里完成。
+- fetch_leases 表是逐个代码的抓取租约：缓存未命中时先抢租约，抢到的 worker 去上游抓，
+  没抢到的轮询共享缓存等结果，同一时刻每个代码只有一个进程在请求腾讯 / 东方财富。
+- 进程内再套一层很短的本地缓存 (LOCAL_TTL 秒)，同一轮里的重复读取不用反复查文件；
+  本地层不能太长，否则主节点强制刷新 (晚间净值补扫) 后其他 worker 会一直读到旧值。
+
+除 peek 以外的方法都是阻塞的文件读写，MarketEngine 通过线程池调用，事件循环上只查进程内那一层。
+缓存文件损坏、被锁住等任何 SQLite 错误都只降级为未命中 / 本进程自己抓，不影响行情接口。
+单进程部署时它和原来的进程内缓存行为一致，只是多了一次本地文件读写。
+"""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy.engine import make_url
+
+from database import SQLALCHEMY_DATABASE_URL, IS_SQLITE
+from market_engine import QuoteCache
+
+Key = Tuple[str, str]
+
+# 进程内缓存最多信任多久 (秒)
+LOCAL_TTL = 1.0
+# 写锁等待上限 (秒)：缓存写不进去就算了，不能让线程池里的调用排长队
+BUSY_TIMEOUT = 0.5
+# 单条 SQL 里 IN (...) 的最大代码数 (老版本 SQLite 默认变量上限 999)
+QUERY_CHUNK = 400
+# 过期超过这个时间 (秒) 的行情清理掉，防止代码越积越多
+PURGE_AFTER = 7 * 86400
+PURGE_INTERVAL = 600
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS quotes ("
+    "source TEXT NOT NULL, code TEXT NOT NULL, value TEXT NOT NULL, "
+    "version INTEGER NOT NULL, expires_at REAL NOT NULL, PRIMARY KEY (source, code)) WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS fetch_leases ("
+    "source TEXT NOT NULL, code TEXT NOT NULL, owner TEXT NOT NULL, "
+    "expires_at REAL NOT NULL, PRIMARY KEY (source, code)) WITHOUT ROWID",
+)
+
+
+def default_path() -> Optional[str]:
+    """PACC_QUOTE_CACHE_PATH 优先 (设为空字符串关闭共享缓存)；否则 SQLite 主库旁边的 quote_cache.db。"""
+    path = os.environ.get("PACC_QUOTE_CACHE_PATH")
+    if path is not None:
+        return path or None
+    if not IS_SQLITE:
+        return None
+    database = make_url(SQLALCHEMY_DATABASE_URL).database
+    if not database or database == ":memory:":
+        return None
+    return os.path.join(os.path.dirname(database) or ".", "quote_cache.db")
+
+
+def _chunks(items: List[Key]) -> Iterable[List[Key]]:
+    for i in range(0, len(items), QUERY_CHUNK):
+        yield items[i:i + QUERY_CHUNK]
+
+
+def _key_filter(keys: List[Key]) -> Tuple[str, List[str]]:
+    # 按来源分组成 source = ? AND code IN (...)，走主键查找
+    by_source: Dict[str, List[str]] = {}
+    for source, code in keys:
+        by_source.setdefault(source, []).append(code)
+    clauses, params = [], []
+    for source, codes in by_source.items():
+        clauses.append(f"(source = ? AND code IN ({', '.join('?' * len(codes))}))")
+        params.append(source)
+        params.extend(codes)
+    return f"({' OR '.join(clauses)})", params
+
+
+class SharedQuoteCache:
+    """和 market_engine.QuoteCache 同样的接口，数据落在多个进程共享的 SQLite 文件里。"""
+    def __init__(self, path: str, max_entries: int = 4096):
+        self.path = path
+        self.local = QuoteCache(max_entries)
+        self._conns = threading.local()
+        self._last_purge = 0.0
+        self._warned = False
+        self._host = socket.gethostname()
+        # 建表失败 (目录不存在、只读等) 时整体退化成进程内缓存
+        self.enabled = self._conn() is not None
+        # 除 peek 外的方法都会读写文件，MarketEngine 会把它们放进线程池
+        self.blocking = self.enabled
+
+    @property
+    def owner(self) -> str:
+        # 按当前 pid 取值：fork 出来的子进程不会冒用父进程的租约
+        return f"{self._host}:{os.getpid()}"
+
+    def _conn(self) -> Optional[sqlite3.Connection]:
+        conn = getattr(self._conns, "conn", None)
+        if conn is not None:
+            return conn
+        try:
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+            # 缓存丢了可以重新抓，不需要落盘保证
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            for ddl in _SCHEMA:
+                conn.execute(ddl)
+        except sqlite3.Error as e:
+            self._warn(f"open {self.path} failed: {e}")
+            return None
+        self._conns.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self, conn: sqlite3.Connection):
+        # BEGIN IMMEDIATE 先拿写锁，整批写入对其他进程要么全可见要么全不可见
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _warn(self, msg: str):
+        # 同一个问题只打一次，避免每次刷新都刷屏
+        if not self._warned:
+            self._warned = True
+            print(f"Shared quote cache {msg}, falling back to per-process cache")
+
+    # ==========================================================
+    # 读写
+    # ==========================================================
+    def peek(self, keys: List[Key]) -> Dict[Key, Dict[str, Any]]:
+        """只查进程内那一层，纯内存，可以在事件循环上直接调用。"""
+        return self.local.get_many(keys)
+
+    def get(self, key: Key) -> Optional[Dict[str, Any]]:
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: List[Key]) -> Dict[Key, Dict[str, Any]]:
+        found = self.local.get_many(keys)
+        missing = [k for k in dict.fromkeys(keys) if k not in found]
+        conn = self._conn() if missing and self.enabled else None
+        if conn is None:
+            return found
+        now = time.time()
+        try:
+            for chunk in _chunks(missing):
+                where, params = _key_filter(chunk)
+                rows = conn.execute(
+                    f"SELECT source, code, value, expires_at FROM quotes WHERE expires_at > ? AND {where}", [now] + params
+                ).fetchall()
+                for source, code, value, expires_at in rows:
+                    found[(source, code)] = data = json.loads(value)
+                    self.local.set((source, code), data, min(LOCAL_TTL, expires_at - now))
+        except sqlite3.Error as e:
+            self._warn(f"read failed: {e}")
+        return found
+
+    def set(self, key: Key, value: Dict[str, Any], ttl: float):
+        self.set_many([(key, value, ttl)])
+
+    def set_many(self, items: List[Tuple[Key, Dict[str, Any], float]], version: Optional[int] = None):
+        """一个事务写入整批行情；version 为这批数据开始抓取的时间，库里已有更新版本的代码不覆盖。"""
+        if not items:
+            return
+        for key, value, ttl in items:
+            self.local.set(key, value, min(LOCAL_TTL, ttl))
+        conn = self._conn() if self.enabled else None
+        if conn is None:
+            return
+        now = time.time()
+        version = version or time.time_ns()
+        try:
+            with self._transaction(conn):
+                conn.executemany(
+                    "INSERT INTO quotes (source, code, value, version, expires_at) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (source, code) DO UPDATE SET value = excluded.value, version = excluded.version, "
+                    "expires_at = excluded.expires_at WHERE excluded.version >= quotes.version",
+                    [(s, c, json.dumps(value, ensure_ascii=False), version, now + ttl) for (s, c), value, ttl in items],
+                )
+                if now - self._last_purge > PURGE_INTERVAL:
+                    self._last_purge = now
+                    conn.execute("DELETE FROM quotes WHERE expires_at < ?", (now - PURGE_AFTER,))
+                    conn.execute("DELETE FROM fetch_leases WHERE expires_at < ?", (now,))
+        except sqlite3.Error as e:
+            self._warn(f"write failed: {e}")
+
+    def clear(self):
+        self.local.clear()
+        conn = self._conn() if self.enabled else None
+        if conn is not None:
+            try:
+                with self._transaction(conn):
+                    conn.execute("DELETE FROM quotes")
+                    conn.execute("DELETE FROM fetch_leases")
+            except sqlite3.Error as e:
+                self._warn(f"clear failed: {e}")
+
+    # ==========================================================
+    # 抓取租约
+    # ==========================================================
+    def claim(self, keys: List[Key], ttl: float) -> Set[Key]:
+        """为这些代码抢抓取租约，返回本进程抢到 (应该自己去上游抓) 的代码。"""
+        conn = self._conn() if keys and self.enabled else None
+        if conn is None:
+            return set(keys)
+        now, owner = time.time(), self.owner
+        mine: Set[Key] = set()
+        try:
+            with self._transaction(conn):
+                conn.executemany(
+                    "INSERT INTO fetch_leases (source, code, owner, expires_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (source, code) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                    "WHERE fetch_leases.expires_at < ? OR fetch_leases.owner = excluded.owner",
+                    [(s, c, owner, now + ttl, now) for s, c in keys],
+                )
+                for chunk in _chunks(keys):
+                    where, params = _key_filter(chunk)
+                    mine.update(conn.execute(
+                        f"SELECT source, code FROM fetch_leases WHERE owner = ? AND {where}", [owner] + params
+                    ).fetchall())
+        except sqlite3.Error as e:
+            self._warn(f"claim failed: {e}")
+            return set(keys)
+        return mine
+
+    def leased(self, keys: List[Key]) -> Dict[Key, float]:
+        """其他进程持有的抓取租约 -> 到期时间 (已过期但没释放的说明对方卡住或挂了)。"""
+        conn = self._conn() if keys and self.enabled else None
+        if conn is None:
+            return {}
+        held: Dict[Key, float] = {}
+        try:
+            for chunk in _chunks(keys):
+                where, params = _key_filter(chunk)
+                for source, code, expires_at in conn.execute(
+                    f"SELECT source, code, expires_at FROM fetch_leases WHERE owner != ? AND {where}", [self.owner] + params
+                ).fetchall():
+                    held[(source, code)] = expires_at
+        except sqlite3.Error as e:
+            self._warn(f"read failed: {e}")
+            return {}
+        return held
+
+    def release(self, keys: List[Key]):
+        conn = self._conn() if keys and self.enabled else None
+        if conn is None:
+            return
+        try:
+            with self._transaction(conn):
+                conn.executemany("DELETE FROM fetch_leases WHERE source = ? AND code = ? AND owner = ?",
+                                 [(s, c, self.owner) for s, c in keys])
+        except sqlite3.Error as e:
+            self._warn(f"release failed: {e}")
+
+
+def open_cache(max_entries: int = 4096):
+    """配置了共享缓存文件就用共享缓存，否则用进程内缓存。"""
+    path = default_path()
+    if path:
+        cache = SharedQuoteCache(path, max_entries)
+        if cache.enabled:
+            return cache
+    return QuoteCache(max_entries)
@@ -0,0 +1,237 @@
+import asyncio
+import bisect
+import json
+import re
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert
+
+import models
+import metrics
+from database import SessionLocal
+from market_engine import MarketEngine
+from upstream import CircuitOpenError
+
+try:
+    from pypinyin import Style, lazy_pinyin
+except ImportError:  # 没装 pypinyin 时股票只能按代码/名称搜，基金的拼音由上游直接给出
+    lazy_pinyin = None
+
+
+def name_initials(name: str) -> str:
+    """名称的拼音首字母 (小写)，非汉字部分原样保留字母数字，如 *ST康美 -> stkm。"""
+    if not name or lazy_pinyin is None:
+        return ""
+    parts = lazy_pinyin(name, style=Style.FIRST_LETTER, errors="default")
+    return re.sub(r"[^0-9a-z]", "", "".join(parts).lower())
+
+
+class SecurityIndex:
+    """某一资产类别的内存索引：代码、拼音首字母、名称三组排好序的键，前缀查找用二分。"""
+    def __init__(self, records: Sequence[Dict[str, Any]]):
+        self.records = list(records)
+        self.by_code: Dict[str, Dict[str, Any]] = {r["code"]: r for r in self.records}
+        self._keys = [self._sorted_keys(field) for field in ("code", "pinyin", "name")]
+
+    def _sorted_keys(self, field: str) -> Tuple[List[str], List[int]]:
+        pairs = sorted(((r.get(field) or "").lower(), i) for i, r in enumerate(self.records) if r.get(field))
+        return [k for k, _ in pairs], [i for _, i in pairs]
+
+    def __len__(self):
+        return len(self.records)
+
+    def search(self, q: str, limit: int) -> List[Dict[str, Any]]:
+        # 代码前缀 > 拼音首字母前缀 > 名称前缀，同组内按键排序
+        q = q.lower()
+        seen = set()
+        out: List[Dict[str, Any]] = []
+        for keys, idx in self._keys:
+            i = bisect.bisect_left(keys, q)
+            while i < len(keys) and len(out) < limit and keys[i].startswith(q):
+                if idx[i] not in seen:
+                    seen.add(idx[i])
+                    out.append(self.records[idx[i]])
+                i += 1
+            if len(out) >= limit:
+                break
+        return out
+
+
+class SecurityMaster:
+    """证券主表 (securities)：每天从上游整表拉一次 A 股 / ETF / 开放式基金清单写库，
+    查询全部走内存索引，代码校验和输入联想不再逐次请求上游。
+    """
+    # 东方财富行情列表：沪深京 A 股、场内 ETF
+    STOCK_FILTERS = {
+        "A股": "m:0+t:6,m:0+t:80,m:1+t:2,m:1+t:23,m:0+t:81+s:2048",
+        "ETF": "b:MK0021,b:MK0022,b:MK0023,b:MK0024",
+    }
+    STOCK_PAGE = 100
+    MAX_CONCURRENCY = 8
+    # 上游清单条数低于这个值视为异常，不覆盖库里已有的数据
+    MIN_ROWS = 100
+    # 库里数据超过这个时间 (小时) 启动后立即刷新一次
+    STALE_HOURS = 24
+
+    def __init__(self, engine: MarketEngine):
+        self.engine = engine
+        self._indexes: Dict[str, SecurityIndex] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def register(self, jobs):
+        # 每个交易日开盘前刷新一次 (新股上市、基金成立都在这之前公布)；启动后库空或过期也补刷一次
+        jobs.add("security_master_refresh", self.refresh, 'cron', day_of_week='mon-fri', hour=9, minute=5)
+        jobs.add("security_master_startup", self.refresh_if_stale, 'date', run_date=timedelta(seconds=10))
+        # 刷新只在主节点上执行，其余 worker 稍后从库里重建自己的内存索引
+        jobs.add("security_master_reload", self.load, 'cron', singleton=False, day_of_week='mon-fri', hour=9, minute=15)
+
+    # ==========================================================
+    # 查询 (纯内存)
+    # ==========================================================
+    def _index(self, asset_type: str) -> Optional[SecurityIndex]:
+        if not self._loaded:
+            self.load()
+        return self._indexes.get(asset_type)
+
+    @property
+    def ready(self) -> bool:
+        return any(len(self._index(t) or ()) for t in ("stock", "fund"))
+
+    def lookup(self, code: str, asset_type: str) -> Optional[Dict[str, Any]]:
+        index = self._index(asset_type)
+        return index.by_code.get(code) if index else None
+
+    def search(self, q: str, asset_type: Optional[str] = None, limit: int = 10) -> List[Dict[str, Any]]:
+        q = q.strip()
+        if not q:
+            return []
+        out: List[Dict[str, Any]] = []
+        for t in ([asset_type] if asset_type else ["stock", "fund"]):
+            index = self._index(t)
+            if index:
+                out.extend(index.search(q, limit - len(out)))
+            if len(out) >= limit:
+                break
+        return out
+
+    # ==========================================================
+    # 装载 / 刷新
+    # ==========================================================
+    def load(self):
+        """从 securities 表重建内存索引。"""
+        with self._lock:
+            db = SessionLocal()
+            try:
+                S = models.Security
+                rows = db.query(S.asset_type, S.code, S.name, S.kind, S.pinyin).all()
+            finally:
+                db.close()
+            grouped: Dict[str, List[Dict[str, Any]]] = {}
+            for r in rows:
+                grouped.setdefault(r.asset_type, []).append(
+                    {"type": r.asset_type, "code": r.code, "name": r.name, "kind": r.kind, "pinyin": r.pinyin}
+                )
+            self._indexes = {t: SecurityIndex(v) for t, v in grouped.items()}
+            self._loaded = True
+
+    def last_updated(self) -> Optional[datetime]:
+        db = SessionLocal()
+        try:
+            return db.query(func.max(models.Security.updated_at)).scalar()
+        finally:
+            db.close()
+
+    async def refresh_if_stale(self):
+        updated = await asyncio.get_running_loop().run_in_executor(None, self.last_updated)
+        if updated is None or datetime.now() - updated > timedelta(hours=self.STALE_HOURS):
+            await self.refresh()
+        else:
+            await asyncio.get_running_loop().run_in_executor(None, self.load)
+
+    @metrics.timed_job("security_master")
+    async def refresh(self) -> Dict[str, int]:
+        """整表拉取股票/ETF 和基金清单，分别覆盖写库后重建索引；某一类拉取失败时保留旧数据。"""
+        stocks, funds = await asyncio.gather(self._fetch_stocks(), self._fetch_funds(), return_exceptions=True)
+        loop = asyncio.get_running_loop()
+        counts = {}
+        for asset_type, rows in (("stock", stocks), ("fund", funds)):
+            if isinstance(rows, Exception):
+                if not isinstance(rows, CircuitOpenError):
+                    print(f"Security master {asset_type} refresh failed: {rows}")
+                continue
+            if len(rows) < self.MIN_ROWS:
+                print(f"Security master {asset_type} refresh skipped: only {len(rows)} rows")
+                continue
+            counts[asset_type] = await loop.run_in_executor(None, self.store, asset_type, rows)
+        await loop.run_in_executor(None, self.load)
+        print(f"Security master refreshed: {counts}")
+        return counts
+
+    @staticmethod
+    def store(asset_type: str, rows: List[Dict[str, Any]]) -> int:
+        """覆盖写入某一类的完整清单，清单里已经没有的代码 (退市/清盘) 一并删除。"""
+        S = models.Security
+        now = datetime.now()
+        db = SessionLocal()
+        try:
+            for i in range(0, len(rows), 500):
+                chunk = [dict(r, asset_type=asset_type, updated_at=now) for r in rows[i:i + 500]]
+                stmt = insert(S).values(chunk)
+                db.execute(stmt.on_conflict_do_update(
+                    index_elements=["asset_type", "code"],
+                    set_={k: stmt.excluded[k] for k in ("name", "kind", "pinyin", "updated_at")},
+                ))
+            db.query(S).filter(S.asset_type == asset_type, S.updated_at < now).delete(synchronize_session=False)
+            db.commit()
+            return len(rows)
+        finally:
+            db.close()
+
+    # ==========================================================
+    # 上游清单
+    # ==========================================================
+    async def _fetch_stocks(self) -> List[Dict[str, Any]]:
+        limiter = asyncio.Semaphore(self.MAX_CONCURRENCY)
+        seen: Dict[str, Dict[str, Any]] = {}
+        # A 股在前：同一代码只会出现在一个清单里，这里只是防御
+        for kind, fs in self.STOCK_FILTERS.items():
+            for code, name in await self._fetch_stock_list(limiter, fs):
+                seen.setdefault(code, {"code": code, "name": name, "kind": kind, "pinyin": name_initials(name) or None})
+        return list(seen.values())
+
+    async def _fetch_stock_list(self, limiter: asyncio.Semaphore, fs: str) -> List[Tuple[str, str]]:
+        # 先取第一页拿到总数，其余页并发取
+        first, total = await self._fetch_stock_page(limiter, fs, 1)
+        pages = -(-total // self.STOCK_PAGE)
+        rest = await asyncio.gather(*(self._fetch_stock_page(limiter, fs, p) for p in range(2, pages + 1)))
+        out = list(first)
+        for items, _ in rest:
+            out.extend(items)
+        return out
+
+    async def _fetch_stock_page(self, limiter: asyncio.Semaphore, fs: str, page: int) -> Tuple[List[Tuple[str, str]], int]:
+        url = f"{self.engine.endpoints['stocklist']}/api/qt/clist/get"
+        params = {"pn": page, "pz": self.STOCK_PAGE, "po": 0, "np": 1, "fltt": 2, "fid": "f12", "fs": fs, "fields": "f12,f14"}
+        async with limiter:
+            resp = await self.engine.pool.get(url, params=params, timeout=10)
+        data = resp.json().get("data") or {}
+        items = [(str(d["f12"]), str(d["f14"]).strip()) for d in data.get("diff") or [] if d.get("f12") and d.get("f14")]
+        return items, int(data.get("total") or 0)
+
+    async def _fetch_funds(self) -> List[Dict[str, Any]]:
+        # 天天基金全量清单：var r = [["000001","HXCZHH","华夏成长混合","混合型-灵活","HUAXIACHENGZHANGHUNHE"], ...]
+        url = f"{self.engine.endpoints['fundlist']}/js/fundcode_search.js"
+        resp = await self.engine.pool.get(url, timeout=15)
+        match = re.search(r"=\s*(\[.*\])", resp.text, re.S)
+        if not match:
+            raise ValueError("unexpected fund list payload")
+        out = []
+        for item in json.loads(match.group(1)):
+            if len(item) < 4 or not item[0] or not item[2]:
+                continue
+            out.append({"code": item[0], "name": item[2], "kind": item[3] or None, "pinyin": (item[1] or "").lower() or None})
+        return out
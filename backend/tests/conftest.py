@@ -0,0 +1,31 @@
+"""测试公共配置：后端模块是平铺导入的 (import models)，先把 backend 目录放进 sys.path；
+数据库指向临时 SQLite，关闭跨进程行情缓存，避免读写 data/ 下的真实文件。"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+_TMP = tempfile.mkdtemp(prefix="pacc-test-")
+os.environ["PACC_DATABASE_URL"] = f"sqlite:///{os.path.join(_TMP, 'test.db')}"
+os.environ["PACC_QUOTE_CACHE_PATH"] = ""
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def engine():
+    import database
+    import migrations
+    migrations.run(database.engine)
+    return database.engine
+
+
+@pytest.fixture
+def db(engine):
+    import database
+    session = database.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.rollback()
+        session.close()
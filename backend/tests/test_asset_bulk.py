@@ -0,0 +1,109 @@
+import json
+from datetime import date
+
+import pytest
+
+import asset_bulk
+import models
+
+CSV = (
+    "﻿类型,代码,名称,成本价,数量,标签,起始日,年化,明细\n"
+    "stock,600000,浦发银行,\"1,000.5\",100,,,,\n"
+    "stock,600000,浦发银行,12,300,进攻,,,\n"
+    "fund,110011,易方达,1.5,1000,,2026/09/01,,\n"
+    "fixed,F1,定期,0,0,,,3.65,2026-09-01:10000;20260915:5000\n"
+)
+
+
+def test_parse_csv_with_chinese_headers():
+    rows = asset_bulk.parse("holdings.csv", CSV.encode("utf-8"))
+    assert [r["line"] for r in rows] == [2, 3, 4, 5]
+    assert rows[0]["cost_price"] == 1000.5 and rows[0]["quantity"] == 100
+    assert rows[2]["start_date"] == "2026-09-01"
+    assert rows[3]["apy"] == 3.65
+    assert rows[3]["lots"] == [(date(2026, 9, 1), 10000.0), (date(2026, 9, 15), 5000.0)]
+    # 股票/基金不带明细
+    assert rows[0]["lots"] is None
+
+
+def test_parse_json_forms():
+    data = [{"code": "000001", "quantity": "200", "cost_price": 10},
+            {"asset_type": "fixed", "code": "F2", "lots": [{"date": "2026-10-08", "amount": 100}]}]
+    rows = asset_bulk.parse("a.json", json.dumps(data).encode())
+    assert rows[0]["asset_type"] == "stock" and rows[0]["line"] == 1
+    assert rows[1]["lots"] == [(date(2026, 10, 8), 100.0)]
+    assert asset_bulk.parse("a.txt", json.dumps({"assets": data}).encode())[0]["code"] == "000001"
+
+
+@pytest.mark.parametrize("content, message", [
+    ("code,quantity\n,1\n", "row 2: missing code"),
+    ("asset_type,code\nbond,1\n", "row 2: asset_type must be one of"),
+    ("code,quantity\n600000,abc\n", "row 2: bad quantity 'abc'"),
+    ("asset_type,code,start_date\nfixed,F,2026-13-01\n", "row 2: bad date"),
+    ("asset_type,code,lots\nfixed,F,2026-10-08\n", "row 2: bad lots"),
+    ("asset_type,code,interest_mode\nfixed,F,daily\n", "row 2: interest_mode must be one of"),
+    ("asset_type,code,value_lag\nfixed,F,31\n", "row 2: value_lag must be between 0 and 30"),
+    ('{"assets": 1}', "JSON must be a list"),
+    ("[1]", "row 1: expected an object"),
+])
+def test_parse_errors(content, message):
+    with pytest.raises(ValueError, match=message.replace("(", r"\(")):
+        asset_bulk.parse("x.csv", content.encode())
+
+
+def test_combine_weights_duplicate_rows():
+    rows = asset_bulk.combine(asset_bulk.parse("holdings.csv", CSV.encode()))
+    stock = rows[0]
+    assert len(rows) == 3
+    assert stock["quantity"] == 400
+    assert stock["cost_price"] == pytest.approx((1000.5 * 100 + 12 * 300) / 400)
+    # 后出现的非空字段优先
+    assert stock["tag"] == "进攻"
+
+
+def _owned(db, owner_id):
+    A = models.Asset
+    return {(a.asset_type, a.code): a for a in db.query(A).filter(A.owner_id == owner_id).all()}
+
+
+def test_merge_mode(db):
+    rows = asset_bulk.combine(asset_bulk.parse("holdings.csv", CSV.encode()))
+    assert asset_bulk.upsert(db, 9001, rows)["created"] == 3
+    fixed = _owned(db, 9001)[("fixed", "F1")]
+    # 理财本金和起始日按明细重算，台账随之生成
+    assert fixed.quantity == 15000.0
+    assert db.query(models.FixedAccrual).filter(models.FixedAccrual.asset_id == fixed.id).count() > 0
+
+    again = asset_bulk.parse("more.csv", b"asset_type,code,cost_price,quantity\nstock,600000,10,400\nfixed,F1,0,99999\n")
+    result = asset_bulk.upsert(db, 9001, asset_bulk.combine(again))
+    db.flush()
+    assert result["updated"] == 1
+    # 已有的理财在 merge 模式下跳过，不按份额加权
+    assert [r["code"] for r in result["skipped"]] == ["F1"]
+    stock = _owned(db, 9001)[("stock", "600000")]
+    db.refresh(stock)
+    assert stock.quantity == 800
+    assert stock.cost_price == pytest.approx(((1000.5 * 100 + 12 * 300) + 10 * 400) / 800)
+    assert _owned(db, 9001)[("fixed", "F1")].quantity == 15000.0
+
+
+def test_replace_round_trip_is_idempotent(db):
+    asset_bulk.upsert(db, 9002, asset_bulk.combine(asset_bulk.parse("holdings.csv", CSV.encode())))
+    db.flush()
+    first = asset_bulk.to_csv(asset_bulk.export(db, 9002))
+    assert "2026-09-01:10000.0;2026-09-15:5000.0" in first
+
+    result = asset_bulk.upsert(db, 9002, asset_bulk.combine(asset_bulk.parse("export.csv", first.encode())), mode="replace")
+    db.flush()
+    db.expire_all()
+    assert result == {"created": 0, "updated": 3, "skipped": []}
+    assert asset_bulk.to_csv(asset_bulk.export(db, 9002)) == first
+    lots = db.query(models.AssetTransaction).filter(
+        models.AssetTransaction.asset_id == _owned(db, 9002)[("fixed", "F1")].id).count()
+    assert lots == 2
+
+
+def test_backfill_ranges():
+    rows = asset_bulk.parse("holdings.csv", CSV.encode())
+    assert asset_bulk.backfill_ranges(rows, date(2026, 10, 17)) == ([], ["110011"], date(2026, 9, 1))
+    assert asset_bulk.backfill_ranges(rows, date(2026, 9, 1)) is None
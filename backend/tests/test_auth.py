@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from jose import jwt
+
+import auth
+import models
+
+
+@pytest.fixture
+def user(db):
+    u = models.User(username="auth-test", hashed_password="hash-1")
+    db.add(u)
+    db.commit()
+    yield u
+    auth.invalidate()
+    db.delete(u)
+    db.commit()
+
+
+def test_token_round_trip(user):
+    token = auth.create_access_token(user)
+    assert auth.authenticate(token) == auth.AuthUser(user.id, "auth-test", auth.password_fingerprint("hash-1"))
+    # 第二次直接命中用户缓存
+    assert auth.user_cache.get(user.id) is not None
+
+
+def test_password_change_invalidates_old_tokens(db, user):
+    token = auth.create_access_token(user)
+    assert auth.authenticate(token) is not None
+    user.hashed_password = "hash-2"
+    db.commit()
+    auth.invalidate(user.id)
+    assert auth.authenticate(token) is None
+    assert auth.authenticate(auth.create_access_token(user)).id == user.id
+
+
+@pytest.mark.parametrize("mutate", [
+    lambda claims: dict(claims, exp=datetime.now(timezone.utc) - timedelta(seconds=1)),
+    lambda claims: dict(claims, sub="999999"),
+    lambda claims: dict(claims, sub="abc"),
+    lambda claims: {k: v for k, v in claims.items() if k != "sub"},
+])
+def test_rejected_claims(user, mutate):
+    claims = {"sub": str(user.id), "name": user.username, "pwv": auth.password_fingerprint("hash-1"),
+              "exp": datetime.now(timezone.utc) + timedelta(hours=1)}
+    assert auth.authenticate(jwt.encode(claims, auth.secret_key(), algorithm=auth.ALGORITHM)) is not None
+    assert auth.authenticate(jwt.encode(mutate(claims), auth.secret_key(), algorithm=auth.ALGORITHM)) is None
+
+
+def test_bad_signature(user):
+    token = auth.create_access_token(user)
+    forged = jwt.encode(jwt.get_unverified_claims(token), "not-the-secret", algorithm=auth.ALGORITHM)
+    assert auth.authenticate(forged) is None
+    assert auth.authenticate("garbage") is None
+
+
+def test_user_cache_lru_and_ttl():
+    cache = auth.UserCache(max_size=2, ttl=60)
+    for i in range(3):
+        cache.put(auth.AuthUser(i, f"u{i}", ""))
+    assert cache.get(0) is None and cache.get(2) is not None
+    expired = auth.UserCache(ttl=-1)
+    expired.put(auth.AuthUser(1, "u", ""))
+    assert expired.get(1) is None
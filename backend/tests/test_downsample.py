@@ -0,0 +1,26 @@
+import numpy as np
+
+from downsample import lttb
+
+
+def test_short_series_untouched():
+    x = np.arange(5, dtype=float)
+    assert lttb(x, x, 5).tolist() == [0, 1, 2, 3, 4]
+    assert lttb(x, x, 2).tolist() == [0, 4]
+
+
+def test_keeps_endpoints_and_peaks():
+    x = np.arange(1000, dtype=float)
+    y = np.zeros(1000)
+    y[[137, 512, 860]] = [50.0, -80.0, 30.0]
+    idx = lttb(x, y, 50)
+    assert len(idx) == 50
+    assert idx[0] == 0 and idx[-1] == 999
+    assert np.all(np.diff(idx) > 0)
+    # 孤立的尖峰必须保留
+    assert {137, 512, 860} <= set(idx.tolist())
+
+
+def test_accepts_lists():
+    idx = lttb(list(range(10)), [0, 1, 0, 5, 0, 1, 0, 1, 0, 0], 4)
+    assert idx.tolist()[0] == 0 and idx.tolist()[-1] == 9 and 3 in idx.tolist()
@@ -0,0 +1,147 @@
+from datetime import date
+
+import pytest
+
+import fixed_accrual
+import models
+import valuation
+
+# 2026-10-01 ~ 10-07 国庆休市 (10-03/04 周末)，10-08 周四开市；10-10/11 周末
+PRINCIPAL = 36500.0  # 年化 1% 时每天正好 1 元
+
+
+def test_value_date_counts_trading_days():
+    assert fixed_accrual.value_date(date(2026, 9, 30), 0) == date(2026, 9, 30)
+    assert fixed_accrual.value_date(date(2026, 9, 30), 1) == date(2026, 10, 8)
+    assert fixed_accrual.value_date(date(2026, 9, 30), 2) == date(2026, 10, 9)
+    # 节假日买入 T+0 仍是当天
+    assert fixed_accrual.value_date(date(2026, 10, 3), 0) == date(2026, 10, 3)
+
+
+def test_calendar_rule_accrues_every_day():
+    rows = fixed_accrual.accrue_lot(PRINCIPAL, 1.0, "simple", "calendar", date(2026, 10, 8), date(2026, 10, 12))
+    assert [d.day for d, _, _, _ in rows] == [8, 9, 10, 11, 12]
+    assert all(days == 1 and interest == pytest.approx(1.0) for _, days, interest, _ in rows)
+    assert rows[-1][3] == pytest.approx(5.0)
+
+
+def test_skip_rule_drops_non_trading_days():
+    rows = fixed_accrual.accrue_lot(PRINCIPAL, 1.0, "simple", "skip", date(2026, 10, 8), date(2026, 10, 12))
+    assert [(d.day, days) for d, days, _, _ in rows] == [(8, 1), (9, 1), (12, 1)]
+    assert rows[-1][3] == pytest.approx(3.0)
+
+
+def test_defer_rule_books_weekend_on_next_trading_day():
+    rows = fixed_accrual.accrue_lot(PRINCIPAL, 1.0, "simple", "defer", date(2026, 10, 8), date(2026, 10, 12))
+    assert [(d.day, days) for d, days, _, _ in rows] == [(8, 1), (9, 1), (12, 3)]
+    assert rows[-1][2] == pytest.approx(3.0)
+    # 起息日落在假期：假期里的天数全部记到开市第一天
+    rows = fixed_accrual.accrue_lot(PRINCIPAL, 1.0, "simple", "defer", date(2026, 10, 1), date(2026, 10, 8))
+    assert [(d.day, days) for d, days, _, _ in rows] == [(8, 8)]
+    assert rows[0][3] == pytest.approx(8.0)
+
+
+def test_compound_interest():
+    rate = 0.0365 / 365
+    rows = fixed_accrual.accrue_lot(10000.0, 3.65, "compound", "calendar", date(2026, 10, 8), date(2026, 10, 17))
+    assert rows[-1][3] == pytest.approx(10000.0 * ((1 + rate) ** 10 - 1))
+    # defer 下一次入账覆盖 3 天，按 3 天复利
+    rows = fixed_accrual.accrue_lot(10000.0, 3.65, "compound", "defer", date(2026, 10, 8), date(2026, 10, 12))
+    assert rows[-1][3] == pytest.approx(10000.0 * ((1 + rate) ** 5 - 1))
+
+
+def test_incremental_matches_full_run():
+    full = fixed_accrual.accrue_lot(PRINCIPAL, 2.0, "compound", "defer", date(2026, 9, 28), date(2026, 10, 16))
+    head = fixed_accrual.accrue_lot(PRINCIPAL, 2.0, "compound", "defer", date(2026, 9, 28), date(2026, 10, 9))
+    tail = fixed_accrual.accrue_lot(PRINCIPAL, 2.0, "compound", "defer", date(2026, 9, 28), date(2026, 10, 16),
+                                    (head[-1][0], head[-1][3]))
+    assert [r[0] for r in head + tail] == [r[0] for r in full]
+    assert tail[-1][3] == pytest.approx(full[-1][3])
+
+
+def test_nothing_before_value_date():
+    assert fixed_accrual.accrue_lot(PRINCIPAL, 1.0, "simple", "calendar", date(2026, 10, 9), date(2026, 10, 8)) == []
+
+
+def _fixed_asset(db, apy=1.0, rule="calendar", lots=(), lag=0):
+    asset = models.Asset(owner_id=None, asset_type="fixed", name="理财", code="F1", cost_price=0,
+                         quantity=sum(a for _, a in lots), apy=apy, interest_mode="simple", value_lag=lag,
+                         holiday_rule=rule)
+    db.add(asset)
+    db.flush()
+    for d, amount in lots:
+        db.add(models.AssetTransaction(asset_id=asset.id, date=d, amount=amount))
+    db.flush()
+    return asset
+
+
+def test_ledger_is_incremental_and_summarized_from_latest_rows(db):
+    asset = _fixed_asset(db, lots=[(date(2026, 10, 8), PRINCIPAL), (date(2026, 10, 10), PRINCIPAL)])
+    assert fixed_accrual.accrue(db, [asset.id], through=date(2026, 10, 12)) == 5 + 3
+    db.flush()
+    assert fixed_accrual.accrue(db, [asset.id], through=date(2026, 10, 12)) == 0
+    assert fixed_accrual.accrue(db, [asset.id], through=date(2026, 10, 13)) == 2
+    db.flush()
+
+    s = fixed_accrual.summarize(db, [asset.id], date(2026, 10, 13))[asset.id]
+    assert s["accrued"] == pytest.approx(6.0 + 4.0)
+    assert s["day_interest"] == pytest.approx(2.0)
+    assert sorted(v["accrued"] for v in s["lots"].values()) == pytest.approx([4.0, 6.0])
+    # 重放历史：只看那天及以前的入账
+    s = fixed_accrual.summarize(db, [asset.id], date(2026, 10, 9))[asset.id]
+    assert s["accrued"] == pytest.approx(2.0) and s["day_interest"] == pytest.approx(1.0)
+    # 台账按入账日把各笔明细合计
+    assert fixed_accrual.ledger(db, asset.id, date(2026, 10, 12), date(2026, 10, 12)) == [
+        {"date": "2026-10-12", "interest": pytest.approx(2.0), "accrued": pytest.approx(8.0)}
+    ]
+
+
+def test_invalidate_and_skip_rule_weekend(db):
+    asset = _fixed_asset(db, rule="skip", lots=[(date(2026, 10, 8), PRINCIPAL)])
+    fixed_accrual.accrue(db, [asset.id], through=date(2026, 10, 12))
+    db.flush()
+    # skip 规则周末不入账，当日利息为 0
+    s = fixed_accrual.summarize(db, [asset.id], date(2026, 10, 11))[asset.id]
+    assert s["accrued"] == pytest.approx(2.0) and s["day_interest"] == 0.0
+    fixed_accrual.invalidate(db, asset.id)
+    db.flush()
+    # 台账删掉后 (重建前) 只剩全 0 的记录
+    assert fixed_accrual.summarize(db, [asset.id], date(2026, 10, 12)) == {
+        asset.id: {"accrued": 0.0, "day_interest": 0.0, "lots": {}}
+    }
+
+
+def test_assets_without_apy_have_no_ledger(db):
+    asset = _fixed_asset(db, apy=None, lots=[(date(2026, 10, 8), PRINCIPAL)])
+    assert fixed_accrual.accrue(db, [asset.id], through=date(2026, 10, 12)) == 0
+
+
+def test_lot_before_value_date_earns_nothing(db):
+    # 周五买入、T+1 起息：起息日是下周一，周末估值既没有利息也不能按 市值 * 年化 / 365 估算
+    asset = _fixed_asset(db, apy=3.65, lots=[(date(2026, 10, 16), 10000.0)], lag=1)
+    assert fixed_accrual.accrue(db, [asset.id], through=date(2026, 10, 18)) == 0
+    db.flush()
+    assert fixed_accrual.summarize(db, [asset.id], date(2026, 10, 17)) == {
+        asset.id: {"accrued": 0.0, "day_interest": 0.0, "lots": {}}
+    }
+    h = valuation.HoldingColumns([asset])
+    valuation.attach_accruals(db, h, date(2026, 10, 17))
+    v = valuation.value_fixed(h, date(2026, 10, 17), derive_apy=True)
+    assert h.has_ledger.tolist() == [True]
+    assert v.day_profit.tolist() == [0.0]
+    assert v.market_value.tolist() == [10000.0]
+
+    # 周一起息后按台账入账
+    fixed_accrual.accrue(db, [asset.id], through=date(2026, 10, 19))
+    db.flush()
+    valuation.attach_accruals(db, h, date(2026, 10, 19))
+    assert valuation.value_fixed(h, date(2026, 10, 19)).day_profit[0] == pytest.approx(1.0)
+
+
+def test_holdings_without_lots_keep_the_estimate(db):
+    asset = _fixed_asset(db, apy=3.65)
+    assert fixed_accrual.summarize(db, [asset.id], date(2026, 10, 17)) == {}
+    h = valuation.HoldingColumns([asset])
+    h.cost[:] = 36500.0
+    valuation.attach_accruals(db, h, date(2026, 10, 17))
+    assert valuation.value_fixed(h, date(2026, 10, 17)).day_profit[0] == pytest.approx(3.65)
@@ -0,0 +1,54 @@
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+
+import holding_history
+import models
+import valuation
+
+FRIDAY, SATURDAY, MONDAY = date(2026, 10, 16), date(2026, 10, 17), date(2026, 10, 19)
+
+
+def _valuation(day):
+    rows = [SimpleNamespace(id=7001, asset_type="stock", name="A", code="600000", cost_price=10.0, quantity=100,
+                            apy=None, start_date=None)]
+    # 周末拿到的行情仍是周五收盘的涨跌幅
+    market = {"stocks": {"600000": {"price": 11.0, "change": 10.0}}}
+    return valuation.value_portfolio(valuation._split_classes(rows), market, day)
+
+
+def _row(db, day):
+    H = models.HoldingHistory
+    return db.query(H).filter(H.asset_id == 7001, H.date == day).one()
+
+
+def test_weekend_rows_carry_forward(db):
+    holding_history.record_days(db, FRIDAY, {9101: _valuation(FRIDAY)})
+    holding_history.record_days(db, SATURDAY, {9101: _valuation(SATURDAY)})
+    db.flush()
+    friday, saturday = _row(db, FRIDAY), _row(db, SATURDAY)
+    assert friday.day_profit == pytest.approx(100.0)
+    assert friday.twr_index == pytest.approx(1.1)
+    # 周末不重复计入周五的涨跌：当日盈亏 0，累计和指数沿用周五
+    assert saturday.day_profit == 0.0
+    assert saturday.market_value == pytest.approx(1100.0)
+    assert saturday.cum_profit == pytest.approx(friday.cum_profit)
+    assert saturday.twr_index == pytest.approx(friday.twr_index)
+
+    holding_history.record_days(db, MONDAY, {9101: _valuation(MONDAY)})
+    db.flush()
+    monday = _row(db, MONDAY)
+    assert monday.cum_profit == pytest.approx(200.0)
+    assert monday.twr_index == pytest.approx(1.21)
+
+
+def test_backfilled_weekend_keeps_later_rows_consistent(db):
+    holding_history.record_days(db, FRIDAY, {9102: _valuation(FRIDAY)})
+    holding_history.record_days(db, MONDAY, {9102: _valuation(MONDAY)})
+    # 事后补写周六：后面的行整条重算，周六的 0 不影响周一
+    holding_history.record_days(db, SATURDAY, {9102: _valuation(SATURDAY)})
+    db.flush()
+    db.expire_all()
+    assert _row(db, MONDAY).cum_profit == pytest.approx(200.0)
+    assert _row(db, MONDAY).twr_index == pytest.approx(1.21)
@@ -0,0 +1,63 @@
+import asyncio
+
+from market_stream import MarketStreamHub
+
+
+class FakeEngine:
+    def __init__(self):
+        self.calls = []
+
+    async def get_real_time_data(self, stock_codes, fund_codes, source="tencent", force=False):
+        self.calls.append((source, list(stock_codes), list(fund_codes)))
+        price = 11.0 if source == "sina" else 12.0
+        return {
+            "stocks": {c: {"name": c, "price": price, "change": 1.0} for c in stock_codes},
+            "funds": {c: {"nav": 1.5} for c in fund_codes},
+        }
+
+
+def _hub(engine):
+    hub = MarketStreamHub(engine)
+    hub._load_holdings = lambda: {1: ({"600000"}, {"110011"}), 2: ({"000001"}, set())}
+
+    async def idle():
+        # 不启动后台生产者，测试里手动调 _tick
+        pass
+    hub._run = idle
+    return hub
+
+
+def test_subscribers_get_their_own_source():
+    engine = FakeEngine()
+    hub = _hub(engine)
+
+    async def run():
+        sina = await hub.subscribe(1, "sina")
+        tencent = await hub.subscribe(2, "tencent")
+        await hub._tick()
+        return sina.get_nowait(), tencent.get_nowait()
+
+    (ev1, p1), (ev2, p2) = asyncio.run(run())
+    assert sorted(source for source, _, _ in engine.calls) == ["sina", "tencent"]
+    assert ev1 == ev2 == "snapshot"
+    # 按用户持仓过滤，并且价格来自各自选的行情源
+    assert p1 == {"stocks": {"600000": {"name": "600000", "price": 11.0, "change": 1.0}}, "funds": {"110011": {"nav": 1.5}}}
+    assert p2 == {"stocks": {"000001": {"name": "000001", "price": 12.0, "change": 1.0}}, "funds": {}}
+
+
+def test_unknown_source_uses_default_and_deltas_only_push_changes():
+    engine = FakeEngine()
+    hub = _hub(engine)
+
+    async def run():
+        queue = await hub.subscribe(1, "bogus")
+        await hub._tick()
+        first = queue.get_nowait()
+        await hub._tick()
+        return first, queue.empty()
+
+    (event, payload), idle = asyncio.run(run())
+    assert engine.calls[0][0] == MarketStreamHub.DEFAULT_SOURCE
+    assert event == "snapshot" and payload["stocks"]["600000"]["price"] == 12.0
+    # 第二轮行情没变，不推 delta
+    assert idle
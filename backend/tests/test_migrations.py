@@ -0,0 +1,59 @@
+from sqlalchemy import create_engine, inspect, text
+
+import migrations
+
+# 引入迁移之前 (基线版本) 的表结构
+LEGACY_SCHEMA = (
+    "CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR UNIQUE, hashed_password VARCHAR)",
+    "CREATE TABLE assets (id INTEGER PRIMARY KEY, owner_id INTEGER, asset_type VARCHAR, name VARCHAR, code VARCHAR, "
+    "cost_price FLOAT, quantity FLOAT, tag VARCHAR, start_date VARCHAR, apy FLOAT)",
+    "CREATE TABLE system_config (key VARCHAR PRIMARY KEY, value VARCHAR)",
+    "CREATE TABLE asset_history (id INTEGER PRIMARY KEY, owner_id INTEGER, date DATE, total_asset FLOAT, total_profit FLOAT)",
+)
+
+
+def _version(engine):
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar()
+
+
+def test_fresh_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+    assert migrations.run(engine) == migrations.LATEST_VERSION
+    tables = set(inspect(engine).get_table_names())
+    assert {"assets", "asset_transactions", "fixed_accruals", "webhook_outbox", "schema_version"} <= tables
+    # 已是最新版本时不再执行任何步骤
+    assert migrations.run(engine) == migrations.LATEST_VERSION
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM schema_version")).scalar() == migrations.LATEST_VERSION
+
+
+def test_legacy_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        for ddl in LEGACY_SCHEMA:
+            conn.execute(text(ddl))
+    # v2 之前的老库：extra 是后来手工加上的
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE assets ADD COLUMN extra VARCHAR"))
+        conn.execute(text(
+            "INSERT INTO assets (id, owner_id, asset_type, name, code, cost_price, quantity, apy, extra) VALUES "
+            "(1, 1, 'fixed', '定期', 'F1', 0, 15000, 3.0, "
+            "'[{\"date\": \"2026-09-01\", \"amount\": \"10,000\"}, {\"date\": \"2026-09-15\", \"amount\": 5000}]'), "
+            "(2, 1, 'stock', '浦发银行', '600000', 10, 100, NULL, NULL)"
+        ))
+        conn.execute(text(
+            "INSERT INTO asset_history (id, owner_id, date, total_asset, total_profit) VALUES "
+            "(1, 1, '2026-10-16', 100, 1), (2, 1, '2026-10-16', 200, 2), (3, 1, '2026-10-15', 90, 0)"
+        ))
+
+    assert migrations.run(engine) == migrations.LATEST_VERSION
+    assert _version(engine) == migrations.LATEST_VERSION
+    with engine.connect() as conn:
+        lots = conn.execute(text("SELECT asset_id, date, amount FROM asset_transactions ORDER BY date")).fetchall()
+        assert [(a, str(d), amt) for a, d, amt in lots] == [(1, "2026-09-01", 10000.0), (1, "2026-09-15", 5000.0)]
+        assert conn.execute(text("SELECT extra FROM assets WHERE id = 1")).scalar() is None
+        # 同一天的重复快照只保留最后写入的一条
+        assert conn.execute(text("SELECT id FROM asset_history ORDER BY id")).scalars().all() == [2, 3]
+        assert conn.execute(text("SELECT holiday_rule FROM assets WHERE id = 2")).scalar() == "calendar"
+    assert {"interest_mode", "value_lag", "holiday_rule"} <= {c["name"] for c in inspect(engine).get_columns("assets")}
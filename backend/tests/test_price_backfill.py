@@ -0,0 +1,50 @@
+import asyncio
+import threading
+from datetime import date
+
+import models
+from price_backfill import PriceBackfill
+
+
+def test_find_gaps_only_after_first_snapshot(db):
+    db.add_all([
+        models.Asset(owner_id=9201, asset_type="stock", name="A", code="600000", cost_price=10, quantity=100),
+        models.Asset(owner_id=9201, asset_type="fixed", name="F", code="F1", cost_price=0, quantity=1000),
+        models.Asset(owner_id=9202, asset_type="fund", name="B", code="110011", cost_price=1, quantity=100),
+        models.AssetHistory(owner_id=9201, date=date(2026, 10, 12), total_asset=1, total_profit=0),
+        models.AssetHistory(owner_id=9201, date=date(2026, 10, 14), total_asset=1, total_profit=0),
+    ])
+    db.commit()
+    try:
+        gaps, codes = PriceBackfill._find_gaps(date(2026, 10, 8), date(2026, 10, 16))
+        # 9201 第一条快照之前的日子和周末不算缺口；9202 没有任何快照，不补
+        assert gaps == {9201: [date(2026, 10, 13), date(2026, 10, 15), date(2026, 10, 16)]}
+        assert codes == [("stock", "600000")]
+    finally:
+        db.query(models.AssetHistory).filter(models.AssetHistory.owner_id == 9201).delete()
+        db.query(models.Asset).filter(models.Asset.owner_id.in_((9201, 9202))).delete()
+        db.commit()
+
+
+def test_recover_missed_queries_off_the_event_loop(monkeypatch):
+    backfill = PriceBackfill(engine=None)
+    threads = {}
+
+    def find_gaps(start, end):
+        threads["gaps"] = threading.current_thread()
+        return {1: [date(2026, 10, 13)]}, [("stock", "600000"), ("fund", "110011")]
+
+    async def fake_backfill(stock_codes, fund_codes, start, end):
+        threads["backfill"] = (stock_codes, fund_codes)
+
+    def replay(owner_id, start, end):
+        threads["replay"] = threading.current_thread()
+        return [start]
+
+    monkeypatch.setattr(backfill, "_find_gaps", find_gaps)
+    monkeypatch.setattr(backfill, "backfill", fake_backfill)
+    monkeypatch.setattr(backfill, "replay", replay)
+    assert asyncio.run(backfill.recover_missed()) == {1: 1}
+    assert threads["gaps"] is not threading.main_thread()
+    assert threads["replay"] is not threading.main_thread()
+    assert threads["backfill"] == (["600000"], ["110011"])
@@ -0,0 +1,91 @@
+import pytest
+
+from market_engine import parse_sina_quotes, parse_tencent_quotes
+
+
+def _tencent(key, fields):
+    return f'v_{key}="{"~".join(fields)}";'
+
+
+def _tencent_fields(name, price, close, total=88, change="1.23"):
+    fields = ["1", name, "600000", price, close] + [str(i) for i in range(5, total)]
+    if total > 32:
+        fields[32] = change
+    return fields
+
+
+def test_tencent_full_record():
+    content = _tencent("sh600000", _tencent_fields("浦发银行", "11.00", "10.00"))
+    quotes = parse_tencent_quotes(content, {"sh600000": "600000"})
+    assert quotes["600000"]["name"] == "浦发银行"
+    assert quotes["600000"]["price"] == 11.0
+    assert quotes["600000"]["change"] == pytest.approx(10.0)
+
+
+def test_tencent_minimum_field_count():
+    # 旧解析按 len(data) > 30 判断：31 个字段有效，30 个字段丢弃
+    code_map = {"sh600000": "600000"}
+    assert "600000" in parse_tencent_quotes(_tencent("sh600000", _tencent_fields("A", "11", "10", total=31)), code_map)
+    assert parse_tencent_quotes(_tencent("sh600000", _tencent_fields("A", "11", "10", total=30)), code_map) == {}
+
+
+def test_tencent_uses_own_change_without_close():
+    content = _tencent("sz000001", _tencent_fields("平安银行", "12.00", "0", change="-2.5"))
+    quotes = parse_tencent_quotes(content, {"sz000001": "000001"})
+    assert quotes["000001"]["change"] == -2.5
+
+
+def test_tencent_suspended_price_falls_back_to_close():
+    content = _tencent("sh600000", _tencent_fields("A", "0.00", "10.00"))
+    quote = parse_tencent_quotes(content, {"sh600000": "600000"})["600000"]
+    assert quote["price"] == 10.0 and quote["change"] == 0.0
+
+
+def test_tencent_skips_unknown_and_bad_records():
+    content = "\n".join([
+        _tencent("sh600000", _tencent_fields("A", "11", "10")),
+        _tencent("sh600001", _tencent_fields("B", "abc", "10")),
+        _tencent("sh999999", _tencent_fields("C", "11", "10")),
+        'v_pv_none_match="1";',
+        _tencent("sz000001", _tencent_fields("D", "9", "10")),
+    ])
+    quotes = parse_tencent_quotes(content, {"sh600000": "600000", "sh600001": "600001", "sz000001": "000001"})
+    assert sorted(quotes) == ["000001", "600000"]
+
+
+def test_tencent_matches_split_parser():
+    from bench.run_bench import _split_tencent
+    from bench.stub_upstream import tencent_payload
+    code_map = {f"sh{600000 + i:06d}": f"{600000 + i:06d}" for i in range(50)}
+    content = tencent_payload(code_map)
+    fast, split = parse_tencent_quotes(content, code_map), _split_tencent(content, code_map)
+    assert fast.keys() == split.keys()
+    for code in fast:
+        assert fast[code]["price"] == split[code]["price"]
+        assert fast[code]["change"] == pytest.approx(split[code]["change"])
+
+
+def test_sina_records():
+    content = "\n".join([
+        'var hq_str_sh600000="浦发银行,10.10,10.00,11.00,11.20,9.90,11.00,11.01,1000";',
+        'var hq_str_sz000001="平安银行,0,0,12.00,0,0";',
+        'var hq_str_sh600001="";',
+        'var hq_str_sh600002="短记录,1,2,3";',
+    ])
+    code_map = {"sh600000": "600000", "sz000001": "000001", "sh600001": "600001", "sh600002": "600002"}
+    quotes = parse_sina_quotes(content, code_map)
+    assert sorted(quotes) == ["000001", "600000"]
+    assert quotes["600000"] == {"name": "浦发银行", "price": 11.0, "change": pytest.approx(10.0)}
+    assert quotes["000001"]["change"] == 0.0
+
+
+def test_sina_matches_split_parser():
+    from bench.run_bench import _split_sina
+    from bench.stub_upstream import sina_payload
+    code_map = {f"sz{i:06d}": f"{i:06d}" for i in range(1, 51)}
+    content = sina_payload(code_map)
+    fast, split = parse_sina_quotes(content, code_map), _split_sina(content, code_map)
+    assert fast.keys() == split.keys()
+    for code in fast:
+        assert fast[code]["price"] == split[code]["price"]
+        assert fast[code]["change"] == pytest.approx(split[code]["change"])
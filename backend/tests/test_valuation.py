@@ -0,0 +1,94 @@
+from datetime import date
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import valuation
+
+
+def _row(asset_id, asset_type, code, cost, qty, apy=None, start_date=None):
+    return SimpleNamespace(id=asset_id, asset_type=asset_type, name=f"资产{asset_id}", code=code,
+                           cost_price=cost, quantity=qty, apy=apy, start_date=start_date)
+
+
+@pytest.fixture
+def holdings():
+    return valuation._split_classes([
+        _row(1, "stock", "600000", 10.0, 100),
+        _row(2, "stock", "000001", 20.0, 50),
+        _row(3, "fund", "110011", 1.5, 1000),
+        _row(4, "fund", "000002", 2.0, 500),
+        _row(5, "fixed", "", 10100.0, 10000, apy=3.65, start_date="2026-01-01"),
+        _row(6, "fixed", "", 10050.0, 10000, start_date="2026-10-07"),
+        _row(7, "other", "X", 1.0, 1),
+    ])
+
+
+MARKET = {
+    "stocks": {"600000": {"name": "A", "price": 11.0, "change": 10.0}},
+    "funds": {"110011": {"nav": 1.6, "price": None, "estimatedChange": 2.0}},
+}
+
+
+def test_stocks(holdings):
+    v = valuation.value_portfolio(holdings, MARKET, date(2026, 10, 17))["stock"]
+    # 有行情按现价；没有行情按成本价、涨幅 0
+    assert v.price.tolist() == [11.0, 20.0]
+    assert v.market_value.tolist() == [1100.0, 1000.0]
+    assert v.principal.tolist() == [1000.0, 1000.0]
+    # 日盈亏 = 市值 * 涨幅 / (100 + 涨幅)
+    assert v.day_profit.tolist() == pytest.approx([100.0, 0.0])
+
+
+def test_funds_fall_back_through_keys(holdings):
+    v = valuation.value_portfolio(holdings, MARKET, date(2026, 10, 17))["fund"]
+    # price 为空时取 nav，estimatedChange 优先于 change
+    assert v.price.tolist() == [1.6, 2.0]
+    assert v.day_profit.tolist() == pytest.approx([1600.0 * 0.02, 0.0])
+    assert v.rate.tolist() == [2.0, 0.0]
+
+
+def test_fixed_snapshot_rule(holdings):
+    v = valuation.value_portfolio(holdings, MARKET, date(2026, 10, 17))["fixed"]
+    assert v.market_value.tolist() == [10100.0, 10050.0]
+    assert v.principal.tolist() == [10000.0, 10000.0]
+    # 填了年化：市值 * 年化 / 365；没填年化的当日收益记 0 (日报原口径)
+    assert v.day_profit.tolist() == pytest.approx([10100.0 * 0.0365 / 365, 0.0])
+    assert v.rate.tolist() == [3.65, 0.0]
+
+
+def test_fixed_dashboard_rule_derives_apy(holdings):
+    v = valuation.value_portfolio(holdings, MARKET, date(2026, 10, 17), derive_apy=True)["fixed"]
+    # 10 天赚 50：年化 = 50 / 10000 / 10 * 365 * 100
+    assert v.rate[1] == pytest.approx(18.25)
+    assert v.day_profit[1] == pytest.approx(10050.0 * 0.1825 / 365)
+    assert v.rate[0] == 3.65
+
+
+def test_fixed_ledger_overrides_estimate(holdings):
+    h = holdings["fixed"]
+    h.cost[:] = 0
+    valuation._apply_accruals(h, {5: {"accrued": 120.0, "day_interest": 1.25}})
+    v = valuation.value_fixed(h, date(2026, 10, 17))
+    # 没录市值时用 本金 + 台账累计利息；有台账的当日收益取台账
+    assert v.market_value.tolist() == [10120.0, 10000.0]
+    assert v.day_profit.tolist() == [1.25, 0.0]
+
+
+def test_totals(holdings):
+    v = valuation.value_portfolio(holdings, MARKET, date(2026, 10, 17))
+    data = v.to_dict()
+    assert data["date"] == "2026-10-17"
+    assert data["total"]["market_value"] == pytest.approx(2100.0 + 2600.0 + 20150.0)
+    assert data["total"]["principal"] == pytest.approx(2000.0 + 2500.0 + 20000.0)
+    assert data["total"]["cumulative_profit"] == pytest.approx(350.0)
+    assert [i["id"] for i in data["stock"]["items"]] == [1, 2]
+    assert "items" not in v.to_dict(with_items=False)["fund"]
+
+
+def test_empty_portfolio():
+    v = valuation.value_portfolio(valuation._split_classes([]), {}, date(2026, 10, 17))
+    assert v.total_market_value == 0 and v.total_day_profit == 0
+    assert v["fixed"].rate.shape == (0,)
+    assert isinstance(v["stock"].market_value, np.ndarray)
@@ -0,0 +1,161 @@
+import asyncio
+import threading
+import time
+import weakref
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+from urllib.parse import urlsplit
+
+import httpx
+
+import metrics
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(Exception):
+    """目标 host 处于熔断期，请求未发出直接失败。"""
+
+
+class CircuitBreaker:
+    """单个 host 的熔断器：连续失败达到阈值后打开，冷却期按指数退避；
+    冷却结束后放行一个试探请求 (半开)，成功即恢复，失败则冷却时间翻倍。"""
+    def __init__(self, host: str, failure_threshold: int = 3, base_cooldown: float = 5, max_cooldown: float = 120):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self.failures = 0
+        self.cooldown = base_cooldown
+        self.open_until = 0.0
+        self.half_open = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.failures < self.failure_threshold:
+            return "closed"
+        return "half_open" if self.half_open else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.failures < self.failure_threshold:
+                return True
+            if self.half_open or time.monotonic() < self.open_until:
+                return False
+            # 冷却结束，只放一个试探请求过去
+            self.half_open = True
+            return True
+
+    def abandon(self):
+        # 试探请求被取消 (没有结论)，允许下一次请求重新试探
+        with self._lock:
+            self.half_open = False
+
+    def record_success(self):
+        with self._lock:
+            if self.failures >= self.failure_threshold:
+                print(f"Upstream {self.host}: circuit closed")
+                metrics.UPSTREAM_CIRCUIT_STATE.set(0, host=self.host)
+            self.failures = 0
+            self.cooldown = self.base_cooldown
+            self.half_open = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.half_open:
+                self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+                self.half_open = False
+            elif self.failures != self.failure_threshold:
+                return
+            self.open_until = time.monotonic() + self.cooldown
+            print(f"Upstream {self.host}: circuit open for {self.cooldown:.0f}s")
+            metrics.UPSTREAM_CIRCUIT_STATE.set(1, host=self.host)
+
+
+class UpstreamPool:
+    """上游访问层：每个 host 一个长连接池 (httpx.AsyncClient)，配合 host 级熔断器。
+
+    AsyncClient 绑定在创建它的事件循环上，所以按 (事件循环, host) 分别缓存。
+    """
+    def __init__(self, headers: Optional[Dict[str, str]] = None, max_connections: int = 16):
+        self.headers = headers or {}
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections, keepalive_expiry=30)
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, httpx.AsyncClient]]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        with self._lock:
+            if host not in self.breakers:
+                self.breakers[host] = CircuitBreaker(host)
+            return self.breakers[host]
+
+    def client(self, host: str) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            clients = self._clients.setdefault(loop, {})
+            client = clients.get(host)
+            if client is None or client.is_closed:
+                client = clients[host] = httpx.AsyncClient(headers=self.headers, limits=self.limits)
+            return client
+
+    async def get(self, url: str, *, timeout: float, headers: Optional[Dict[str, str]] = None, params: Optional[Dict[str, Any]] = None) -> httpx.Response:
+        return await self.request("GET", url, timeout=timeout, headers=headers, params=params)
+
+    async def post(self, url: str, *, timeout: float, json: Any = None, headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+        return await self.request("POST", url, timeout=timeout, headers=headers, json=json)
+
+    async def request(self, method: str, url: str, *, timeout: float, **kwargs) -> httpx.Response:
+        host = urlsplit(url).netloc
+        breaker = self.breaker(host)
+        if not breaker.allow():
+            metrics.UPSTREAM_CIRCUIT_OPEN.inc(host=host)
+            raise CircuitOpenError(host)
+        start = time.perf_counter()
+        try:
+            resp = await self.client(host).request(method, url, timeout=timeout, **kwargs)
+            if resp.status_code >= 500:
+                raise httpx.HTTPStatusError(f"{host} returned {resp.status_code}", request=resp.request, response=resp)
+        except asyncio.CancelledError:
+            # 被整批截止时间取消不算上游的错
+            breaker.abandon()
+            metrics.UPSTREAM_SECONDS.observe(time.perf_counter() - start, host=host, outcome="cancelled")
+            raise
+        except Exception:
+            breaker.record_failure()
+            metrics.UPSTREAM_SECONDS.observe(time.perf_counter() - start, host=host, outcome="error")
+            raise
+        breaker.record_success()
+        metrics.UPSTREAM_SECONDS.observe(time.perf_counter() - start, host=host, outcome="ok")
+        return resp
+
+    async def aclose(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            clients = self._clients.pop(loop, {})
+        for client in clients.values():
+            await client.aclose()
+
+
+async def hedged(primary: Callable[[], Awaitable[T]], backup: Callable[[], Awaitable[T]], delay: float,
+                 is_valid: Callable[[Any], bool] = bool) -> Optional[T]:
+    """对冲请求：先发主源，主源失败或 delay 秒内没回来就再发备源，取第一个有效结果，另一个取消。"""
+    tasks = {asyncio.ensure_future(primary())}
+    backup_started = False
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        while True:
+            for task in done:
+                tasks.discard(task)
+                if not task.cancelled() and task.exception() is None and is_valid(task.result()):
+                    return task.result()
+            if not backup_started:
+                tasks.add(asyncio.ensure_future(backup()))
+                backup_started = True
+            if not tasks:
+                return None
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,259 @@
+"""组合估值：持仓和行情装进 NumPy 列数组，按资产类别一次批量算出市值、本金和当日盈亏。
+
+快照推送和 /api/portfolio/summary 共用这里的公式，前端 Dashboard / AssetCards 直接展示结果，
+各处报的数字因此完全一致。唯一的口径差别是没填年化的理财：看板按市值反推年化算当日收益，
+日报快照沿用原来的 0 (见 value_fixed 的 derive_apy)。
+"""
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+import models
+import fixed_accrual
+
+ASSET_CLASSES = ("stock", "fund", "fixed")
+
+_NO_QUOTE: Dict[str, Any] = {}
+
+
+class HoldingColumns:
+    """同一资产类别的全部持仓，按列存放。"""
+    def __init__(self, rows: Sequence[Any]):
+        n = len(rows)
+        self.ids: List[int] = [r.id for r in rows]
+        self.names: List[str] = [r.name for r in rows]
+        self.codes: List[str] = [r.code for r in rows]
+        self.start_dates: List[Optional[str]] = [r.start_date for r in rows]
+        self.cost = np.fromiter((r.cost_price or 0 for r in rows), dtype=float, count=n)
+        self.qty = np.fromiter((r.quantity or 0 for r in rows), dtype=float, count=n)
+        self.apy = np.fromiter((r.apy or 0 for r in rows), dtype=float, count=n)
+        # 仅理财：计息台账截至今天的累计利息、今天入账的利息，以及是否有台账
+        self.accrued = np.zeros(n)
+        self.day_interest = np.zeros(n)
+        self.has_ledger = np.zeros(n, dtype=bool)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class ClassValuation:
+    """某一资产类别的估值结果：逐只持仓的列数组 + 汇总。
+
+    rate 对股票/基金是当日涨跌幅 (%)，对理财是年化 (%)；
+    price 对股票/基金是现价/净值，对理财是当前市值 (与 assets.cost_price 同义)。
+    """
+    def __init__(self, asset_type: str, holdings: HoldingColumns, market_value: np.ndarray,
+                 principal: np.ndarray, day_profit: np.ndarray, rate: np.ndarray, price: np.ndarray):
+        self.asset_type = asset_type
+        self.holdings = holdings
+        self.price = price
+        self.market_value = market_value
+        self.principal = principal
+        self.day_profit = day_profit
+        self.rate = rate
+
+    @property
+    def total_market_value(self) -> float:
+        return float(self.market_value.sum())
+
+    @property
+    def total_principal(self) -> float:
+        return float(self.principal.sum())
+
+    @property
+    def total_day_profit(self) -> float:
+        return float(self.day_profit.sum())
+
+    def to_dict(self, with_items: bool = True) -> Dict[str, Any]:
+        data: Dict[str, Any] = {
+            "count": len(self.holdings),
+            "market_value": self.total_market_value,
+            "principal": self.total_principal,
+            "day_profit": self.total_day_profit,
+        }
+        if with_items:
+            h = self.holdings
+            data["items"] = [
+                {"id": i, "code": c, "name": n, "market_value": mv, "principal": p, "day_profit": dp, "rate": r}
+                for i, c, n, mv, p, dp, r in zip(
+                    h.ids, h.codes, h.names, self.market_value.tolist(), self.principal.tolist(),
+                    self.day_profit.tolist(), self.rate.tolist())
+            ]
+        return data
+
+
+class PortfolioValuation:
+    def __init__(self, classes: Dict[str, ClassValuation], as_of: date):
+        self.classes = classes
+        self.as_of = as_of
+
+    def __getitem__(self, asset_type: str) -> ClassValuation:
+        return self.classes[asset_type]
+
+    @property
+    def total_market_value(self) -> float:
+        return sum(c.total_market_value for c in self.classes.values())
+
+    @property
+    def total_principal(self) -> float:
+        return sum(c.total_principal for c in self.classes.values())
+
+    @property
+    def total_day_profit(self) -> float:
+        return sum(c.total_day_profit for c in self.classes.values())
+
+    def to_dict(self, with_items: bool = True) -> Dict[str, Any]:
+        data: Dict[str, Any] = {k: c.to_dict(with_items) for k, c in self.classes.items()}
+        total_mv = self.total_market_value
+        total_principal = self.total_principal
+        data["date"] = self.as_of.strftime("%Y-%m-%d")
+        data["total"] = {
+            "market_value": total_mv,
+            "principal": total_principal,
+            "day_profit": self.total_day_profit,
+            "cumulative_profit": total_mv - total_principal,
+        }
+        return data
+
+
+# ==========================================================
+# 装载
+# ==========================================================
+def load_holdings(db: Session, owner_id: int) -> Dict[str, HoldingColumns]:
+    """一次查询取出用户全部持仓，按资产类别拆成列。"""
+    return load_all_holdings(db, [owner_id]).get(owner_id) or _split_classes([])
+
+
+def load_all_holdings(db: Session, owner_ids: Optional[Sequence[int]] = None) -> Dict[int, Dict[str, HoldingColumns]]:
+    """一次查询取出多个用户 (默认所有有持仓的用户) 的全部持仓，理财台账也只查一次。"""
+    A = models.Asset
+    q = db.query(A.owner_id, A.id, A.asset_type, A.name, A.code, A.cost_price, A.quantity, A.apy, A.start_date).filter(
+        A.owner_id.isnot(None)
+    )
+    if owner_ids is not None:
+        q = q.filter(A.owner_id.in_(list(owner_ids)))
+    by_owner: Dict[int, list] = {}
+    for r in q.order_by(A.owner_id, A.id).all():
+        by_owner.setdefault(r.owner_id, []).append(r)
+    result = {owner_id: _split_classes(rows) for owner_id, rows in by_owner.items()}
+    fixed = [h["fixed"] for h in result.values() if len(h["fixed"])]
+    if fixed:
+        ledger = fixed_accrual.summarize(db, [i for h in fixed for i in h.ids])
+        for h in fixed:
+            _apply_accruals(h, ledger)
+    return result
+
+
+def _split_classes(rows: Sequence[Any]) -> Dict[str, HoldingColumns]:
+    grouped: Dict[str, list] = {k: [] for k in ASSET_CLASSES}
+    for r in rows:
+        if r.asset_type in grouped:
+            grouped[r.asset_type].append(r)
+    return {k: HoldingColumns(v) for k, v in grouped.items()}
+
+
+def union_codes(holdings: Dict[int, Dict[str, HoldingColumns]]) -> Tuple[List[str], List[str]]:
+    """所有用户持仓里去重后的股票、基金代码，用来合并成一次行情请求。"""
+    stock_codes = sorted({c for h in holdings.values() for c in h["stock"].codes})
+    fund_codes = sorted({c for h in holdings.values() for c in h["fund"].codes})
+    return stock_codes, fund_codes
+
+
+def attach_accruals(db: Session, h: HoldingColumns, on: Optional[date] = None):
+    """把理财计息台账截至 on (默认今天) 的累计利息和当天利息装进列里；重放历史快照时逐日调用。"""
+    _apply_accruals(h, fixed_accrual.summarize(db, h.ids, on))
+
+
+def _apply_accruals(h: HoldingColumns, ledger: Dict[int, Dict[str, Any]]):
+    h.accrued[:] = 0
+    h.day_interest[:] = 0
+    h.has_ledger[:] = False
+    for i, asset_id in enumerate(h.ids):
+        item = ledger.get(asset_id)
+        if item:
+            h.accrued[i] = item["accrued"]
+            h.day_interest[i] = item["day_interest"]
+            h.has_ledger[i] = True
+
+
+def _quote_rows(codes: List[str], quotes: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # 每只持仓查一次行情字典，同一类别的几列共用这份结果
+    get = quotes.get
+    return [get(code) or _NO_QUOTE for code in codes]
+
+
+def _quote_column(rows: List[Dict[str, Any]], keys: Sequence[str], fallback: np.ndarray) -> np.ndarray:
+    # 每个字段整列取出 (缺失 / None 转成 NaN)，按 keys 顺序补空，最后用 fallback 对应位置的值兜底
+    out = np.array([q.get(keys[0]) for q in rows], dtype=float)
+    for key in keys[1:]:
+        missing = np.isnan(out)
+        if not missing.any():
+            break
+        out = np.where(missing, np.array([q.get(key) for q in rows], dtype=float), out)
+    return np.where(np.isnan(out), fallback, out)
+
+
+def _days_held(start_dates: List[Optional[str]], today: date) -> np.ndarray:
+    # 持有天数 = 今天 - 起始日，至少 1 天；起始日缺失或格式不对按 1 天算
+    today_ord = today.toordinal()
+    ords = np.full(len(start_dates), today_ord - 1, dtype=np.int64)
+    for i, s in enumerate(start_dates):
+        if not s:
+            continue
+        try:
+            ords[i] = datetime.strptime(s[:10], "%Y-%m-%d").toordinal()
+        except ValueError:
+            pass
+    return np.maximum(today_ord - ords, 1).astype(float)
+
+
+# ==========================================================
+# 各类资产的批量公式
+# ==========================================================
+def value_stocks(h: HoldingColumns, quotes: Dict[str, Dict[str, Any]]) -> ClassValuation:
+    rows = _quote_rows(h.codes, quotes)
+    price = _quote_column(rows, ("price",), h.cost)
+    change = _quote_column(rows, ("change",), np.zeros(len(h)))
+    mv = price * h.qty
+    # 日盈亏按现价反推：市值 * 涨幅 / (100 + 涨幅)
+    denom = 100 + change
+    day = np.divide(mv * change, denom, out=np.zeros_like(mv), where=np.abs(denom) > 0.001)
+    return ClassValuation("stock", h, mv, h.cost * h.qty, day, change, price)
+
+
+def value_funds(h: HoldingColumns, quotes: Dict[str, Dict[str, Any]]) -> ClassValuation:
+    rows = _quote_rows(h.codes, quotes)
+    price = _quote_column(rows, ("price", "nav"), h.cost)
+    change = _quote_column(rows, ("estimatedChange", "change"), np.zeros(len(h)))
+    mv = price * h.qty
+    return ClassValuation("fund", h, mv, h.cost * h.qty, mv * change / 100, change, price)
+
+
+def value_fixed(h: HoldingColumns, today: date, derive_apy: bool = False) -> ClassValuation:
+    # 理财：cost_price 存用户录入的当前市值，quantity 存本金；没录市值时用 本金 + 台账累计利息
+    principal = h.qty
+    mv = np.where(h.cost > 0, h.cost, principal + h.accrued)
+    apy = h.apy
+    if derive_apy:
+        # 看板口径：没填年化的，按 (市值 - 本金) / 本金 / 持有天数 反推；
+        # 日报快照沿用原来的口径 (没填年化的当日收益记 0)，历史 fixed_profit 不因此跳变
+        days = _days_held(h.start_dates, today)
+        derived = np.divide((mv - principal) * 365 * 100, principal * days,
+                            out=np.zeros_like(mv), where=principal > 0)
+        apy = np.where(h.apy != 0, h.apy, derived)
+    # 当日收益：有台账的取台账当天入账的利息 (逐笔、按起息日和节假日规则)，否则按 市值 * 年化 / 365 估算
+    day = np.where(h.has_ledger, h.day_interest, mv * apy / 100 / 365)
+    return ClassValuation("fixed", h, mv, principal, day, apy, mv)
+
+
+def value_portfolio(holdings: Dict[str, HoldingColumns], market: Dict[str, Dict[str, Any]],
+                    today: Optional[date] = None, derive_apy: bool = False) -> PortfolioValuation:
+    """market 即 MarketEngine.get_real_time_data 的返回值；derive_apy 见 value_fixed。"""
+    today = today or date.today()
+    return PortfolioValuation({
+        "stock": value_stocks(holdings["stock"], market.get("stocks", {})),
+        "fund": value_funds(holdings["fund"], market.get("funds", {})),
+        "fixed": value_fixed(holdings["fixed"], today, derive_apy),
+    }, today)
@@ -0,0 +1,327 @@
+import asyncio
+import json
+import random
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from sqlalchemy import func, or_
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+import models
+import metrics
+from database import SessionLocal
+from upstream import UpstreamPool
+
+FORMATS = ("wecom", "dingtalk", "feishu", "slack", "json")
+TARGETS_CONFIG_KEY = "webhook_targets"
+LEGACY_URL_KEY = "webhook_url"
+
+# 按域名猜消息格式，猜不出来的按企业微信 (以前唯一支持的格式)
+_FORMAT_HOSTS = {
+    "qyapi.weixin.qq.com": "wecom",
+    "oapi.dingtalk.com": "dingtalk",
+    "open.feishu.cn": "feishu",
+    "open.larksuite.com": "feishu",
+    "hooks.slack.com": "slack",
+}
+
+
+def detect_format(url: str) -> str:
+    return _FORMAT_HOSTS.get(urlsplit(url).hostname or "", "wecom")
+
+
+# ==========================================================
+# 推送目标 (system_config)
+# ==========================================================
+def _mask(url: str) -> str:
+    # 机器人地址里的 key 等同于密码，对外只展示域名和路径
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}{parts.path}"
+
+
+def config_key(base: str, owner_id: Optional[int] = None) -> str:
+    # 不带用户的全局配置是单用户时代留下的，归管理员；其他用户各存一份 <key>:<id>
+    return base if owner_id is None else f"{base}:{owner_id}"
+
+
+def _parse_targets(value: Optional[str], legacy: Optional[str] = None) -> List[Dict[str, str]]:
+    targets: List[Dict[str, str]] = []
+    try:
+        for t in json.loads(value or "[]"):
+            url = str(t.get("url") or "").strip()
+            if url.startswith("http"):
+                fmt = t.get("format") if t.get("format") in FORMATS else detect_format(url)
+                targets.append({"url": url, "format": fmt})
+    except (ValueError, AttributeError):
+        print("Invalid webhook_targets config ignored")
+    legacy = (legacy or "").strip()
+    if legacy.startswith("http") and all(t["url"] != legacy for t in targets):
+        targets.append({"url": legacy, "format": detect_format(legacy)})
+    return targets
+
+
+def load_targets(db: Session, owner_id: Optional[int] = None) -> List[Dict[str, str]]:
+    """某个用户的推送目标：webhook_targets (JSON 列表) 里的地址，加上设置页保存的 webhook_url。"""
+    keys = (config_key(TARGETS_CONFIG_KEY, owner_id), config_key(LEGACY_URL_KEY, owner_id))
+    rows = {r.key: r.value for r in db.query(models.SystemConfig).filter(models.SystemConfig.key.in_(keys)).all()}
+    return _parse_targets(rows.get(keys[0]), rows.get(keys[1]))
+
+
+def load_all_targets(db: Session) -> Dict[Optional[int], List[Dict[str, str]]]:
+    """一次查询取出全部用户的推送目标，键为 owner_id (全局配置为 None)。"""
+    C = models.SystemConfig
+    raw: Dict[Optional[int], Dict[str, str]] = {}
+    for base in (TARGETS_CONFIG_KEY, LEGACY_URL_KEY):
+        for r in db.query(C).filter((C.key == base) | C.key.like(f"{base}:%")).all():
+            suffix = r.key[len(base) + 1:]
+            if r.key == base or suffix.isdigit():
+                raw.setdefault(int(suffix) if suffix else None, {})[base] = r.value
+    return {owner: _parse_targets(v.get(TARGETS_CONFIG_KEY), v.get(LEGACY_URL_KEY)) for owner, v in raw.items()}
+
+
+def save_config(db: Session, key: str, value: str):
+    """写一条 system_config (调用方负责 commit)。"""
+    item = db.query(models.SystemConfig).filter(models.SystemConfig.key == key).first()
+    if item:
+        item.value = value
+    else:
+        db.add(models.SystemConfig(key=key, value=value))
+
+
+def save_targets(db: Session, targets: List[Dict[str, str]], owner_id: Optional[int] = None):
+    """保存某个用户额外的推送目标 (调用方负责 commit)。"""
+    save_config(db, config_key(TARGETS_CONFIG_KEY, owner_id), json.dumps(targets, ensure_ascii=False))
+
+
+def render(fmt: str, text: str, report: Dict[str, Any]) -> Dict[str, Any]:
+    """按目标平台的机器人协议包装消息。"""
+    if fmt in ("wecom", "dingtalk"):
+        return {"msgtype": "text", "text": {"content": text}}
+    if fmt == "feishu":
+        return {"msg_type": "text", "content": {"text": text}}
+    if fmt == "slack":
+        return {"text": text}
+    return dict(report, text=text)
+
+
+class WebhookOutbox:
+    """Webhook 发件箱 (webhook_outbox 表)。
+
+    快照任务在同一个事务里把日报写进发件箱就返回，不等网络；应用事件循环上的后台协程
+    负责投递：复用长连接，失败按指数退避重试，超过次数标记为 dead。
+    同一份日报对同一个地址只有一行，重复执行快照只会刷新还没发出去的内容。
+    """
+    BASE_BACKOFF = 30
+    MAX_BACKOFF = 3600
+    MAX_ATTEMPTS = 10
+    BATCH_SIZE = 20
+    TIMEOUT = 10
+    # 没有到期消息时最长睡多久 (其他进程写入的消息靠这个轮询兜底)
+    IDLE_POLL = 60
+    # 发送中的消息先把下次尝试时间推后这么久，防止多个 worker 重复投递
+    CLAIM_LEASE = 60
+    RETENTION_DAYS = 30
+
+    def __init__(self):
+        # 单独的连接池和熔断器，机器人接口出问题不影响行情请求
+        self.pool = UpstreamPool(headers={"Content-Type": "application/json"}, max_connections=4)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._last_purge = 0.0
+
+    # ==========================================================
+    # 写入 (同步，在调用方的事务里)
+    # ==========================================================
+    def enqueue(self, db: Session, owner_id: int, report_date: date, text: str, report: Dict[str, Any],
+                targets: List[Dict[str, str]], force: bool = False, kind: str = "daily_report") -> int:
+        """给每个推送目标写一条待发消息，返回目标数。调用方 commit 后再调用 notify()。
+
+        targets 来自 load_targets / load_all_targets；force=True (手动测试推送) 时已发送过的也会重新发送。
+        """
+        O = models.WebhookOutbox
+        now = datetime.now()
+        for t in targets:
+            payload = json.dumps(render(t["format"], text, report), ensure_ascii=False)
+            stmt = insert(O).values(
+                owner_id=owner_id, kind=kind, report_date=report_date, target=t["url"], format=t["format"],
+                payload=payload, status="pending", attempts=0, next_attempt_at=now, created_at=now,
+            )
+            if force:
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=["owner_id", "kind", "report_date", "target"],
+                    set_={"format": t["format"], "payload": payload, "status": "pending", "attempts": 0,
+                          "next_attempt_at": now, "last_error": None, "sent_at": None},
+                )
+            else:
+                # 还没发出去的刷新成最新内容，已发送/已放弃的保持不变
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=["owner_id", "kind", "report_date", "target"],
+                    set_={"format": t["format"], "payload": payload},
+                    where=O.status == "pending",
+                )
+            db.execute(stmt)
+        return len(targets)
+
+    def notify(self):
+        """唤醒投递协程 (任何线程都可以调用)。"""
+        if self._loop is not None and self._wakeup is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._wakeup.set)
+            except RuntimeError:
+                pass  # 事件循环已关闭
+
+    # ==========================================================
+    # 投递协程
+    # ==========================================================
+    def start(self):
+        """在应用的事件循环上启动投递协程。"""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.pool.aclose()
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                delay = await self.drain()
+            except Exception as e:
+                print(f"Webhook outbox drain failed: {e}")
+                delay = self.IDLE_POLL
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def drain(self) -> float:
+        """投递所有到期消息，返回距下一条到期消息的秒数。"""
+        loop = asyncio.get_running_loop()
+        while True:
+            due = await loop.run_in_executor(None, self._claim_due)
+            if not due:
+                break
+            results = await asyncio.gather(*(self._deliver(row) for row in due))
+            await loop.run_in_executor(None, self._record, results)
+            if len(due) < self.BATCH_SIZE:
+                break
+        return await loop.run_in_executor(None, self._next_delay)
+
+    async def _deliver(self, row: Tuple[int, str, str, int]) -> Tuple[int, int, Optional[str]]:
+        msg_id, target, payload, attempts = row
+        try:
+            resp = await self.pool.post(target, json=json.loads(payload), timeout=self.TIMEOUT)
+            if not 200 <= resp.status_code < 300:
+                return msg_id, attempts, f"HTTP {resp.status_code}"
+            # 企业微信/钉钉/飞书出错时 HTTP 仍是 200，错误码在响应体里
+            try:
+                body = resp.json()
+            except ValueError:
+                body = None
+            if isinstance(body, dict):
+                code = body.get("errcode", body.get("code", body.get("StatusCode")))
+                if code not in (None, 0):
+                    return msg_id, attempts, f"errcode {code}: {body.get('errmsg') or body.get('msg') or ''}"
+            return msg_id, attempts, None
+        except Exception as e:
+            return msg_id, attempts, f"{type(e).__name__}: {e}"
+
+    # ==========================================================
+    # 状态读写 (在线程池里执行)
+    # ==========================================================
+    def _claim_due(self) -> List[Tuple[int, str, str, int]]:
+        O = models.WebhookOutbox
+        now = datetime.now()
+        db = SessionLocal()
+        try:
+            self._purge(db)
+            rows = db.query(O.id, O.target, O.payload, O.attempts).filter(
+                O.status == "pending", O.next_attempt_at <= now
+            ).order_by(O.next_attempt_at).limit(self.BATCH_SIZE).all()
+            claimed = []
+            lease = now + timedelta(seconds=self.CLAIM_LEASE)
+            for r in rows:
+                # 条件更新成功才算领到，其他 worker 同时领的那一方会更新 0 行
+                n = db.query(O).filter(O.id == r.id, O.status == "pending", O.next_attempt_at <= now).update(
+                    {"next_attempt_at": lease}, synchronize_session=False)
+                if n:
+                    claimed.append((r.id, r.target, r.payload, r.attempts or 0))
+            db.commit()
+            return claimed
+        finally:
+            db.close()
+
+    def _record(self, results: List[Tuple[int, int, Optional[str]]]):
+        O = models.WebhookOutbox
+        now = datetime.now()
+        db = SessionLocal()
+        try:
+            for msg_id, attempts, error in results:
+                attempts += 1
+                if error is None:
+                    values = {"status": "sent", "attempts": attempts, "sent_at": now, "last_error": None}
+                    metrics.WEBHOOK_DELIVERIES.inc(outcome="sent")
+                elif attempts >= self.MAX_ATTEMPTS:
+                    values = {"status": "dead", "attempts": attempts, "last_error": error[:500]}
+                    metrics.WEBHOOK_DELIVERIES.inc(outcome="dead")
+                    print(f"Webhook message {msg_id} dropped after {attempts} attempts: {error}")
+                else:
+                    backoff = min(self.BASE_BACKOFF * 2 ** (attempts - 1), self.MAX_BACKOFF) * random.uniform(0.8, 1.2)
+                    values = {"attempts": attempts, "last_error": error[:500],
+                              "next_attempt_at": now + timedelta(seconds=backoff)}
+                    metrics.WEBHOOK_DELIVERIES.inc(outcome="retry")
+                    print(f"Webhook message {msg_id} failed ({error}), retry in {backoff:.0f}s")
+                # 只更新 pending 的行：投递期间被手动推送重置过的消息不能被旧结果覆盖
+                db.query(O).filter(O.id == msg_id, O.status == "pending", O.attempts == attempts - 1).update(
+                    values, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def _next_delay(self) -> float:
+        O = models.WebhookOutbox
+        db = SessionLocal()
+        try:
+            nxt = db.query(func.min(O.next_attempt_at)).filter(O.status == "pending").scalar()
+        finally:
+            db.close()
+        if nxt is None:
+            return self.IDLE_POLL
+        return min(max((nxt - datetime.now()).total_seconds(), 0.5), self.IDLE_POLL)
+
+    def _purge(self, db: Session):
+        # 每小时清一次过期的已发送/已放弃消息
+        if time.monotonic() - self._last_purge < 3600:
+            return
+        self._last_purge = time.monotonic()
+        O = models.WebhookOutbox
+        cutoff = datetime.now() - timedelta(days=self.RETENTION_DAYS)
+        db.query(O).filter(O.status != "pending", O.created_at < cutoff).delete(synchronize_session=False)
+
+    # ==========================================================
+    # 查询
+    # ==========================================================
+    @staticmethod
+    def recent(db: Session, owner_id: int, limit: int = 20, include_global: bool = False) -> List[Dict[str, Any]]:
+        """某个用户最近的消息；include_global 时连同没有归属用户的老消息 (管理员沿用全局配置)。"""
+        O = models.WebhookOutbox
+        cond = or_(O.owner_id == owner_id, O.owner_id.is_(None)) if include_global else O.owner_id == owner_id
+        rows = db.query(O).filter(cond).order_by(O.id.desc()).limit(limit).all()
+        return [{
+            "id": r.id, "kind": r.kind, "report_date": r.report_date.strftime("%Y-%m-%d") if r.report_date else None,
+            "target": _mask(r.target), "format": r.format, "status": r.status, "attempts": r.attempts,
+            "next_attempt_at": r.next_attempt_at.isoformat() if r.next_attempt_at and r.status == "pending" else None,
+            "sent_at": r.sent_at.isoformat() if r.sent_at else None, "last_error": r.last_error,
+        } for r in rows]
@@ -1,10 +1,12 @@
 import React from 'react';
+import type { PortfolioSummary } from './Dashboard';
 import { TrendingUp, PieChart, ShieldCheck, ArrowUpRight, ArrowDownRight, Activity, Wallet, Layers } from 'lucide-react';
 
 interface AssetCardsProps {
   stocks: any[];
   funds: any[];
   fixedIncome: any[];
+  summary?: PortfolioSummary | null;
 }
 
 // 辅助工具：转数字
@@ -25,15 +27,15 @@ const getDaysDiff = (startStr?: string) => {
   return Math.max(1, days);
 };
 
-const AssetCards: React.FC<AssetCardsProps> = ({ stocks, funds, fixedIncome }) => {
+const AssetCards: React.FC<AssetCardsProps> = ({ stocks, funds, fixedIncome, summary }) => {
   
   // ==================================================================================
   // 1. 股票计算 (核心修复：强制使用反推公式)
   // ==================================================================================
-  const stockMarketValue = stocks.reduce((acc, s) => acc + (safeNum(s.currentPrice) * safeNum(s.quantity)), 0);
-  const stockTotalCost = stocks.reduce((acc, s) => acc + (safeNum(s.costPrice) * safeNum(s.quantity)), 0);
+  let stockMarketValue = stocks.reduce((acc, s) => acc + (safeNum(s.currentPrice) * safeNum(s.quantity)), 0);
+  let stockTotalCost = stocks.reduce((acc, s) => acc + (safeNum(s.costPrice) * safeNum(s.quantity)), 0);
   
-  const stockDailyProfit = stocks.reduce((acc, s) => {
+  let stockDailyProfit = stocks.reduce((acc, s) => {
     const mv = safeNum(s.currentPrice) * safeNum(s.quantity);
     const change = safeNum(s.changePercent);
     // ⚠️ 关键点：这里必须用 (市值 * 涨幅 / (100+涨幅)) 
@@ -45,10 +47,10 @@ const AssetCards: React.FC<AssetCardsProps> = ({ stocks, funds, fixedIncome }) =
   // ==================================================================================
   // 2. 基金计算
   // ==================================================================================
-  const fundMarketValue = funds.reduce((acc, f) => acc + (safeNum(f.netValue) * safeNum(f.shares)), 0);
-  const fundTotalCost = funds.reduce((acc, f) => acc + (safeNum(f.costPrice) * safeNum(f.shares)), 0);
+  let fundMarketValue = funds.reduce((acc, f) => acc + (safeNum(f.netValue) * safeNum(f.shares)), 0);
+  let fundTotalCost = funds.reduce((acc, f) => acc + (safeNum(f.costPrice) * safeNum(f.shares)), 0);
   
-  const fundDailyProfit = funds.reduce((acc, f) => {
+  let fundDailyProfit = funds.reduce((acc, f) => {
     const mv = safeNum(f.netValue) * safeNum(f.shares);
     const change = safeNum(f.estimatedChange);
     return acc + (mv * change / 100);
@@ -57,7 +59,7 @@ const AssetCards: React.FC<AssetCardsProps> = ({ stocks, funds, fixedIncome }) =
   // ==================================================================================
   // 3. 理财计算 (核心修复：自动推导 + 显示市值)
   // ==================================================================================
-  const fixedData = fixedIncome.reduce((acc, i) => {
+  let fixedData = fixedIncome.reduce((acc, i) => {
       const principal = safeNum(i.quantity); // 本金
       const currentVal = safeNum(i.costPrice) > 0 ? safeNum(i.costPrice) : principal; // 市值
       
@@ -80,6 +82,17 @@ const AssetCards: React.FC<AssetCardsProps> = ({ stocks, funds, fixedIncome }) =
       };
   }, { mv: 0, principal: 0, daily: 0 });
 
+  // 服务端估值 (/api/portfolio/summary) 到了就用它，和日报推送的数字保持一致
+  if (summary) {
+      stockMarketValue = summary.stock.market_value;
+      stockTotalCost = summary.stock.principal;
+      stockDailyProfit = summary.stock.day_profit;
+      fundMarketValue = summary.fund.market_value;
+      fundTotalCost = summary.fund.principal;
+      fundDailyProfit = summary.fund.day_profit;
+      fixedData = { mv: summary.fixed.market_value, principal: summary.fixed.principal, daily: summary.fixed.day_profit };
+  }
+
 
   return (
     <div className="grid grid-cols-1 md:grid-cols-3 gap-6 animate-in fade-in duration-700 delay-100">
@@ -1,4 +1,4 @@
-import React, { useMemo, useEffect, useState } from 'react';
+import React, { useMemo, useEffect, useState, useRef } from 'react';
 import { 
   PieChart, Activity, Zap, BarChart3, 
   Wallet, Calendar, Filter
@@ -29,6 +29,23 @@ interface HistoryItem {
 
 type FilterType = 'ALL' | 'STOCK' | 'FUND' | 'FIXED';
 
+// 后端 /api/portfolio/summary 的估值结果 (与快照推送同一套公式)
+interface ClassSummary {
+  count: number;
+  market_value: number;
+  principal: number;
+  day_profit: number;
+  items?: { id: number; market_value: number; principal: number; day_profit: number; rate: number }[];
+}
+
+export interface PortfolioSummary {
+  date: string;
+  stock: ClassSummary;
+  fund: ClassSummary;
+  fixed: ClassSummary;
+  total: { market_value: number; principal: number; day_profit: number; cumulative_profit: number };
+}
+
 // ----------------------------------------------------------------------------
 // 2. 核心辅助函数
 // ----------------------------------------------------------------------------
@@ -37,6 +54,19 @@ const safeNum = (val: any) => {
   return isNaN(n) ? 0 : n;
 };
 
+// /api/history 按列返回 ({date: [...], total_asset: [...], ...})，这里还原成逐日记录
+const columnsToRows = (data: any): HistoryItem[] => {
+  const dates: string[] = Array.isArray(data?.date) ? data.date : [];
+  return dates.map((date, i) => ({
+    date,
+    total_asset: safeNum(data.total_asset?.[i]),
+    total_profit: safeNum(data.total_profit?.[i]),
+    stock_profit: safeNum(data.stock_profit?.[i]),
+    fund_profit: safeNum(data.fund_profit?.[i]),
+    fixed_profit: safeNum(data.fixed_profit?.[i])
+  }));
+};
+
 // 获取本地日期字符串 YYYY-MM-DD (确保和后端存的格式一致)
 const getLocalDateStr = () => {
     const now = new Date();
@@ -65,6 +95,8 @@ const Dashboard: React.FC<DashboardProps> = ({ customStocks, customFunds, fixedI
   const [historyData, setHistoryData] = useState<HistoryItem[]>([]);
   const [selectedHistory, setSelectedHistory] = useState<HistoryItem | null>(null);
   const [moversFilter, setMoversFilter] = useState<FilterType>('ALL');
+  const [summary, setSummary] = useState<PortfolioSummary | null>(null);
+  const summaryTimer = useRef<ReturnType<typeof setTimeout> | null>(null);
 
   // --------------------------------------------------------------------------
   // 4. 获取历史数据
@@ -72,15 +104,30 @@ const Dashboard: React.FC<DashboardProps> = ({ customStocks, customFunds, fixedI
   useEffect(() => {
     const token = localStorage.getItem('pacc_token');
     if (!token) return;
-    fetch('/api/history', { headers: { 'Authorization': `Bearer ${token}` } })
+    // 图表只展示最近两周，取一个月足够；后端带 ETag，重复访问由浏览器缓存走 304
+    fetch('/api/history?range=1m', { headers: { 'Authorization': `Bearer ${token}` } })
       .then(res => res.json())
       .then(data => {
-          setHistoryData(data);
+          setHistoryData(columnsToRows(data));
           // 这里先不设置 selectedHistory，等 combinedHistory 生成后再设置默认值
       })
       .catch(e => console.error("History fetch failed:", e));
   }, []);
 
+  // 服务端估值：持仓或行情变化后 1 秒内合并成一次请求
+  useEffect(() => {
+    const token = localStorage.getItem('pacc_token');
+    if (!token) return;
+    if (summaryTimer.current) clearTimeout(summaryTimer.current);
+    summaryTimer.current = setTimeout(() => {
+      fetch('/api/portfolio/summary', { headers: { 'Authorization': `Bearer ${token}` } })
+        .then(res => res.ok ? res.json() : null)
+        .then(data => { if (data) setSummary(data); })
+        .catch(e => console.error("Summary fetch failed:", e));
+    }, 1000);
+    return () => { if (summaryTimer.current) clearTimeout(summaryTimer.current); };
+  }, [customStocks, customFunds, fixedIncome]);
+
   // --------------------------------------------------------------------------
   // 5. 实时计算 (Stats) - 必须与 AssetCards 逻辑 1:1 对齐
   // --------------------------------------------------------------------------
@@ -140,13 +187,30 @@ const Dashboard: React.FC<DashboardProps> = ({ customStocks, customFunds, fixedI
     const totalDayProfit = stockDayProfit + fundDayProfit + fixedDayProfit;
     const totalCumulativeProfit = totalAssets - totalPrincipal;
 
+    // 服务端估值到了就以它为准 (和日报推送的数字一致)，本地算的只在首次加载前兜底
+    if (summary) {
+      const withServer = <T extends { id: any; dailyProfit: number; mv: number }>(items: T[], cls: ClassSummary) => {
+        const byId = new Map((cls.items || []).map(x => [String(x.id), x]));
+        return items.map(i => {
+          const s = byId.get(String(i.id));
+          return s ? { ...i, dailyProfit: s.day_profit, mv: s.market_value } : i;
+        });
+      };
+      return {
+        stock: { mv: summary.stock.market_value, profit: summary.stock.day_profit, items: withServer(sortedStocks, summary.stock) },
+        fund: { mv: summary.fund.market_value, profit: summary.fund.day_profit, items: withServer(sortedFunds, summary.fund) },
+        fixed: { mv: summary.fixed.market_value, profit: summary.fixed.day_profit, items: withServer(sortedFixed, summary.fixed) },
+        total: { asset: summary.total.market_value, dayProfit: summary.total.day_profit, cumulative: summary.total.cumulative_profit }
+      };
+    }
+
     return {
         stock: { mv: stockMv, profit: stockDayProfit, items: sortedStocks },
         fund: { mv: fundMv, profit: fundDayProfit, items: sortedFunds },
         fixed: { mv: fixedMv, profit: fixedDayProfit, items: sortedFixed },
         total: { asset: totalAssets, dayProfit: totalDayProfit, cumulative: totalCumulativeProfit }
     };
-  }, [customStocks, customFunds, fixedIncome]);
+  }, [customStocks, customFunds, fixedIncome, summary]);
 
   // --------------------------------------------------------------------------
   // 6. 核心修复：构造“虚实结合”的历史数据 (解决今天没数据的问题)
@@ -273,7 +337,7 @@ const Dashboard: React.FC<DashboardProps> = ({ customStocks, customFunds, fixedI
       </div>
 
       {/* 2. 持仓卡片 */}
-      <div><AssetCards stocks={customStocks} funds={customFunds} fixedIncome={fixedIncome} /></div>
+      <div><AssetCards stocks={customStocks} funds={customFunds} fixedIncome={fixedIncome} summary={summary} /></div>
 
       {/* 3. 底部双雄 (历史详情 + 异动榜) */}
       <div className="grid grid-cols-1 lg:grid-cols-3 gap-6">
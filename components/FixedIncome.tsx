@@ -10,9 +10,12 @@ import {
 // --- 类型定义 ---
 // 买入明细结构
 interface Transaction {
-  id: string;
+  id: string | number; // 服务端已保存的为数字 id，本地新增的为临时字符串 id
   date: string;
   amount: number;
+  value_date?: string; // 以下由服务端计息台账给出
+  days?: number;
+  accrued?: number;
 }
 
 interface FixedAsset {
@@ -31,7 +34,10 @@ interface FixedAsset {
   recordDate?: string;
   tag?: string;
   apy?: number | string;
-  extra?: string; // 🔥 核心：存储买入明细 JSON
+  extra?: string; // 新建时提交的买入明细 JSON，由后端拆成 asset_transactions
+  transactions?: Transaction[]; // 🔥 核心：服务端返回的买入明细
+  accruedInterest?: number | null; // 计息台账：累计利息
+  dayInterest?: number | null;     // 计息台账：今天入账的利息
 }
 
 interface FixedIncomeListProps {
@@ -39,6 +45,8 @@ interface FixedIncomeListProps {
   onDelete: (id: string | number) => void;
   onEdit: (asset: any) => void;
   onAdd: (asset: any) => void;
+  onAddLot: (assetId: string | number, lot: { date: string; amount: number }) => Promise<void>;
+  onDeleteLot: (assetId: string | number, lotId: string | number) => Promise<void>;
 }
 
 type SortField = 'marketValue' | 'totalProfit' | 'projectedDaily' | 'annualizedYield' | 'daysHeld' | 'dailyPer10k';
@@ -62,7 +70,7 @@ const fmt = (val: any, decimals: number = 2) => {
   });
 };
 
-const FixedIncomeList: React.FC<FixedIncomeListProps> = ({ items = [], onDelete, onEdit, onAdd }) => {
+const FixedIncomeList: React.FC<FixedIncomeListProps> = ({ items = [], onDelete, onEdit, onAdd, onAddLot, onDeleteLot }) => {
   const [isModalOpen, setIsModalOpen] = useState(false);
   const [isEditing, setIsEditing] = useState(false);
   const [searchTerm, setSearchTerm] = useState('');
@@ -82,6 +90,8 @@ const FixedIncomeList: React.FC<FixedIncomeListProps> = ({ items = [], onDelete,
   // 明细模式状态
   const [isDetailMode, setIsDetailMode] = useState(false);
   const [transactions, setTransactions] = useState<Transaction[]>([]);
+  // 打开编辑框时服务端的明细，提交时据此算出增删
+  const [originalTransactions, setOriginalTransactions] = useState<Transaction[]>([]);
 
   const [autoCalcInfo, setAutoCalcInfo] = useState({ roi: 0, apy: 0, daily: 0 });
 
@@ -99,13 +109,8 @@ const FixedIncomeList: React.FC<FixedIncomeListProps> = ({ items = [], onDelete,
       let marketVal = safeNum(rawMarketVal);
       let profit = safeNum(rawProfit);
       
-      // 解析 extra 中的明细
-      let parsedTransactions: Transaction[] = [];
-      try {
-        if (item.extra && item.extra.trim().startsWith('[')) {
-          parsedTransactions = JSON.parse(item.extra);
-        }
-      } catch (e) {}
+      // 买入明细由服务端从 asset_transactions 表返回
+      const parsedTransactions: Transaction[] = Array.isArray(item.transactions) ? item.transactions : [];
 
       // 🔥 修复Bug：天数计算精度修正
       let d = safeNum(item.daysHeld ?? item.days); 
@@ -144,7 +149,9 @@ const FixedIncomeList: React.FC<FixedIncomeListProps> = ({ items = [], onDelete,
           calcApy = (totalRoi / d) * 365;
       }
 
-      const projectedDaily = marketVal * (calcApy / 100) / 365;
+      // 有计息台账时直接用服务端当天入账的利息 (已按起息日、节假日规则逐笔算好)
+      const hasLedger = item.dayInterest !== null && item.dayInterest !== undefined;
+      const projectedDaily = hasLedger ? safeNum(item.dayInterest) : marketVal * (calcApy / 100) / 365;
       const beatsBank = calcApy > BANK_RATE;
 
       const dailyPer10k = 10000 * (calcApy / 100) / 365;
@@ -164,6 +171,8 @@ const FixedIncomeList: React.FC<FixedIncomeListProps> = ({ items = [], onDelete,
         dailyPer10k,
         projectedAnnual,
         beatsBank,
+        hasLedger,
+        accruedInterest: safeNum(item.accruedInterest),
         recordDate: item.recordDate || new Date().toISOString().split('T')[0],
         transactions: parsedTransactions // 将明细带入
       };
@@ -286,6 +295,7 @@ const FixedIncomeList: React.FC<FixedIncomeListProps> = ({ items = [], onDelete,
   const openAddModal = () => { 
     setFormData({ id: '', code: '', name: '', marketValue: '', totalProfit: '', daysHeld: '', recordDate: new Date().toISOString().split('T')[0], tag: '月月宝', apy: '', extra: '' }); 
     setTransactions([]);
+    setOriginalTransactions([]);
     setIsDetailMode(false);
     setIsEditing(false); 
     setIsModalOpen(true); 
@@ -294,14 +304,8 @@ const FixedIncomeList: React.FC<FixedIncomeListProps> = ({ items = [], onDelete,
   const openEditModal = (item: any, e: React.MouseEvent) => {
     e.stopPropagation(); // 防止触发表格展开
     
-    let txs: Transaction[] = [];
-    let detailMode = false;
-    try {
-        if (item.extra && item.extra.trim().startsWith('[')) {
-            txs = JSON.parse(item.extra);
-            if (txs.length > 0) detailMode = true;
-        }
-    } catch {}
+    const txs: Transaction[] = Array.isArray(item.transactions) ? item.transactions.map((t: Transaction) => ({ ...t })) : [];
+    const detailMode = txs.length > 0;
 
     setFormData({
       id: item.id,
@@ -316,12 +320,37 @@ const FixedIncomeList: React.FC<FixedIncomeListProps> = ({ items = [], onDelete,
       extra: item.extra || ''
     });
     setTransactions(txs);
+    setOriginalTransactions(txs);
     setIsDetailMode(detailMode);
     setIsEditing(true);
     setIsModalOpen(true);
   };
 
-  const handleSubmit = () => {
+  // 编辑时只把变动的明细逐笔提交：新增的追加，删掉的删除，改过的先删后加
+  const syncTransactions = async (assetId: string | number) => {
+    const current = isDetailMode ? transactions : [];
+    const originalById = new Map(originalTransactions.map(t => [String(t.id), t]));
+    const kept = new Set<string>();
+    const toAdd: Transaction[] = [];
+
+    current.forEach(t => {
+      const orig = typeof t.id === 'number' ? originalById.get(String(t.id)) : undefined;
+      if (orig && orig.date === t.date && safeNum(orig.amount) === safeNum(t.amount)) {
+        kept.add(String(t.id));
+      } else if (t.date && safeNum(t.amount) > 0) {
+        toAdd.push(t);
+      }
+    });
+
+    for (const t of originalTransactions) {
+      if (!kept.has(String(t.id))) await onDeleteLot(assetId, t.id);
+    }
+    for (const t of toAdd) {
+      await onAddLot(assetId, { date: t.date, amount: safeNum(t.amount) });
+    }
+  };
+
+  const handleSubmit = async () => {
     if (!formData.name || !formData.marketValue) return alert("请至少填写名称和当前市值");
     
     let marketVal = safeNum(formData.marketValue);
@@ -366,8 +395,10 @@ const FixedIncomeList: React.FC<FixedIncomeListProps> = ({ items = [], onDelete,
     }
 
     const uniqueCode = formData.code || `FIX_${Date.now()}_${Math.floor(Math.random()*1000)}`;
-    // 🔥 将明细序列化存入 extra
-    const extraData = JSON.stringify(transactions); 
+    // 新建时随资产一起提交明细，后端拆成 asset_transactions；编辑时明细走单独接口
+    const extraData = !isEditing && isDetailMode && transactions.length > 0
+      ? JSON.stringify(transactions.map(t => ({ date: t.date, amount: safeNum(t.amount) })))
+      : undefined;
 
     const assetData = {
       id: isEditing ? formData.id : undefined,
@@ -383,7 +414,16 @@ const FixedIncomeList: React.FC<FixedIncomeListProps> = ({ items = [], onDelete,
       asset_type: 'fixed'
     };
     
-    isEditing ? onEdit(assetData) : onAdd(assetData);
+    if (isEditing) {
+      try {
+        await syncTransactions(formData.id);
+      } catch (e) {
+        return alert("买入明细保存失败，请重试");
+      }
+      onEdit(assetData);
+    } else {
+      onAdd(assetData);
+    }
     setIsModalOpen(false);
   };
 
@@ -564,13 +604,13 @@ const FixedIncomeList: React.FC<FixedIncomeListProps> = ({ items = [], onDelete,
                                       <div className="text-right">资金权重占比</div>
                                   </div>
                                   {item.transactions.map((t: any, idx: number) => {
-                                      const now = new Date();
-                                      const days = Math.max(0, Math.round((now.getTime() - new Date(t.date).getTime()) / (1000 * 60 * 60 * 24)));
+                                      // 计息天数和累计利息来自服务端台账
+                                      const days = safeNum(t.days);
                                       return (
                                           <div key={idx} className="grid grid-cols-4 gap-4 text-xs font-mono py-1">
-                                              <div className="text-slate-700">{t.date}</div>
+                                              <div className="text-slate-700">{t.date}{t.value_date && t.value_date !== t.date && <span className="text-slate-400"> → {t.value_date}</span>}</div>
                                               <div className="font-bold">¥{fmt(t.amount)}</div>
-                                              <div>{days} 天</div>
+                                              <div>{days} 天{item.hasLedger && <span className="text-emerald-500 ml-1">+{fmt(t.accrued)}</span>}</div>
                                               <div className="text-right text-indigo-400">
                                                   {item.principal > 0 ? ((t.amount / item.principal) * 100).toFixed(1) : 0}%
                                               </div>
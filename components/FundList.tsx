@@ -20,6 +20,8 @@ const FundList: React.FC<FundListProps> = ({ funds, onDelete, onEdit, onAdd }) =
   const [isModalOpen, setIsModalOpen] = useState(false);
   const [isEditing, setIsEditing] = useState(false);
   const [isChecking, setIsChecking] = useState(false);
+  // 代码输入联想 (代码 / 拼音首字母 / 名称前缀)
+  const [suggestions, setSuggestions] = useState<{ code: string; name: string }[]>([]);
   const [searchTerm, setSearchTerm] = useState('');
 
   // 排序
@@ -36,6 +38,13 @@ const FundList: React.FC<FundListProps> = ({ funds, onDelete, onEdit, onAdd }) =
     const val = e.target.value;
     setFormData(prev => ({ ...prev, code: val }));
 
+    if (!isEditing && val.trim() && !/^\d{6}$/.test(val)) {
+        fetch(`/api/market/search?type=fund&limit=8&q=${encodeURIComponent(val.trim())}`)
+            .then(res => res.json())
+            .then(data => setSuggestions(data.items || []))
+            .catch(() => setSuggestions([]));
+    }
+
     if (!isEditing && val.length === 6 && /^\d+$/.test(val)) {
         setIsChecking(true);
         try {
@@ -436,7 +445,10 @@ const FundList: React.FC<FundListProps> = ({ funds, onDelete, onEdit, onAdd }) =
                    <div>
                       <label className="block text-[10px] font-black text-slate-400 uppercase tracking-widest mb-1.5 ml-1">基金代码 (Code)</label>
                       <div className="relative">
-                        <input type="text" placeholder="例如 005827" className="w-full px-4 py-3 bg-slate-50 border border-slate-200 rounded-xl font-mono text-sm focus:border-indigo-500 outline-none" value={formData.code} onChange={handleCodeChange} readOnly={isEditing} />
+                        <input type="text" placeholder="例如 005827" className="w-full px-4 py-3 bg-slate-50 border border-slate-200 rounded-xl font-mono text-sm focus:border-indigo-500 outline-none" value={formData.code} onChange={handleCodeChange} readOnly={isEditing} list="fund-code-suggestions" />
+                        <datalist id="fund-code-suggestions">
+                            {suggestions.map(s => <option key={s.code} value={s.code}>{s.name}</option>)}
+                        </datalist>
                         {isChecking && <div className="absolute right-3 top-3.5"><Loader2 size={16} className="text-purple-500 animate-spin"/></div>}
                       </div>
                    </div>
@@ -33,12 +33,21 @@ const StockList: React.FC<StockListProps> = ({ stocks, onDelete, onEdit, onAdd }
   
   // 自动检测 Loading 状态
   const [isChecking, setIsChecking] = useState(false);
+  // 代码输入联想 (代码 / 拼音首字母 / 名称前缀)
+  const [suggestions, setSuggestions] = useState<{ code: string; name: string }[]>([]);
 
   // --- 1. 核心逻辑：自动检测股票名称 ---
   const handleCodeChange = async (e: React.ChangeEvent<HTMLInputElement>) => {
     const val = e.target.value;
     setFormData(prev => ({ ...prev, code: val }));
 
+    if (!isEditing && val.trim() && !/^\d{6}$/.test(val)) {
+        fetch(`/api/market/search?type=stock&limit=8&q=${encodeURIComponent(val.trim())}`)
+            .then(res => res.json())
+            .then(data => setSuggestions(data.items || []))
+            .catch(() => setSuggestions([]));
+    }
+
     if (!isEditing && val.length === 6 && /^\d+$/.test(val)) {
         setIsChecking(true);
         try {
@@ -426,7 +435,10 @@ const StockList: React.FC<StockListProps> = ({ stocks, onDelete, onEdit, onAdd }
                  <div className="space-y-1.5">
                     <label className="text-xs font-bold text-slate-400 ml-1 uppercase">代码</label>
                     <div className="relative">
-                        <input className="w-full bg-slate-50 border border-slate-200 rounded-xl px-4 py-3 font-bold text-slate-900 outline-none focus:border-purple-500 transition-colors" placeholder="600519" value={formData.code} disabled={isEditing} onChange={handleCodeChange} />
+                        <input className="w-full bg-slate-50 border border-slate-200 rounded-xl px-4 py-3 font-bold text-slate-900 outline-none focus:border-purple-500 transition-colors" placeholder="600519" value={formData.code} disabled={isEditing} onChange={handleCodeChange} list="stock-code-suggestions" />
+                        <datalist id="stock-code-suggestions">
+                            {suggestions.map(s => <option key={s.code} value={s.code}>{s.name}</option>)}
+                        </datalist>
                         {isChecking && <div className="absolute right-3 top-3.5"><RefreshCw size={16} className="text-purple-500 animate-spin"/></div>}
                     </div>
                  </div>